@@ -10,15 +10,23 @@ import platform
 import subprocess
 import time
 import configparser
-from muse_helper import *
-from data_collection import DataCollection
+import glob
+import ntpath
+# Modules that load pygame, muselsl, sklearn or matplotlib are imported by the commands that use them.
 from password_types import PasswordTypes
 from constants import Constants
-from prediction import Prediction
+from binary_session import convert_csv_session
+from session_catalog import SessionCatalog
+from session_writer import find_orphaned_logs, recover_session
+import convert_legacy_timestamps
+import acquisition_benchmark
+import session_archive
+from synthetic_muse import SyntheticMuse
 
 class Program:
     def __init__(self):
         helpers.load_default_config()
+        self.config = helpers.get_config_store() # Parsed once, reloaded only when config.ini changes.
         parser = argparse.ArgumentParser(description='KEEGLogger is a demostration of password cracking that uses your brainwave data to infer keystrokes.',
             usage='''KEEGLogger.py <command> [<args>]
     These are the commands:
@@ -28,14 +36,26 @@ class Program:
     activatemode   Sets the active mode (i.e. password type).
     setpass        Records a new password (note: this is optional and used only for display during prediction).
     collect        Collect data for the model. You will type in passwords while your EEG data is recorded.
-    train          Train the model using all session data.    
+    train          Train the model using all new session data.    
     predict        You will enter your password and the model will predict it based soley on EEG data.
+    convert        Convert CSV session data to the binary session format.
+    archive        Compress sessions into single file archives (e.g. to free disk space or copy them between machines).
+    unarchive      Restore archived sessions to the binary (or CSV) session format.
+    migrate        Migrate legacy session files (millisecond EST timestamps) to the current format.
+    recover        Rebuild sessions that never finished (e.g. after a crash) from their write-ahead logs.
+    reindex        Rebuild the session catalog from the session data folder.
+    timing         Benchmark keystroke timestamping and report marker to EEG alignment of recorded sessions.
+    synthetic      Stream synthetic Muse EEG data over LSL (use instead of a Muse for testing).
+    benchmark      Benchmark EEG acquisition throughput, latency, memory and save time using a synthetic Muse stream.
+    view           Plot a recorded session with its key markers (zoom in to see full resolution).
 
     Upon first use just run "startfresh" and follow the step by step instructions.
 
     Password modes: 
         Mode 1:  4-digit pin number.
         Mode 2: 8 character password (case insensitive).
+        Mode 3: 12 character password (case insensitive).
+        Mode 4: 8 character password of letters and digits (case insensitive).
         ''')
 
         parser.add_argument('command', help='Command to run.')
@@ -69,13 +89,17 @@ class Program:
         if not self.validate_username(args.username):
             self.print_cannot_create_user()
             return
-        elif self.check_user_exists(args.username):
+        userExists = self.check_user_exists(args.username)
+        if userExists:
             print('User already exists, will activate if -a or --activate was provided.')
-        else: 
-            self.create_user(args.username)
+        with self.config.batch():
+            if not userExists:
+                self.create_user(args.username)
+            if not args.activate == None:
+                self.set_active_user(args.username)
+        if not userExists:
             print('User {0} created.'.format(args.username))
         if not args.activate == None:
-            self.set_active_user(args.username)
             print('Active user set to: {0}.'.format(args.username))
 
     def activateuser(self):
@@ -119,17 +143,37 @@ class Program:
     def collect(self):
         parser = argparse.ArgumentParser(description='Collect data for the model. You will type in passwords while your EEG data is recorded.')
         parser.add_argument('-mid', '--museid', type=str, required=False, help='Muse MAC Address. If ommitted, the first available device is used.')
+        parser.add_argument('-f', '--format', type=str, choices=['csv', 'binary', 'both'], default='both', required=False, help='Session file format to save.')
+        parser.add_argument('--headless', action='store_true', default=False, help='Run without a display, the passwords are typed by a script (for soak tests).')
+        parser.add_argument('--synthetic', action='store_true', default=False, help='Use a synthetic Muse stream instead of a Muse.')
+        parser.add_argument('-i', '--iterations', type=int, default=Constants.SESSION_ITERATIONS, help='Number of passwords in the session.')
+        parser.add_argument('--key-interval', type=float, default=Constants.SCRIPTED_KEY_INTERVAL, help='Seconds between scripted keys (headless only).')
+        parser.add_argument('--key-jitter', type=float, default=0.0, help='Randomize scripted key intervals by up to +/- this many seconds (headless only).')
+        parser.add_argument('--seed', type=int, help='Seed of the generated passwords (and of the scripted key intervals when headless).')
         args = parser.parse_args(sys.argv[2:])
         if args.museid:
             self.museID = args.museid
         else:
            self.museID = None
-        self.begin_collection()
+        fileFormats = Constants.SESSION_FILE_FORMATS if args.format == 'both' else (args.format,)
+        script = (args.key_interval, args.key_jitter, args.seed) if args.headless else None
+        self.begin_collection(fileFormats, args.iterations, script, args.synthetic, args.seed)
 
     def train(self):
         parser = argparse.ArgumentParser(description='Train the model using all session data.')
+        parser.add_argument('-u', '--username', type=str, help='Specific username to train the model for. Command defaults to active user.')
+        parser.add_argument('-m', '--mode', type=int, help='Password integer mode number. Command defaults to active mode.')
+        parser.add_argument('-r', '--retrain', action='store_true', default=False, required=False, help='Discard the existing model and retrain from all sessions.')
         args = parser.parse_args(sys.argv[2:])
-        #self.begin_training()
+        if not args.username == None and not self.check_user_exists(args.username):
+            print("Cannot train, user does not exist. See users below:")
+            self.print_users()
+        elif not args.mode == None and not PasswordTypes.has_value(args.mode):
+            self.print_invalid_mode()
+        else:
+            username = args.username if not args.username == None else self.get_active_user()
+            mode = PasswordTypes(args.mode) if not args.mode == None else self.get_active_mode()
+            self.begin_training(username, mode, args.retrain)
 
     def predict(self):
         parser = argparse.ArgumentParser(description='You will enter your password and the model will predict it based soley on EEG data.')
@@ -141,35 +185,210 @@ class Program:
            self.museID = None
         self.begin_prediction()
 
+    def convert(self):
+        parser = argparse.ArgumentParser(description='Convert CSV session data to the binary session format.')
+        parser.add_argument('-u', '--username', type=str, help='Only convert sessions of this user. Command defaults to all users.')
+        parser.add_argument('-o', '--overwrite', action='store_true', default=False, required=False, help='Overwrite existing binary sessions.')
+        args = parser.parse_args(sys.argv[2:])
+        username = args.username if not args.username == None else '*'
+        catalog = SessionCatalog()
+        for mrkFile in glob.iglob(os.path.join('session_data', username, '*', '*_MRK.csv')):
+            user, mode, startTime, finishTime = helpers.parse_session_name(ntpath.basename(mrkFile)[:-len('_MRK.csv')])
+            path = convert_csv_session(mrkFile, user, mode, startTime, finishTime, args.overwrite)
+            if path == None: print('Skipped (already converted): {0}'.format(mrkFile))
+            else: 
+                catalog.index_session(mrkFile[:-len('_MRK.csv')])
+                print('Converted: {0}'.format(path))
+        catalog.close()
+
+    def archive(self):
+        parser = argparse.ArgumentParser(description='Compress sessions into single file archives, converted in parallel. Archived sessions can still be loaded (and queried by time range) directly.')
+        parser.add_argument('-u', '--username', type=str, help='Only archive sessions of this user. Command defaults to all users.')
+        parser.add_argument('-r', '--remove', action='store_true', default=False, help='Remove the session files once archived.')
+        parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='Overwrite existing archives.')
+        parser.add_argument('-w', '--workers', type=int, help='Number of worker processes. Defaults to the number of CPUs.')
+        args = parser.parse_args(sys.argv[2:])
+        username = args.username if not args.username == None else '*'
+        fileBases = [fileBase for modeFolder in glob.iglob(os.path.join('session_data', username, '*'))
+                     for fileBase in helpers.find_sessions(modeFolder) if session_archive.session_source_files(fileBase)]
+        catalog = SessionCatalog()
+        sourceTotal, archiveTotal = 0, 0
+        for fileBase, result in session_archive.run_parallel(session_archive.archive_session, fileBases, (args.remove, args.overwrite), args.workers):
+            if isinstance(result, Exception):
+                print('Failed: {0} ({1})'.format(fileBase, result))
+                continue
+            path, sourceSize, archiveSize = result
+            if archiveSize == None:
+                print('Skipped (already archived): {0}'.format(path))
+                continue
+            catalog.index_session(fileBase)
+            sourceTotal, archiveTotal = sourceTotal + sourceSize, archiveTotal + archiveSize
+            print('Archived: {0} ({1:.1f} MB -> {2:.1f} MB)'.format(path, sourceSize / 2**20, archiveSize / 2**20))
+        catalog.close()
+        if archiveTotal > 0:
+            print('Archived {0:.1f} MB of session files into {1:.1f} MB.'.format(sourceTotal / 2**20, archiveTotal / 2**20))
+
+    def unarchive(self):
+        parser = argparse.ArgumentParser(description='Restore archived sessions to the binary (or CSV) session format, converted in parallel.')
+        parser.add_argument('-u', '--username', type=str, help='Only restore sessions of this user. Command defaults to all users.')
+        parser.add_argument('-f', '--format', type=str, choices=['csv', 'binary', 'both'], default='binary', required=False, help='Session file format to restore.')
+        parser.add_argument('-r', '--remove', action='store_true', default=False, help='Remove the archives once restored.')
+        parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='Overwrite existing session files.')
+        parser.add_argument('-w', '--workers', type=int, help='Number of worker processes. Defaults to the number of CPUs.')
+        args = parser.parse_args(sys.argv[2:])
+        username = args.username if not args.username == None else '*'
+        formats = Constants.SESSION_FILE_FORMATS if args.format == 'both' else (args.format,)
+        paths = glob.glob(os.path.join('session_data', username, '*', '*' + Constants.ARCHIVE_EXTENSION))
+        catalog = SessionCatalog()
+        for path, result in session_archive.run_parallel(session_archive.unarchive_session, paths, (formats, args.remove, args.overwrite), args.workers):
+            if isinstance(result, Exception):
+                print('Failed: {0} ({1})'.format(path, result))
+                continue
+            catalog.index_session(path[:-len(Constants.ARCHIVE_EXTENSION)])
+            if result: print('Restored: {0}'.format(', '.join(result)))
+            else: print('Skipped (already restored): {0}'.format(path))
+        catalog.close()
+
+    def migrate(self):
+        parser = argparse.ArgumentParser(description='Migrate legacy session files (millisecond EST timestamps) to the current format. Lists the planned changes unless --apply is given.')
+        parser.add_argument('-u', '--username', type=str, help='Only migrate sessions of this user. Command defaults to all users.')
+        parser.add_argument('-a', '--apply', action='store_true', default=False, help='Apply the migration (default is a dry run).')
+        parser.add_argument('-w', '--workers', type=int, help='Number of worker processes. Defaults to the number of CPUs.')
+        args = parser.parse_args(sys.argv[2:])
+        username = args.username if not args.username == None else '*'
+        plan = convert_legacy_timestamps.plan_migration(username=username, maxWorkers=args.workers)
+        convert_legacy_timestamps.print_plan(plan)
+        if not args.apply:
+            if plan: print('Dry run, nothing was changed. Run again with --apply to migrate.')
+            return
+        start = time.perf_counter()
+        rows = convert_legacy_timestamps.run_migration(plan, maxWorkers=args.workers)
+        print('Migrated {0} rows in {1:.1f} s.'.format(rows, time.perf_counter() - start))
+
+    def recover(self):
+        parser = argparse.ArgumentParser(description='Rebuild sessions that never finished (e.g. after a crash) from their write-ahead logs.')
+        parser.add_argument('log', nargs='?', type=str, help='Write-ahead log (".wal") to recover. Command defaults to every orphaned log in the session data folder.')
+        parser.add_argument('-f', '--format', type=str, choices=['csv', 'binary', 'both'], help='Session file format to save. Defaults to the format that was being recorded.')
+        parser.add_argument('--force', action='store_true', default=False, help='Also recover logs written to in the last minute (make sure no session is still recording).')
+        args = parser.parse_args(sys.argv[2:])
+        formats = None if args.format == None else Constants.SESSION_FILE_FORMATS if args.format == 'both' else (args.format,)
+        logs = [args.log] if not args.log == None else find_orphaned_logs(minAge=0 if args.force else Constants.SESSION_LOG_ORPHAN_AGE)
+        if not logs:
+            print('No orphaned session logs found.')
+        for log in logs:
+            print('Recovering: {0}'.format(log))
+            try:
+                files = recover_session(log, formats)
+            except Exception as e:
+                print('Failed: {0} ({1})'.format(log, e))
+                continue
+            for file in files:
+                print('Saved session data to: ' + file)
+
+    def reindex(self):
+        parser = argparse.ArgumentParser(description='Rebuild the session catalog from the session data folder.')
+        args = parser.parse_args(sys.argv[2:])
+        catalog = SessionCatalog()
+        catalog.rebuild()
+        print('Indexed {0} sessions.'.format(len(catalog.find_sessions())))
+        catalog.close()
+
+    def timing(self):
+        parser = argparse.ArgumentParser(description='Benchmark keystroke timestamping and report marker to EEG alignment of recorded sessions.')
+        parser.add_argument('-d', '--duration', type=float, default=10.0, help='Benchmark duration in seconds.')
+        parser.add_argument('-u', '--username', type=str, help='Also report the marker to EEG alignment of this user\'s sessions.')
+        args = parser.parse_args(sys.argv[2:])
+        import pygame
+        import keystroke_timing
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        for name, pollInterval in (('Input poll loop', Constants.INPUT_POLL_INTERVAL), ('Frame rate loop', 1.0 / Constants.UI_FRAME_RATE)):
+            print('Running {0} benchmark ({1:.1f} ms poll interval) for {2} seconds...'.format(name, 1000 * pollInterval, args.duration))
+            errors, rawErrors, delays = keystroke_timing.benchmark(args.duration, pollInterval)
+            print(keystroke_timing.summarize('  Marker error (midpoint estimate)', errors))
+            print(keystroke_timing.summarize('  Marker error (timestamp at dequeue)', rawErrors))
+        pygame.quit()
+        if not args.username == None:
+            dfMrk, dfEEG = helpers.load_user_data(args.username, self.get_active_mode())
+            distances, delays = keystroke_timing.session_alignment(dfMrk, dfEEG)
+            print(keystroke_timing.summarize('Marker to nearest EEG sample', distances))
+            print(keystroke_timing.summarize('Recorded queueing delay', delays))
+
+    def view(self):
+        parser = argparse.ArgumentParser(description='Plot a recorded session with its key markers. Defaults to the latest session of the active user and mode.')
+        parser.add_argument('session', nargs='?', type=str, help='Session to plot (".keeg" folder or "_MRK.csv" file).')
+        parser.add_argument('-u', '--username', type=str, help='Plot the latest session of this user. Command defaults to the active user.')
+        parser.add_argument('-m', '--mode', type=int, help='Plot the latest session of this mode. Command defaults to the active mode.')
+        parser.add_argument('-c', '--channels', type=str, nargs='+', help='Channels to plot. Defaults to all EEG channels.')
+        args = parser.parse_args(sys.argv[2:])
+        user = args.username if not args.username == None else self.get_active_user()
+        mode = PasswordTypes(args.mode) if not args.mode == None else self.get_active_mode()
+        import data_analysis
+        data_analysis.view_session(args.session, user, mode, args.channels)
+
+    def synthetic(self):
+        parser = argparse.ArgumentParser(description='Stream synthetic Muse EEG data over LSL (use instead of a Muse for testing).')
+        parser.add_argument('-r', '--rate', type=float, default=Constants.DEFAULT_SAMPLING_RATE, help='Sampling rate in Hz.')
+        parser.add_argument('-c', '--chunk', type=int, default=Constants.SYNTHETIC_CHUNK_SIZE, help='Samples per pushed chunk.')
+        parser.add_argument('-j', '--jitter', type=float, default=0.0, help='Maximum chunk push delay in seconds.')
+        parser.add_argument('-p', '--dropout', type=float, default=0.0, help='Probability of dropping a chunk.')
+        args = parser.parse_args(sys.argv[2:])
+        muse = SyntheticMuse(args.rate, args.chunk, args.jitter, args.dropout)
+        muse.start()
+        print('Streaming synthetic Muse data, press Ctrl+C to stop...')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            muse.stop()
+        print('Pushed {0} samples, dropped {1} chunks.'.format(muse.samplesPushed, muse.chunksDropped))
+
+    def benchmark(self):
+        parser = argparse.ArgumentParser(description='Benchmark EEG acquisition throughput, latency, memory and save time using a synthetic Muse stream.')
+        parser.add_argument('-d', '--durations', type=float, nargs='+', default=[10, 60, 180], help='Session durations in minutes.')
+        parser.add_argument('-s', '--speed', type=float, default=60, help='Stream time scale, e.g. 60 records an hour of data in a minute.')
+        parser.add_argument('-r', '--rate', type=float, default=Constants.DEFAULT_SAMPLING_RATE, help='Sampling rate in Hz.')
+        parser.add_argument('-c', '--chunk', type=int, default=Constants.SYNTHETIC_CHUNK_SIZE, help='Samples per pushed chunk.')
+        parser.add_argument('-j', '--jitter', type=float, default=0.0, help='Maximum chunk push delay in seconds.')
+        parser.add_argument('-p', '--dropout', type=float, default=0.0, help='Probability of dropping a chunk.')
+        parser.add_argument('-n', '--devices', type=int, default=1, help='Number of synthetic headsets recorded at once.')
+        parser.add_argument('-f', '--format', choices=['csv', 'binary', 'both'], default='both', help='Session file format(s) to write.')
+        parser.add_argument('-o', '--output', type=str, help='Append the results to this file (JSON lines) for later comparison.')
+        args = parser.parse_args(sys.argv[2:])
+        fileFormats = Constants.SESSION_FILE_FORMATS if args.format == 'both' else (args.format,)
+        acquisition_benchmark.run_suite(args.durations, args.output, samplingRate=args.rate, chunkSize=args.chunk, jitter=args.jitter,
+                                        dropout=args.dropout, speed=args.speed, formats=fileFormats, devices=args.devices)
+
     def validate_username(self, username):
         pattern = '^\w{{{0},{1}}}\Z'.format(Constants.USERNAME_MIN_LENGTH, Constants.USERNAME_MAX_LENGTH)
         passRegex = re.compile(pattern)
         return passRegex.match(username)
 
     def create_user(self, username):
-        helpers.write_config(Constants.CONFIG_USERNAME_PREFIX + username)
+        self.config.set(Constants.CONFIG_USERNAME_PREFIX + username)
 
     def check_user_exists(self, username):
-        return helpers.read_config().has_section(Constants.CONFIG_USERNAME_PREFIX + username)
+        return self.config.has_section(Constants.CONFIG_USERNAME_PREFIX + username)
 
     def get_user_list(self):
-        users = list(filter(lambda x: Constants.CONFIG_USERNAME_PREFIX in x, helpers.read_config().sections()))
+        users = list(filter(lambda x: Constants.CONFIG_USERNAME_PREFIX in x, self.config.sections()))
         return list(map(lambda x: x.replace(Constants.CONFIG_USERNAME_PREFIX,''), users))
 
     def get_active_user(self):
-        return helpers.read_config().get(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_USER)
+        return self.config.get(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_USER)
 
     def set_active_user(self, username):
-        helpers.write_config(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_USER, username)
+        self.config.set(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_USER, username)
 
     def get_active_mode(self):
-        return PasswordTypes(int(helpers.read_config().get(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_MODE)))
+        return PasswordTypes(int(self.config.get(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_MODE)))
 
     def set_active_mode(self, mode):
-        helpers.write_config(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_MODE, mode.value)
+        self.config.set(Constants.CONFIG_SECTION_GLOBAL, Constants.CONFIG_OPTION_ACTIVE_MODE, mode.value)
 
     def get_user_password(self, user, mode):
-        return helpers.read_config().get(Constants.CONFIG_USERNAME_PREFIX + user, Constants.CONFIG_OPTION_PASSWORD_PREFIX + str(mode))
+        return self.config.get(Constants.CONFIG_USERNAME_PREFIX + user, Constants.CONFIG_OPTION_PASSWORD_PREFIX + str(mode))
 
     def print_users(self):
         users = self.get_user_list()
@@ -192,7 +411,7 @@ class Program:
             print("Mode: {0} ({1})".format(mode.value, mode))
 
     def write_password(self, username, password, mode):
-        helpers.write_config(Constants.CONFIG_USERNAME_PREFIX + username, Constants.CONFIG_OPTION_PASSWORD_PREFIX + str(mode), password)
+        self.config.set(Constants.CONFIG_USERNAME_PREFIX + username, Constants.CONFIG_OPTION_PASSWORD_PREFIX + str(mode), password)
         print("Wrote password for user: {0}.".format(username))
 
     def length_msg(self, passMinLength, passMaxLength):
@@ -222,7 +441,16 @@ class Program:
             msgConfirm = 'Re-enter your 8 character password to confirm: '
             pattern = '^\w{{{0},{1}}}\Z'.format(passMinLength, passMaxLength)
             passRegex = re.compile(pattern)
-            formatError = 'Password has incorrect format. It must contain only letters and numbers and {0}.'.format(length_msg(passMinLength, passMinLength))
+            formatError = 'Password has incorrect format. It must contain only letters and numbers and {0}.'.format(self.length_msg(passMinLength, passMinLength))
+        else:
+            passMinLength = passType.length()
+            passMaxLength = passType.length()
+            characters = passType.characters()
+            msgOriginal = 'Enter a {0}: '.format(passType.description())
+            msgConfirm = 'Re-enter your {0} character password to confirm: '.format(passMaxLength)
+            pattern = '^[{0}]{{{1},{2}}}\Z'.format(re.escape(characters + characters.lower()), passMinLength, passMaxLength)
+            passRegex = re.compile(pattern)
+            formatError = 'Password has incorrect format. It must contain only the characters {0} and {1}.'.format(characters, self.length_msg(passMinLength, passMinLength))
 
         while True:
             passOriginal = getpass.getpass(msgOriginal)
@@ -262,7 +490,7 @@ class Program:
 
         print('\nStep 2:')
         helpers.print_dashes()
-        print('Enter a mode number: Enter "1" for Mode 1: cracking 4-digit pin number. Enter "2" for Mode 2: 8 character password (case insensitive).')
+        print('Enter a mode number: ' + ' '.join('Enter "{0}" for Mode {0}: {1}.'.format(mode.value, mode.description()) for mode in PasswordTypes))
         while True:
             modeNumber = input('Enter mode number: ').strip()
             if PasswordTypes.has_value(helpers.safe_cast(modeNumber, int)):
@@ -285,9 +513,10 @@ class Program:
         print('''Congratulations, you have finished your data collection session. You can now let the learning model train on your data.
 If you have done many session this process may take a bit of time.''')
         input('\nPress any key to start...')
-        # Train
+        self.begin_training(username, modeNumber)
 
     def start_stream(self):
+        from muse_helper import helper, stream
         print('\nThe system will now use muselsl to stream your EEG data.\n')
 
         backend = helper.resolve_backend('auto')
@@ -297,18 +526,35 @@ If you have done many session this process may take a bit of time.''')
     def stop_stream(self, muse):
         muse.stop()
 
-    def begin_collection(self):
+    def begin_collection(self, fileFormats = Constants.SESSION_FILE_FORMATS, iterations = Constants.SESSION_ITERATIONS, script = None, synthetic = False, seed = None):
         user = self.get_active_user()
         mode = self.get_active_mode()
-        print('''You are ready to start a data collection session {0}. 
+        if script is None:
+            print('''You are ready to start a data collection session {0}. 
 \nIn this session you will be presented with {1} automatically generated "password(s)".
-\nYour task is to simpy type each password as it is presented. If you make a mistake do not worry, just keep typing until you hit the correct key. Take  your time and remember to concentrate!'''.format(user, Constants.SESSION_ITERATIONS))        
-        muse = self.start_stream()
-        input('\nPress any key to begin...')
-        datacollection = DataCollection(user, mode, Constants.SESSION_ITERATIONS, self.museID)
+\nYour task is to simpy type each password as it is presented. If you make a mistake do not worry, just keep typing until you hit the correct key. Take  your time and remember to concentrate!'''.format(user, iterations))        
+        if synthetic:
+            muse = SyntheticMuse()
+            muse.start()
+        else:
+            muse = self.start_stream()
+        from data_collection import DataCollection
+        if script is None:
+            input('\nPress any key to begin...')
+            datacollection = DataCollection(user, mode, iterations, self.museID, fileFormats, seed=seed)
+        else:
+            print('Starting headless data collection session of {0} scripted password(s) for {1}.'.format(iterations, user))
+            datacollection = DataCollection(user, mode, iterations, self.museID, fileFormats, headless=True, seed=seed)
+            from scripted_input import ScriptedTypist
+            datacollection.typist = ScriptedTypist(datacollection.passwords, *script)
         datacollection.start()
         self.stop_stream(muse)
 
+    def begin_training(self, user, mode, retrain = False):
+        from training import train_user
+        print('Training model for user: {0}, password mode: {1}...'.format(user, mode))
+        train_user(user, mode, retrain=retrain)
+
     def begin_prediction(self):
         try:
             user, mode = self.get_active_user(), self.get_active_mode()
@@ -320,6 +566,7 @@ If you have done many session this process may take a bit of time.''')
 \nIn this session you will simply "login" by entering the password you set earlier.'''.format(user))
         muse = self.start_stream()
         input('\nPress any key to begin...')
+        from prediction import Prediction
         prediction = Prediction(user, mode, password)
         prediction.start()
         self.stop_stream(muse)
@@ -0,0 +1,96 @@
+import os
+import json
+import uuid
+import tempfile
+import numpy as np
+from time import time, sleep, perf_counter
+from synthetic_muse import SyntheticMuse
+from acquisition_manager import AcquisitionManager
+from acquisition_telemetry import process_memory
+from password_types import PasswordTypes
+from constants import Constants
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(folder) for file in files)
+
+# Records a synthetic Muse session of the given duration (minutes of stream time) from devices synthetic headsets through
+# the same acquisition path as the data collection sessions (AcquisitionManager: LSL inlet -> EEGAcquisition ->
+# EEGBuffer + SessionWriter per device) into a temporary folder.
+# speed shortens the wall clock time, e.g. a 60 minute session at speed 60 runs for one minute.
+def run_benchmark(duration, samplingRate = Constants.DEFAULT_SAMPLING_RATE, chunkSize = Constants.SYNTHETIC_CHUNK_SIZE, jitter = 0.0, dropout = 0.0,
+                  speed = 1.0, formats = Constants.SESSION_FILE_FORMATS, devices = 1):
+    sessionId = 'benchmark-' + str(uuid.uuid4())
+    muses = {}
+    for index in range(devices):
+        address = '{0}-{1}'.format(sessionId, index)
+        muses['Muse' + address] = SyntheticMuse(samplingRate, chunkSize, jitter, dropout, speed, address, seed=index)
+    latencies = []
+
+    def on_chunk(device, samples, timestamps):
+        latencies.append((muses[device.sourceId].stream_time() - timestamps[-1]) / speed)
+
+    with tempfile.TemporaryDirectory() as rootFolder:
+        manager = AcquisitionManager('benchmark', PasswordTypes.PIN_FIXED_4, time(), sessionId, fileFormats=formats, rootFolder=rootFolder, onChunk=on_chunk)
+        deadline = perf_counter() + 10
+        while len(manager.devices) < devices and perf_counter() < deadline:
+            manager.resolve(1.0)
+        if len(manager.devices) < devices:
+            raise RuntimeError('Found {0} of {1} synthetic Muse streams.'.format(len(manager.devices), devices))
+        for muse in muses.values():
+            muse.start()
+        start = perf_counter()
+        end = start + duration * 60 / speed
+        memory = []
+        while perf_counter() < end:
+            sleep(min(1.0, max(end - perf_counter(), 0)))
+            memory.append(process_memory())
+        for muse in muses.values():
+            muse.stop()
+        samplesPushed = sum(muse.samplesPushed for muse in muses.values())
+        received = lambda: sum(device.acquisition.sampleCount for device in manager.devices.values())
+        drainDeadline = perf_counter() + 5
+        while received() < samplesPushed and perf_counter() < drainDeadline:
+            sleep(0.01)
+        manager.stop()
+        samplesReceived = received()
+        telemetry = [device.telemetry for device in manager.devices.values()]
+        elapsed = max([end] + [t.lastChunkTime for t in telemetry if t.lastChunkTime is not None]) - start
+        saveStart = perf_counter()
+        manager.close(time())
+        saveTime = perf_counter() - saveStart
+        diskSize = folder_size(rootFolder)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    # Memory growth between the end of the first tenth of the session and its end, ignores start up allocations.
+    warm = memory[len(memory) // 10] if memory else 0
+    return {
+        'duration': duration, 'devices': devices, 'samplingRate': samplingRate, 'chunkSize': chunkSize, 'jitter': jitter, 'dropout': dropout,
+        'speed': speed, 'formats': list(formats), 'samplesPushed': samplesPushed, 'samplesReceived': samplesReceived,
+        'chunksDropped': sum(muse.chunksDropped for muse in muses.values()), 'droppedDetected': sum(t.droppedSamples for t in telemetry),
+        'throughput': samplesReceived / elapsed,
+        'latencyP50': float(np.percentile(latencies, 50)), 'latencyP95': float(np.percentile(latencies, 95)), 'latencyMax': float(latencies.max()),
+        'memoryGrowth': (memory[-1] - warm) if memory else 0, 'peakMemory': max(memory) if memory else 0, 'saveTime': saveTime, 'diskSize': diskSize,
+        'writerQueueMax': max(t.queueDepths.max for t in telemetry)
+    }
+
+RESULT_FORMAT = '{0:>8.1f} {12:>4} {1:>6.0f} {2:>10.0f} {3:>8.2f} {4:>8} {5:>8.2f} {6:>8.2f} {7:>8.2f} {8:>9.2f} {9:>9.2f} {10:>7.3f} {11:>9.1f}'
+RESULT_HEADER = '{0:>8} {12:>4} {1:>6} {2:>10} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8} {8:>9} {9:>9} {10:>7} {11:>9}'.format(
+    'min', 'speed', 'samples/s', 'recv %', 'dropped', 'p50 ms', 'p95 ms', 'max ms', 'grow MB', 'mem MB', 'save s', 'disk MB', 'devs')
+
+def format_result(result):
+    return RESULT_FORMAT.format(result['duration'], result['speed'], result['throughput'], 100.0 * result['samplesReceived'] / max(result['samplesPushed'], 1),
+                                result['droppedDetected'], 1000 * result['latencyP50'], 1000 * result['latencyP95'], 1000 * result['latencyMax'],
+                                result['memoryGrowth'] / 2**20, result['peakMemory'] / 2**20, result['saveTime'], result['diskSize'] / 2**20, result['devices'])
+
+# Runs one benchmark per duration and prints a comparable table, results are appended to outputFile (JSON lines) if given.
+def run_suite(durations, outputFile = None, **kwargs):
+    print(RESULT_HEADER)
+    results = []
+    for duration in durations:
+        result = run_benchmark(duration, **kwargs)
+        result['time'] = time()
+        print(format_result(result))
+        results.append(result)
+        if outputFile is not None:
+            with open(outputFile, 'a') as file:
+                file.write(json.dumps(result) + '\n')
+    return results
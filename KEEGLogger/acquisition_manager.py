@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+from pylsl import StreamInlet, resolve_byprop, LostError, TimeoutError as LSLTimeoutError
+import helpers
+from eeg_buffer import EEGBuffer
+from eeg_acquisition import EEGAcquisition
+from clock_sync import ClockSync
+from acquisition_telemetry import AcquisitionTelemetry
+from session_writer import SessionWriter
+from constants import Constants
+
+# One EEG stream of a session with its own buffer, clock sync, telemetry and (when recording) session writer.
+# The device keeps its buffer and writer across reconnects, connect() replaces the inlet and acquisition thread.
+class EEGDevice:
+    def __init__(self, name, info, user, mode, startTime, record = True, fileFormats = Constants.SESSION_FILE_FORMATS,
+                 rootFolder = 'session_data', folder = None, index = True, onChunk = None):
+        self.name = name
+        self.sourceId = info.source_id()
+        self.samplingRate = info.nominal_srate() or Constants.DEFAULT_SAMPLING_RATE
+        self.channelNames = helpers.get_channel_names(info)
+        self.buffer = EEGBuffer(info.channel_count(), maxLength=int(self.samplingRate * Constants.EEG_BUFFER_SECONDS))
+        self.telemetry = AcquisitionTelemetry(info.nominal_srate(), user + ' ' + name)
+        self.writer = None
+        if record:
+            self.writer = SessionWriter(user, mode, self.channelNames, startTime, rootFolder, fileFormats, folder=folder, index=index)
+        self.onChunk = onChunk
+        self.inlet = None
+        self.clockSync = None
+        self.acquisition = None
+
+    def connect(self, inlet):
+        self.stop()
+        self.inlet = inlet
+        inlet.open_stream(Constants.EEG_OPEN_STREAM_TIMEOUT) # Subscribe before returning so no samples are missed at the session start.
+        self.clockSync = ClockSync(inlet, inlet.time_correction(Constants.EEG_OPEN_STREAM_TIMEOUT))
+        self.acquisition = EEGAcquisition(inlet, self.buffer, self.on_chunk, self.clockSync)
+        self.acquisition.start()
+        self.clockSync.start()
+
+    def lost(self):
+        return self.acquisition is None or self.acquisition.lost
+
+    # Called from the device's acquisition thread for every pulled chunk.
+    def on_chunk(self, samples, timestamps):
+        self.telemetry.record_chunk(timestamps)
+        if self.writer is not None:
+            self.telemetry.record_queue_depth(self.writer.queue_depth())
+            self.writer.write_eeg(samples, timestamps)
+        if self.onChunk is not None:
+            self.onChunk(self, samples, timestamps)
+
+    def stop(self):
+        if self.acquisition is not None:
+            self.acquisition.stop()
+            self.clockSync.stop()
+
+    def close(self, finishTime):
+        self.stop()
+        if self.writer is None:
+            return []
+        if self.clockSync is not None:
+            self.writer.metadata['clockSync'] = self.clockSync.model()
+        self.writer.metadata['device'] = {'name': self.name, 'sourceId': self.sourceId}
+        self.writer.metadata['telemetry'] = self.telemetry.summary()
+        return self.writer.close(finishTime)
+
+# Acquires every EEG stream matching museID (all EEG streams when None) at once, e.g. several headsets in one lab or a
+# Muse plus other LSL sensors, each device on its own acquisition / clock sync / writer threads.
+# The first device found is the primary one: its session files are the regular session files (used for training) and
+# its clock is the one the key markers are matched to. Other devices record the same session, markers included, into
+# "<user>/<mode>/devices/<device>/". Each device file keeps the clock domain of its stream (see the clockSync metadata).
+class AcquisitionManager:
+    def __init__(self, user, mode, startTime, museID = None, record = True, fileFormats = Constants.SESSION_FILE_FORMATS,
+                 rootFolder = 'session_data', onChunk = None):
+        self.user = user
+        self.mode = mode
+        self.startTime = startTime
+        self.museID = museID
+        self.record = record
+        self.fileFormats = fileFormats
+        self.rootFolder = rootFolder
+        self.onChunk = onChunk
+        self.lock = threading.Lock()
+        self.devices = {} # Stream source id -> EEGDevice, in the order found.
+        self.primary = None
+
+    def matches(self, stream):
+        return self.museID is None or self.museID in stream.name() or self.museID in stream.source_id()
+
+    @staticmethod
+    def stream_key(stream):
+        return stream.source_id() or '{0}@{1}'.format(stream.name(), stream.hostname())
+
+    # Connects new matching streams and reconnects lost devices. Returns True when the primary device is acquiring.
+    def resolve(self, timeout):
+        streams = [stream for stream in resolve_byprop('type', 'EEG', timeout=timeout) if self.matches(stream)]
+        with self.lock:
+            for stream in streams:
+                key = self.stream_key(stream)
+                device = self.devices.get(key)
+                if device is not None and not device.lost():
+                    continue
+                # Any stream can go away again between resolving and connecting (pylsl raises its own TimeoutError /
+                # LostError), skip it so the other streams still connect, it is retried on the next resolve.
+                try:
+                    inlet = StreamInlet(stream)
+                    if device is None:
+                        device = self.add_device(key, inlet.info(Constants.EEG_OPEN_STREAM_TIMEOUT))
+                    device.connect(inlet)
+                except (LSLTimeoutError, LostError) as e:
+                    print('Could not connect to EEG stream {0}: {1}'.format(key, e))
+
+            return self.running()
+
+    def add_device(self, key, info):
+        name = re.sub(r'[^\w\-]+', '-', key).strip('-')
+        folder = None if self.primary is None else os.path.join(self.rootFolder, self.user, self.mode.name, 'devices', name)
+        device = EEGDevice(name, info, self.user, self.mode, self.startTime, self.record, self.fileFormats, self.rootFolder,
+                           folder, index=self.primary is None, onChunk=self.onChunk)
+        self.devices[key] = device
+        if self.primary is None:
+            self.primary = device
+        return device
+
+    def running(self):
+        return self.primary is not None and not self.primary.lost()
+
+    def write_marker(self, timestamp, marker, queueDelay = 0.0):
+        for device in list(self.devices.values()):
+            if device.writer is not None:
+                device.writer.write_marker(timestamp, marker, queueDelay)
+
+    def record_frame(self, duration):
+        for device in list(self.devices.values()):
+            device.telemetry.record_frame(duration)
+
+    def stop(self):
+        for device in list(self.devices.values()):
+            device.stop()
+
+    # Stops all devices and finishes their session files, returns the list of saved files.
+    def close(self, finishTime):
+        files = []
+        for device in list(self.devices.values()):
+            files.extend(device.close(finishTime))
+        return files
+
+    def report(self):
+        return ['{0}: {1}'.format(device.name, device.telemetry.report()) for device in list(self.devices.values())]
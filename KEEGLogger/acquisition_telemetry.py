@@ -0,0 +1,176 @@
+import threading
+import numpy as np
+from time import perf_counter, process_time
+from pylsl import StreamInfo, StreamOutlet
+from constants import Constants
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Resident memory of this process. Without psutil falls back to the peak resident size (Unix only), 0 if unavailable.
+def process_memory():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+# Fixed bin histogram, recording a value is a searchsorted and an increment.
+class Histogram:
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[np.searchsorted(self.edges, value, side='right')] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Upper bin edge below which the given fraction of the values fall.
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), fraction * self.count))
+        return min(float(self.edges[index]), self.max) if index < len(self.edges) else self.max
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.mean(), 'p50': self.percentile(0.5), 'p95': self.percentile(0.95), 'max': self.max,
+                'edges': self.edges.tolist(), 'counts': self.counts.tolist()}
+
+# Counters and histograms describing acquisition health during a session: effective sample rate, chunk sizes,
+# inter-chunk gaps, sample drops (timestamp gaps longer than the nominal sample period), frame loop duration and
+# session writer queue depth. Chunks are recorded from the acquisition thread, frames from the session loop.
+# When publish is set the current values are pushed on a small LSL metrics stream every TELEMETRY_PUBLISH_INTERVAL
+# seconds, summary() is saved with the session so degraded (e.g. Bluetooth) sessions can be spotted afterwards.
+class AcquisitionTelemetry:
+    METRICS = ['sample rate', 'mean chunk size', 'max chunk gap ms', 'dropped samples', 'max frame ms', 'writer queue depth']
+
+    def __init__(self, nominalRate, streamName = 'KEEGLogger', publish = True, publishInterval = Constants.TELEMETRY_PUBLISH_INTERVAL):
+        self.nominalRate = nominalRate or Constants.DEFAULT_SAMPLING_RATE
+        self.lock = threading.Lock()
+        self.chunkSizes = Histogram([1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 128, 256, 512])
+        self.chunkGaps = Histogram([0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0])
+        self.frameDurations = Histogram([0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.2, 0.5])
+        self.queueDepths = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.sampleCount = 0
+        self.droppedSamples = 0
+        self.dropEvents = 0
+        self.firstChunkTime = None
+        self.lastChunkTime = None
+        self.lastTimestamp = None
+        self.publishInterval = publishInterval
+        self.nextPublishTime = perf_counter() + publishInterval
+        self.window = self.empty_window()
+        self.outlet = None
+        if publish:
+            info = StreamInfo(streamName + ' Acquisition Metrics', 'Metrics', len(self.METRICS), 1.0 / publishInterval, 'float32', streamName + '_metrics')
+            channels = info.desc().append_child('channels')
+            for metric in self.METRICS:
+                channels.append_child('channel').append_child_value('label', metric)
+            self.outlet = StreamOutlet(info)
+
+    def empty_window(self):
+        return {'start': perf_counter(), 'samples': 0, 'chunks': 0, 'maxGap': 0.0, 'dropped': 0, 'maxFrame': 0.0, 'queueDepth': 0}
+
+    def record_chunk(self, timestamps):
+        now = perf_counter()
+        count = len(timestamps)
+        # Sample timestamps more than 1.5 sample periods apart mean samples were lost between them.
+        period = 1.0 / self.nominalRate
+        steps = np.diff(timestamps) if self.lastTimestamp is None else np.diff(timestamps, prepend=self.lastTimestamp)
+        gaps = steps[steps > 1.5 * period]
+        dropped = int(np.rint(gaps / period).sum()) - len(gaps)
+        with self.lock:
+            if self.lastChunkTime is not None:
+                gap = now - self.lastChunkTime
+                self.chunkGaps.record(gap)
+                self.window['maxGap'] = max(self.window['maxGap'], gap)
+            else:
+                self.firstChunkTime = now
+            self.lastChunkTime = now
+            self.lastTimestamp = timestamps[-1]
+            self.chunkSizes.record(count)
+            self.sampleCount += count
+            self.droppedSamples += dropped
+            self.dropEvents += len(gaps)
+            self.window['samples'] += count
+            self.window['chunks'] += 1
+            self.window['dropped'] += dropped
+        self.publish_due(now)
+
+    def record_frame(self, duration):
+        with self.lock:
+            self.frameDurations.record(duration)
+            self.window['maxFrame'] = max(self.window['maxFrame'], duration)
+
+    def record_queue_depth(self, depth):
+        with self.lock:
+            self.queueDepths.record(depth)
+            self.window['queueDepth'] = max(self.window['queueDepth'], depth)
+
+    def effective_rate(self):
+        if self.firstChunkTime is None or self.lastChunkTime == self.firstChunkTime:
+            return 0.0
+        return self.sampleCount / (self.lastChunkTime - self.firstChunkTime)
+
+    def publish_due(self, now):
+        if self.outlet is None or now < self.nextPublishTime:
+            return
+        with self.lock:
+            window, self.window = self.window, self.empty_window()
+        self.nextPublishTime = now + self.publishInterval
+        elapsed = now - window['start']
+        self.outlet.push_sample([window['samples'] / elapsed, window['samples'] / max(window['chunks'], 1), 1000 * window['maxGap'],
+                                 window['dropped'], 1000 * window['maxFrame'], window['queueDepth']])
+
+    def summary(self):
+        with self.lock:
+            return {'nominalRate': self.nominalRate, 'effectiveRate': self.effective_rate(), 'sampleCount': self.sampleCount,
+                    'droppedSamples': self.droppedSamples, 'dropEvents': self.dropEvents, 'chunkSizes': self.chunkSizes.summary(),
+                    'chunkGaps': self.chunkGaps.summary(), 'frameDurations': self.frameDurations.summary(), 'writerQueueDepth': self.queueDepths.summary()}
+
+    def report(self):
+        summary = self.summary()
+        return 'EEG {0:.1f} Hz (nominal {1:.0f}) | {2} samples, {3} dropped in {4} gaps | chunk gap p95 {5:.0f} ms, max {6:.0f} ms | frame p95 {7:.0f} ms | writer queue max {8:.0f}'.format(
+            summary['effectiveRate'], summary['nominalRate'], summary['sampleCount'], summary['droppedSamples'], summary['dropEvents'],
+            1000 * summary['chunkGaps']['p95'], 1000 * summary['chunkGaps']['max'], 1000 * summary['frameDurations']['p95'], summary['writerQueueDepth']['max'])
+
+# Samples process CPU time and memory every interval seconds, e.g. to measure steady state usage in long headless runs.
+# Steady state figures ignore the first quarter of the run (start up, imports, buffers growing to their maximum size).
+class ResourceMonitor:
+    def __init__(self, interval = Constants.RESOURCE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = [] # Each item is [wall time, process CPU time, memory].
+        self.nextSampleTime = 0
+
+    def sample(self):
+        now = perf_counter()
+        if now < self.nextSampleTime:
+            return False
+        self.nextSampleTime = now + self.interval
+        self.samples.append([now, process_time(), process_memory()])
+        return True
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return {'duration': 0.0, 'cpuPercent': 0.0, 'memory': self.samples[-1][2] if self.samples else 0, 'memoryGrowthPerHour': 0.0}
+        samples = np.array(self.samples, dtype=np.float64)
+        steady = samples[len(samples) // 4:] if len(samples) >= 8 else samples
+        elapsed = steady[-1, 0] - steady[0, 0]
+        return {'duration': samples[-1, 0] - samples[0, 0], 'cpuPercent': 100 * (steady[-1, 1] - steady[0, 1]) / elapsed,
+                'memory': samples[-1, 2], 'memoryGrowthPerHour': 3600 * (steady[-1, 2] - steady[0, 2]) / elapsed}
+
+    def report(self):
+        summary = self.summary()
+        return 'Resources after {0:.0f} s | steady state CPU {1:.1f} % | memory {2:.1f} MB, growth {3:.2f} MB/hour'.format(
+            summary['duration'], summary['cpuPercent'], summary['memory'] / 2**20, summary['memoryGrowthPerHour'] / 2**20)
@@ -0,0 +1,122 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from constants import Constants
+
+# Binary session layout, a "<user>_<mode>_<start>_<finish>.keeg" folder containing:
+#   header.json          - channel labels, user, mode, start/finish times, dtypes and row counts.
+#   eeg_timestamp.bin    - float64 EEG timestamps.
+#   eeg_samples.bin      - float32 EEG channel matrix (row per sample).
+#   mrk_timestamp.bin    - float64 marker timestamps.
+#   mrk_marker.bin       - fixed width unicode key markers.
+#   mrk_delay.bin        - float32 estimated queueing delay of each marker (NaN when unknown), since version 2.
+HEADER_FILE = 'header.json'
+EEG_TIMESTAMP_FILE = 'eeg_timestamp.bin'
+EEG_SAMPLES_FILE = 'eeg_samples.bin'
+MRK_TIMESTAMP_FILE = 'mrk_timestamp.bin'
+MRK_MARKER_FILE = 'mrk_marker.bin'
+MRK_DELAY_FILE = 'mrk_delay.bin'
+TIMESTAMP_DTYPE = '<f8'
+SAMPLES_DTYPE = '<f4'
+MARKER_DTYPE = '<U8'
+DELAY_DTYPE = '<f4'
+FORMAT_VERSION = 2
+
+def make_header(user, mode, channelNames, startTime, finishTime = None):
+    return {
+        'version': FORMAT_VERSION,
+        'user': user,
+        'mode': mode.name,
+        'channels': list(channelNames),
+        'startTime': startTime,
+        'finishTime': finishTime,
+        'eeg': {'timestampDtype': TIMESTAMP_DTYPE, 'samplesDtype': SAMPLES_DTYPE, 'count': 0},
+        'markers': {'timestampDtype': TIMESTAMP_DTYPE, 'markerDtype': MARKER_DTYPE, 'delayDtype': DELAY_DTYPE, 'count': 0}
+    }
+
+# Appends columns to a session folder as data arrives, the header is written on close.
+class BinarySessionWriter:
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        os.makedirs(path, exist_ok=True)
+        self.eegTimestampFile = open(os.path.join(path, EEG_TIMESTAMP_FILE), 'wb')
+        self.eegSamplesFile = open(os.path.join(path, EEG_SAMPLES_FILE), 'wb')
+        self.mrkTimestampFile = open(os.path.join(path, MRK_TIMESTAMP_FILE), 'wb')
+        self.mrkMarkerFile = open(os.path.join(path, MRK_MARKER_FILE), 'wb')
+        self.mrkDelayFile = open(os.path.join(path, MRK_DELAY_FILE), 'wb')
+
+    def write_eeg(self, samples, timestamps):
+        self.eegTimestampFile.write(np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE).tobytes())
+        self.eegSamplesFile.write(np.ascontiguousarray(samples, dtype=SAMPLES_DTYPE).tobytes())
+        self.header['eeg']['count'] += len(timestamps)
+
+    def write_markers(self, timestamps, markers, delays = None):
+        if delays is None:
+            delays = np.full(len(timestamps), np.nan)
+        self.mrkTimestampFile.write(np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE).tobytes())
+        self.mrkMarkerFile.write(np.asarray(markers, dtype=MARKER_DTYPE).tobytes())
+        self.mrkDelayFile.write(np.ascontiguousarray(delays, dtype=DELAY_DTYPE).tobytes())
+        self.header['markers']['count'] += len(timestamps)
+
+    def flush(self):
+        for file in (self.eegTimestampFile, self.eegSamplesFile, self.mrkTimestampFile, self.mrkMarkerFile, self.mrkDelayFile):
+            file.flush()
+
+    def close(self, finishTime = None):
+        for file in (self.eegTimestampFile, self.eegSamplesFile, self.mrkTimestampFile, self.mrkMarkerFile, self.mrkDelayFile):
+            file.close()
+        if finishTime is not None:
+            self.header['finishTime'] = finishTime
+        with open(os.path.join(self.path, HEADER_FILE), 'w') as headerFile:
+            json.dump(self.header, headerFile, indent=2)
+
+def write_binary_session(path, header, eegSamples, eegTimestamps, mrkTimestamps, mrkMarkers, mrkDelays = None):
+    writer = BinarySessionWriter(path, header)
+    writer.write_eeg(eegSamples, eegTimestamps)
+    writer.write_markers(mrkTimestamps, mrkMarkers, mrkDelays)
+    writer.close()
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE)) as headerFile:
+        return json.load(headerFile)
+
+def open_column(path, dtype, shape):
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+# Opens a binary session without reading it, returns the header and read-only memory mapped columns.
+def open_binary_session(path):
+    header = read_header(path)
+    eegCount, mrkCount = header['eeg']['count'], header['markers']['count']
+    channelCount = len(header['channels'])
+    return {
+        'header': header,
+        'eegTimestamps': open_column(os.path.join(path, EEG_TIMESTAMP_FILE), header['eeg']['timestampDtype'], (eegCount,)),
+        'eegSamples': open_column(os.path.join(path, EEG_SAMPLES_FILE), header['eeg']['samplesDtype'], (eegCount, channelCount)),
+        'mrkTimestamps': open_column(os.path.join(path, MRK_TIMESTAMP_FILE), header['markers']['timestampDtype'], (mrkCount,)),
+        'mrkMarkers': open_column(os.path.join(path, MRK_MARKER_FILE), header['markers']['markerDtype'], (mrkCount,)),
+        'mrkDelays': open_delay_column(path, header, mrkCount)
+    }
+
+# Version 1 sessions have no marker delays, those read as unknown (NaN).
+def open_delay_column(path, header, count):
+    if not os.path.exists(os.path.join(path, MRK_DELAY_FILE)):
+        return np.full(count, np.nan, dtype=DELAY_DTYPE)
+    return open_column(os.path.join(path, MRK_DELAY_FILE), header['markers'].get('delayDtype', DELAY_DTYPE), (count,))
+
+# Converts one "<base>_EEG.csv" / "<base>_MRK.csv" session pair into "<base>.keeg".
+def convert_csv_session(mrkFile, user, mode, startDateTime, finishDateTime, overwrite = False):
+    fileBase = mrkFile[:-len('_MRK.csv')]
+    path = fileBase + Constants.BINARY_SESSION_EXTENSION
+    if os.path.exists(path) and not overwrite:
+        return None
+    dfEEG = pd.read_csv(fileBase + '_EEG.csv', float_precision='round_trip')
+    dfMrk = pd.read_csv(mrkFile, float_precision='round_trip', dtype={'key marker': str}).dropna(subset=['timestamp', 'key marker'])
+    header = make_header(user, mode, dfEEG.columns[1:], startDateTime.timestamp(), finishDateTime.timestamp())
+    mrkDelays = dfMrk['queue delay'].to_numpy() if 'queue delay' in dfMrk.columns else None
+    write_binary_session(path, header, dfEEG.iloc[:, 1:].to_numpy(dtype=np.float32), dfEEG['timestamp'].to_numpy(),
+                         dfMrk['timestamp'].to_numpy(), dfMrk['key marker'].to_numpy(dtype=str), mrkDelays)
+    return path
@@ -0,0 +1,90 @@
+import threading
+import numpy as np
+from time import time
+from pylsl import local_clock
+from constants import Constants
+
+# Tracks the clock offset between the EEG streamer host and this machine by sampling inlet.time_correction()
+# periodically in the background, and fits a drift model (offset + slope * (t - t0)) over the recent samples.
+# apply() corrects whole timestamp arrays at once. For streams stamped with pylsl.local_clock() the full model applies,
+# for wall clock stamped streams (muselsl) only the drift since the start of the session is removed, since the LSL
+# offset says nothing about the offset between the two hosts' wall clocks. The domain is picked from the first chunk.
+class ClockSync:
+    def __init__(self, inlet, initialCorrection = None, interval = Constants.CLOCK_SYNC_INTERVAL, window = Constants.CLOCK_SYNC_WINDOW):
+        self.inlet = inlet
+        self.interval = interval
+        self.window = window
+        self.lock = threading.Lock()
+        self.times = []
+        self.corrections = []
+        self.t0 = local_clock()
+        self.offset = 0.0
+        self.slope = 0.0
+        self.startOffset = None
+        self.wallClock = None
+        if initialCorrection is not None:
+            self.add_sample(local_clock(), initialCorrection)
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='ClockSync', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            try:
+                correction = self.inlet.time_correction(timeout=self.interval)
+            except Exception:
+                continue
+            self.add_sample(local_clock(), correction)
+
+    def add_sample(self, time, correction):
+        with self.lock:
+            self.times.append(time)
+            self.corrections.append(correction)
+            self.fit()
+
+    def fit(self):
+        times = np.asarray(self.times) - self.t0
+        corrections = np.asarray(self.corrections)
+        recent = times >= times[-1] - self.window
+        times, corrections = times[recent], corrections[recent]
+        if len(times) >= 2 and np.ptp(times) > 0:
+            self.slope, self.offset = np.polyfit(times, corrections, 1)
+        else:
+            self.slope, self.offset = 0.0, float(corrections.mean())
+        if self.startOffset is None:
+            self.startOffset = self.offset
+
+    # Correction (seconds to add) for each timestamp, evaluated on the local clock axis.
+    def correction(self, timestamps, driftOnly = False):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        with self.lock:
+            if self.startOffset is None:
+                return np.zeros_like(timestamps)
+            offset, slope = self.offset, self.slope
+            base = self.startOffset if driftOnly else 0.0
+        if driftOnly:
+            # Wall clock stamps cannot be placed on the local clock axis, use the current time for the whole chunk.
+            elapsed = local_clock() - self.t0
+            return np.full_like(timestamps, offset + slope * elapsed - base)
+        return offset + slope * (timestamps + offset - self.t0)
+
+    def apply(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) == 0:
+            return timestamps
+        if self.wallClock is None:
+            self.wallClock = bool(abs(timestamps[0] - time()) < abs(timestamps[0] - local_clock()))
+        return timestamps + self.correction(timestamps, self.wallClock)
+
+    def model(self):
+        with self.lock:
+            return {'offset': self.offset, 'slope': self.slope, 't0': self.t0, 'startOffset': self.startOffset, 'wallClock': self.wallClock,
+                    'samples': [[time, correction] for time, correction in zip(self.times, self.corrections)]}
@@ -10,3 +10,47 @@ class Constants(object):
     USERNAME_MAX_LENGTH = 10
     SESSION_ITERATIONS = 50  
     SESSION_FILE_DATETIME_FORMAT = '%Y-%m-%d-%H-%M-%S'
+    DEFAULT_SAMPLING_RATE = 256
+    EEG_BUFFER_SECONDS = 30
+    SESSION_WRITER_BATCH_SIZE = 2560
+    SESSION_WRITER_FLUSH_INTERVAL = 1.0
+    SESSION_WRITER_QUEUE_SIZE = 1024
+    SESSION_FILE_FORMATS = ('csv', 'binary')
+    BINARY_SESSION_EXTENSION = '.keeg'
+    SESSION_CATALOG_FILE_NAME = 'catalog.sqlite'
+    EPOCH_PRE_SECONDS = 0.5
+    EPOCH_POST_SECONDS = 0.5
+    EEG_BANDS = (('delta', 1, 4), ('theta', 4, 8), ('alpha', 8, 13), ('beta', 13, 30), ('gamma', 30, 45))
+    FEATURE_CACHE_FOLDER = 'feature_cache'
+    FEATURE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+    TRAINING_EPOCHS = 5
+    MODEL_FILE_NAME = 'model.pkl'
+    MODEL_METADATA_FILE_NAME = 'model.json'
+    INFERENCE_POLL_INTERVAL = 0.002
+    INFERENCE_WAIT_TIMEOUT = 1.0
+    INFERENCE_LATENCY_TARGET = 0.05
+    UI_FRAME_RATE = 30
+    INPUT_POLL_INTERVAL = 0.002
+    EEG_PULL_TIMEOUT = 0.1
+    EEG_PULL_MAX_SAMPLES = 360
+    MUSE_PUSH_REPORT_INTERVAL = 10
+    CLOCK_SYNC_INTERVAL = 5.0
+    CLOCK_SYNC_WINDOW = 600.0
+    TELEMETRY_PUBLISH_INTERVAL = 1.0
+    SYNTHETIC_CHUNK_SIZE = 12
+    EEG_OPEN_STREAM_TIMEOUT = 5.0
+    RESOURCE_SAMPLE_INTERVAL = 60.0
+    SCRIPTED_KEY_INTERVAL = 0.3
+    MIGRATION_MANIFEST_FILE_NAME = 'migrations.json'
+    MIGRATION_CHUNK_SIZE = 100000
+    PYRAMID_FACTOR = 4
+    VIEWER_MAX_POINTS = 4000
+    VIEWER_MAX_MARKER_LABELS = 100
+    ARCHIVE_EXTENSION = '.keega'
+    ARCHIVE_BLOCK_SIZE = 1024 # EEG samples per independently compressed archive block (4 s at 256 Hz).
+    ARCHIVE_COMPRESSION_LEVEL = 6
+    QUERY_BLOCK_SIZE = 256 # EEG rows per block of the binary / CSV session indexes used by session queries.
+    QUERY_WINDOW_MARGIN = 0.1 # Seconds read beyond each marker window, so epochs still get their full sample count.
+    SESSION_LOG_EXTENSION = '.wal'
+    SESSION_LOG_FSYNC_INTERVAL = 1.0 # Seconds of data a crash can lose at most.
+    SESSION_LOG_ORPHAN_AGE = 60.0
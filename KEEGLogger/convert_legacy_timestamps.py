@@ -1,33 +1,154 @@
+import os
 import glob
+import json
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from binary_session import read_header, EEG_TIMESTAMP_FILE, TIMESTAMP_DTYPE
+from constants import Constants
 
-# EEG timestamps are in Unix epoch millisecond format and incorrectly use EST timezone, but we need to normalize to GMT.
+# Legacy EEG timestamps are in Unix epoch millisecond format and incorrectly use EST timezone, but we need to normalize to
+# GMT seconds. Legacy marker files have an extra empty line which is removed.
+# The migration plans first (dry run), then rewrites the files in parallel. Every file is written to a temp file which
+# replaces the original once complete, so an interrupted run leaves each file either untouched or fully migrated. Every
+# migrated file is recorded in the manifest with its size / mtime after migration, so reruns never shift a file twice,
+# while a file changed since (e.g. a legacy file restored from a backup) is checked again.
 
+MIGRATION_NAME = 'est-ms-to-gmt-sec'
 est_to_gmt_shift = 3600*1000*4 # 3600 seconds in an hour, 1000 ms in a second, and we shift 4 hours to get from EST to GMT
+legacy_ms_threshold = 1e11 # Epoch seconds are ~1.5e9, epoch milliseconds ~1.5e12.
 
-def shift_timezone(timestamp, shift = est_to_gmt_shift):
-    return timestamp + shift
+def shift_timezone(timestamps, shift = est_to_gmt_shift):
+    return timestamps + shift
 
-def ms_to_sec(timestamp):
-    return timestamp / 1000.
+def ms_to_sec(timestamps):
+    return timestamps / 1000.
 
-#for filename in glob.iglob('session_data/**/*_EEG.csv', recursive=True):
-#     print('Fixing timestamps (ms -> s) converting: ' + filename)
+def manifest_path(rootFolder):
+    return os.path.join(rootFolder, Constants.MIGRATION_MANIFEST_FILE_NAME)
 
-#     df = pd.read_csv(filename, float_precision='round_trip')
-#     df['timestamp'] = df['timestamp'].apply(ms_to_sec, 1)
-#     df.to_csv(filename, index=False)
+def load_manifest(rootFolder):
+    try:
+        with open(manifest_path(rootFolder)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
 
-#for filename in glob.iglob('session_data/**/*_EEG.csv', recursive=True):
-#     print('fixing timestamps converting: ' + filename)
+def save_manifest(rootFolder, manifest):
+    tempPath = manifest_path(rootFolder) + '.tmp'
+    with open(tempPath, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tempPath, manifest_path(rootFolder))
 
-#     df = pd.read_csv(filename, float_precision='round_trip')
-#     df['timestamp'] = df['timestamp'].apply(shift_timezone, 1)
-#     df.to_csv(filename, index=False)
+def file_state(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, EEG_TIMESTAMP_FILE)
+    stat = os.stat(path)
+    return {'migration': MIGRATION_NAME, 'size': stat.st_size, 'mtime': stat.st_mtime}
 
-#for filename in glob.iglob('session_data/**/*_MRK.csv', recursive=True):
-#     print('Remove extra line: ' + filename)
-#     df = pd.read_csv(filename, float_precision='round_trip')
-#     df.to_csv(filename, index=False)
+# True when the manifest records the file as migrated and it has not changed since.
+def is_migrated(path, recorded):
+    if recorded is None or recorded.get('migration') != MIGRATION_NAME:
+        return False
+    try:
+        state = file_state(path)
+    except FileNotFoundError:
+        return False
+    return state['size'] == recorded.get('size') and state['mtime'] == recorded.get('mtime')
 
-c = input('Press any key to exit...')
\ No newline at end of file
+def first_timestamp(path):
+    if path.endswith(Constants.BINARY_SESSION_EXTENSION):
+        if read_header(path)['eeg']['count'] == 0:
+            return None
+        return float(np.fromfile(os.path.join(path, EEG_TIMESTAMP_FILE), dtype=TIMESTAMP_DTYPE, count=1)[0])
+    first = pd.read_csv(path, usecols=['timestamp'], nrows=1, float_precision='round_trip')
+    return float(first['timestamp'].iloc[0]) if len(first) > 0 else None
+
+def has_blank_lines(path):
+    with open(path, 'rb') as file:
+        content = file.read()
+    return b'\n\n' in content.replace(b'\r\n', b'\n')
+
+# Returns the migration action for a session file, or None when it needs nothing.
+def plan_file(path):
+    if path.endswith('_MRK.csv'):
+        return 'remove empty lines' if has_blank_lines(path) else None
+    timestamp = first_timestamp(path)
+    if timestamp is not None and timestamp > legacy_ms_threshold:
+        return 'timestamps ms EST -> s GMT'
+    return None
+
+# Lists [path, action, size] of every session file under rootFolder that still needs migrating.
+def plan_migration(rootFolder = 'session_data', username = '*', maxWorkers = None):
+    manifest = load_manifest(rootFolder)
+    paths = []
+    for pattern in ('*_EEG.csv', '*_MRK.csv', '*' + Constants.BINARY_SESSION_EXTENSION):
+        for path in glob.iglob(os.path.join(rootFolder, username, '*', pattern)):
+            if is_migrated(path, manifest.get(os.path.relpath(path, rootFolder))):
+                continue
+            paths.append(path)
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        actions = list(executor.map(plan_file, paths, chunksize=16))
+    return [[path, action, os.path.getsize(path) if os.path.isfile(path) else 0] for path, action in zip(paths, actions) if action is not None]
+
+# Streams the CSV through in chunks to a temp file which replaces the original once complete.
+def migrate_csv(path, chunkSize = Constants.MIGRATION_CHUNK_SIZE):
+    tempPath = path + '.migrating'
+    rows = 0
+    with open(tempPath, 'w', newline='') as out:
+        for index, chunk in enumerate(pd.read_csv(path, chunksize=chunkSize, float_precision='round_trip', dtype={'key marker': str})):
+            if path.endswith('_EEG.csv'):
+                chunk['timestamp'] = ms_to_sec(shift_timezone(chunk['timestamp'].to_numpy()))
+            chunk.to_csv(out, index=False, header=index == 0)
+            rows += len(chunk)
+    os.replace(tempPath, path)
+    return rows
+
+# Converts the EEG timestamp column of a binary session chunk by chunk through a memory map into a temp column, which
+# replaces the original once complete.
+def migrate_binary(path, chunkSize = Constants.MIGRATION_CHUNK_SIZE):
+    columnPath = os.path.join(path, EEG_TIMESTAMP_FILE)
+    tempPath = columnPath + '.migrating'
+    timestamps = np.memmap(columnPath, dtype=TIMESTAMP_DTYPE, mode='r')
+    rows = len(timestamps)
+    with open(tempPath, 'wb') as out:
+        for start in range(0, rows, chunkSize):
+            out.write(np.ascontiguousarray(ms_to_sec(shift_timezone(timestamps[start:start + chunkSize])), dtype=TIMESTAMP_DTYPE).tobytes())
+    del timestamps
+    os.replace(tempPath, columnPath)
+    return rows
+
+def migrate_file(path):
+    start = perf_counter()
+    rows = migrate_binary(path) if path.endswith(Constants.BINARY_SESSION_EXTENSION) else migrate_csv(path)
+    return path, rows, perf_counter() - start
+
+# Migrates the planned files on a process pool, the manifest is updated as each file completes so an interrupted run
+# can simply be restarted.
+def run_migration(plan, rootFolder = 'session_data', maxWorkers = None):
+    manifest = load_manifest(rootFolder)
+    totalRows = 0
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = [executor.submit(migrate_file, path) for path, action, size in plan]
+        for future in as_completed(futures):
+            path, rows, seconds = future.result()
+            manifest[os.path.relpath(path, rootFolder)] = file_state(path)
+            save_manifest(rootFolder, manifest)
+            totalRows += rows
+            print('Migrated: {0} ({1} rows, {2:.2f} s)'.format(path, rows, seconds))
+    return totalRows
+
+def print_plan(plan):
+    for path, action, size in plan:
+        print('{0}: {1}'.format(path, action))
+    print('{0} file(s) to migrate, {1:.1f} MB.'.format(len(plan), sum(size for path, action, size in plan) / 2**20))
+
+if __name__ == '__main__':
+    plan = plan_migration()
+    print_plan(plan)
+    if plan and input('Type "yes" to apply the migration: ').strip().lower() == 'yes':
+        start = perf_counter()
+        rows = run_migration(plan)
+        print('Migrated {0} rows in {1:.1f} s.'.format(rows, perf_counter() - start))
+    c = input('Press any key to exit...')
@@ -1,9 +1,130 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from time import perf_counter
+import helpers
+from session_catalog import SessionCatalog
+from constants import Constants
 
-df = pd.DataFrame.from_csv("session data/jeb/PIN_FIXED_4/jeb_PIN_FIXED_4_2017-10-05-18꞉41꞉27_2017-10-05-18꞉44꞉34_EEG.csv")
+# Multi-resolution min/max decimation of a session's EEG channels. Level k holds, per block of PYRAMID_FACTOR^k samples,
+# the block's start time and the min / max of every channel, built once from the level below so the whole pyramid
+# costs about one pass over the data. Any time range is then answered from the finest level that fits in maxPoints.
+class DecimationPyramid:
+    def __init__(self, timestamps, samples, factor = Constants.PYRAMID_FACTOR, maxPoints = Constants.VIEWER_MAX_POINTS):
+        self.timestamps = np.asarray(timestamps)
+        self.samples = samples
+        self.factor = factor
+        self.levels = [] # Each item is (times, mins, maxs).
+        times, mins, maxs = self.timestamps, samples, samples
+        while len(times) > maxPoints // 2:
+            starts = np.arange(0, len(times), factor)
+            times = times[starts]
+            mins = np.minimum.reduceat(mins, starts, axis=0)
+            maxs = np.maximum.reduceat(maxs, starts, axis=0)
+            self.levels.append((times, mins, maxs))
 
-matplotlib.style.use('ggplot')
+    # Returns (times, mins, maxs) covering [startTime, endTime] with at most maxPoints values per channel (mins / maxs
+    # count as two). For raw samples mins and maxs are the same array.
+    def query(self, startTime, endTime, maxPoints = Constants.VIEWER_MAX_POINTS):
+        start, end = np.searchsorted(self.timestamps, [startTime, endTime])
+        start, end = max(start - 1, 0), min(end + 1, len(self.timestamps))
+        if end - start <= maxPoints:
+            samples = np.asarray(self.samples[start:end])
+            return self.timestamps[start:end], samples, samples
+        for times, mins, maxs in self.levels:
+            start, end = np.searchsorted(times, [startTime, endTime])
+            start, end = max(start - 1, 0), min(end + 1, len(times))
+            if 2 * (end - start) <= maxPoints:
+                break
+        return times[start:end], mins[start:end], maxs[start:end]
 
-df.plot()
\ No newline at end of file
+# Interleaves mins and maxs into one line per channel that draws each block as a vertical stroke.
+def envelope(times, mins, maxs):
+    if mins is maxs:
+        return times, mins
+    values = np.empty((2 * len(mins),) + mins.shape[1:], dtype=mins.dtype)
+    values[0::2], values[1::2] = mins, maxs
+    return np.repeat(times, 2), values
+
+# Interactive session viewer: one plot per channel with the key markers overlaid. Sessions are read through
+# helpers.load_session (binary sessions are memory mapped), zooming and panning redraw from the decimation pyramid.
+class SessionViewer:
+    def __init__(self, filePath, channels = None, maxPoints = Constants.VIEWER_MAX_POINTS):
+        start = perf_counter()
+        dfMrk, dfEEG = helpers.load_session(filePath, channels)
+        self.channels = list(dfEEG.columns[1:])
+        timestamps = dfEEG['timestamp'].to_numpy()
+        self.origin = timestamps[0] if len(timestamps) > 0 else 0.0
+        self.maxPoints = maxPoints
+        self.pyramid = DecimationPyramid(timestamps - self.origin, dfEEG[self.channels].to_numpy(), maxPoints=maxPoints)
+        self.markerTimes = dfMrk['timestamp'].to_numpy() - self.origin
+        self.markerKeys = dfMrk['key marker'].astype(str).to_numpy()
+        self.loadTime = perf_counter() - start
+        self.figure, self.axes = plt.subplots(len(self.channels), 1, sharex=True, squeeze=False, figsize=(14, 2 * len(self.channels)))
+        self.axes = self.axes[:, 0]
+        if self.figure.canvas.manager is not None:
+            self.figure.canvas.manager.set_window_title(filePath)
+        self.lines = []
+        self.markerLines = []
+        for axis, channel in zip(self.axes, self.channels):
+            self.lines.append(axis.plot([], [], linewidth=0.6)[0])
+            self.markerLines.append(axis.plot([], [], transform=axis.get_xaxis_transform(), color='tab:red', linewidth=0.6, alpha=0.6)[0])
+            axis.set_ylabel(channel)
+        self.markerLabels = []
+        self.axes[-1].set_xlabel('Seconds since session start')
+        self.axes[0].callbacks.connect('xlim_changed', self.on_xlim_changed)
+        end = timestamps[-1] - self.origin if len(timestamps) > 0 else 1.0
+        self.axes[0].set_xlim(0, end) # Draws through on_xlim_changed.
+
+    def on_xlim_changed(self, axis):
+        self.update(*axis.get_xlim())
+
+    def update(self, startTime, endTime):
+        times, mins, maxs = self.pyramid.query(startTime, endTime, self.maxPoints)
+        times, values = envelope(times, mins, maxs)
+        for index, line in enumerate(self.lines):
+            line.set_data(times, values[:, index])
+            axis = self.axes[index]
+            if len(values) > 0:
+                low, high = values[:, index].min(), values[:, index].max()
+                margin = 0.05 * (high - low) or 1.0
+                axis.set_ylim(low - margin, high + margin)
+        # Markers in view as one NaN separated line, at most one per maxPoints-th of the view since closer ones overlap.
+        first, last = np.searchsorted(self.markerTimes, [startTime, endTime])
+        markerTimes = self.markerTimes[first:last]
+        if len(markerTimes) > self.maxPoints:
+            bins = ((markerTimes - startTime) * (self.maxPoints / (endTime - startTime))).astype(np.int64)
+            markerTimes = markerTimes[np.unique(bins, return_index=True)[1]]
+        markerX = np.repeat(markerTimes, 3)
+        markerY = np.tile([0.0, 1.0, np.nan], len(markerTimes))
+        for line in self.markerLines:
+            line.set_data(markerX, markerY)
+        # Key labels only when few enough markers are in view to read them.
+        for label in self.markerLabels:
+            label.remove()
+        self.markerLabels = []
+        if last - first <= Constants.VIEWER_MAX_MARKER_LABELS:
+            axis = self.axes[0]
+            self.markerLabels = [axis.text(time, 1.02, key, transform=axis.get_xaxis_transform(), ha='center', fontsize=8, color='tab:red')
+                                 for time, key in zip(self.markerTimes[first:last], self.markerKeys[first:last])]
+        self.figure.canvas.draw_idle()
+
+    def show(self):
+        plt.show()
+
+# Opens the given session file (".keeg" folder, ".keega" archive or "_MRK.csv"), or the latest session of a user / mode from the catalog.
+def view_session(filePath = None, user = None, mode = None, channels = None):
+    if filePath is None:
+        catalog = SessionCatalog()
+        sessions = catalog.find_sessions(user, mode)
+        catalog.close()
+        if not sessions:
+            print('No sessions found for user: {0}, mode: {1}.'.format(user, mode))
+            return
+        session = max(sessions, key=lambda session: session['startTime'])
+        filePath = helpers.session_file(session)
+    viewer = SessionViewer(filePath, channels)
+    print('Opened {0} ({1} samples, {2} markers) in {3:.2f} s.'.format(filePath, len(viewer.pyramid.timestamps), len(viewer.markerTimes), viewer.loadTime))
+    viewer.show()
+
+if __name__ == '__main__':
+    view_session()
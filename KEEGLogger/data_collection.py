@@ -1,9 +1,7 @@
 import pygame
-import random
-import math
 from password_types import PasswordTypes
 from textbox import TextBox
-from time import time, strftime, gmtime, sleep, mktime
+from time import time, strftime, gmtime, sleep, mktime, perf_counter
 import datetime
 import uuid
 import asyncio
@@ -14,6 +12,11 @@ import os
 from pylsl import StreamInfo, StreamOutlet, LostError
 from enum import Enum
 from pylsl import StreamInlet, resolve_byprop
+from acquisition_manager import AcquisitionManager
+from password_generator import generate_passwords
+from acquisition_telemetry import ResourceMonitor
+from ui_renderer import UIRenderer
+from keystroke_timing import KeystrokeTimer
 from constants import Constants
 
 class DataCollectionState(Enum):
@@ -22,16 +25,27 @@ class DataCollectionState(Enum):
     FINISHED = 2
 
 class DataCollection:
-    def __init__(self, user, mode, iterations, museID = None):
+    def __init__(self, user, mode, iterations, museID = None, fileFormats = Constants.SESSION_FILE_FORMATS, headless = False, typist = None, seed = None):
         self.user = user
         self.museID = museID
+        self.fileFormats = fileFormats
+        # Headless runs (soak tests) draw to pygame's dummy video driver and get their keys from a ScriptedTypist.
+        self.headless = headless
+        self.typist = typist
+        self.resources = ResourceMonitor() if headless else None
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
         pygame.init()
         self.width = 600
         self.height = 600
         pygame.display.set_caption(user + ' Data Collection Session')
         self.screen = pygame.display.set_mode((self.width, self.height))
+        self.renderer = UIRenderer(self.screen)
+        self.drawnState = None # Session state of the last drawn frame, the window is fully redrawn when it changes.
+        self.keystrokeTimer = KeystrokeTimer() # Timestamps key events on the same clock as the EEG samples.
         self.totalIterations = iterations
-        self.passwords = self.generate_passwords(mode, iterations)
+        self.passwords = generate_passwords(mode, iterations, seed)
         self.mode = mode
         self.currentPassIndex = 0
         self.currentCharIndex = 0
@@ -44,12 +58,11 @@ class DataCollection:
         self.gameRunning = False
         self.state = DataCollectionState.MUSE_DISCONNECTED # 0 = Muse Disconnected, 1 = Session Running, 2 = Finished 
         self.setup_marker_streaming()
-        self.markers = [[]] # Each item is array of 2 items - timestamp + the key which was pressed.
-        self.eegData = [[]] # Each item is array of timestamp + data for each channel.
-        self.get_eeg_stream(0.5)
         self.startTime = time() # Timestamp of experiment start.
         self.finishTime = 0 # Timestamp of experiment finish.
-        self.lastEEGSampleTime = self.startTime
+        # Acquires and records every matching EEG stream, each on its own threads independent of the frame loop.
+        self.acquisition = AcquisitionManager(user, mode, self.startTime, museID, fileFormats=fileFormats, onChunk=self.on_eeg_chunk)
+        self.get_eeg_stream(0.5)
 
     def setup_marker_streaming(self):
         streamName = self.user + ' Training Session Markers'
@@ -57,103 +70,38 @@ class DataCollection:
         self.markerOutlet = StreamOutlet(self.markerInfo)
 
     def get_eeg_stream(self, timeout):
-        eeg_inlet_streams : StreamInlet = resolve_byprop('type', 'EEG', timeout=timeout)
-        for stream in eeg_inlet_streams:
-            if self.museID == None or not stream.name().find(self.museID) == -1:
-                self.eegInlet = StreamInlet(stream)
-                self.eegTimeCorrection = self.eegInlet.time_correction()
-                self.state = DataCollectionState.RUNNING
+        # resolve() is only True once the primary device is acquiring, RUNNING is published after. A session closed while
+        # resolving stays finished.
+        if self.acquisition.resolve(timeout) and self.state == DataCollectionState.MUSE_DISCONNECTED:
+            self.state = DataCollectionState.RUNNING
         self.doneCheckEEG = True
 
-    def push_marker(self, timestamp, currentChar):
+    def push_marker(self, timestamp, currentChar, queueDelay = 0.0):
         self.markerOutlet.push_sample(currentChar, timestamp) # Push key marker with timestamp via LSL for other programs.
-        self.markers.append([timestamp, currentChar])
-
-    def pull_eeg_data(self, timeout = 0.0, max_samples = 360):
-        samples, timestamps = self.eegInlet.pull_chunk(timeout, max_samples) # Pull samples.
-        timestampCount = len(timestamps)
-        if(timestampCount > 0):
-            print('Number of samples: {0} | Time since last: {1}'.format(timestampCount, time() - self.lastEEGSampleTime))
-            self.lastEEGSampleTime = time()
-            for i in range(0, len(timestamps)):
-                self.eegData.append([timestamps[i]] + samples[i])
-
-    def save_data(self):
-        info = self.eegInlet.info()
-        desc = info.desc()
-        chanNum = info.channel_count()
-
-        channels = desc.child('channels').first_child()
-        channelNames = [channels.child_value('label')]
-        for i in range(1, chanNum):
-            channels = channels.next_sibling()
-            channelNames.append(channels.child_value('label'))
-                
-        startTime = datetime.datetime.fromtimestamp(self.startTime).strftime(Constants.SESSION_FILE_DATETIME_FORMAT)
-        finishTime = datetime.datetime.fromtimestamp(self.finishTime).strftime(Constants.SESSION_FILE_DATETIME_FORMAT)
+        self.acquisition.write_marker(timestamp, currentChar, queueDelay)
 
-        # Save EEG Data
-        fileBase = os.path.join('session_data', self.user, self.mode.name, self.user + '_' + self.mode.name + '_' + startTime + '_' + finishTime)
-        file = fileBase + '_EEG.csv'
-        helpers.ensure_dir(file)
-        with open(file, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',',
-                                    quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(['timestamp'] + channelNames)
-            for data in self.eegData:
-                writer.writerow(data)
-        print('Saved EEG data to: ' + file)
+    def stop_acquisition(self):
+        self.acquisition.stop()
 
-        # Save Marker Data
-        file = os.path.join('session_data', self.user, self.mode.name, self.user + '_' + self.mode.name + '_' + startTime + '_' + finishTime).replace(':','\ua789')
-        file = fileBase + '_MRK.csv'
-        helpers.ensure_dir(file)
-        with open(file, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',',
-                                    quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(['timestamp','key marker'])
-            for data in self.markers:
-                writer.writerow(data)
-        print('Saved Marker data to: ' + file)
+    # Called from the acquisition threads for every pulled chunk.
+    def on_eeg_chunk(self, device, samples, timestamps):
+        if device is self.acquisition.primary:
+            self.keystrokeTimer.clock.match_eeg(timestamps[0])
 
-    def generate_passwords(self, mode, iterations):
-        passwords = [''] * iterations
-        if mode == PasswordTypes.PIN_FIXED_4:
-            length = 4
-            poolInit = '0123456789'
-        elif mode == PasswordTypes.MIXED_FIXED_8:
-            length = 8
-            poolInit = 'abcdefghijklmnopqrstuvwxyz'
-
-        pool = poolInit
-
-        # Calculate number of each character required for even distribution.
-        freq = math.floor(iterations * length / len(pool))
-        poolTrack = [freq] * len(pool) # Keeps track of how many of each letter has been  used.
-
-        for i in range(iterations):
-            for j in range(length):
-                if len(poolTrack) != 0:
-                    index = random.randint(0, len(poolTrack) - 1)
-                    char = pool[index]
-                    poolTrack[index] -= 1
-                    if poolTrack[index] == 0:
-                        poolTrack.pop(index)
-                        pool = pool.replace(char,'')
-                # Once we've used the minimum required "freq" of each character, we simply do a random choice from the initial pool.
-                else: char = random.choice(poolInit) 
-                passwords[i] += char.upper()
-        return passwords
+    def save_data(self):
+        if self.resources is not None and self.acquisition.primary is not None and self.acquisition.primary.writer is not None:
+            self.acquisition.primary.writer.metadata['resources'] = self.resources.summary()
+        for line in self.acquisition.report():
+            print(line)
+        for file in self.acquisition.close(self.finishTime):
+            print('Saved session data to: ' + file)
 
     def draw_static_ui(self):
-        fontPassEnt = pygame.font.Font(None, 40)
         passEnt = 'Passwords Entered: '
-        passEntS = fontPassEnt.render(passEnt, 1, (0,0,0))
         iter = str(self.currentPassIndex) + ' / ' + str(self.totalIterations)
-        iterS = fontPassEnt.render(iter, 1, (0,0,0))
-        iterOffsetX = fontPassEnt.size(iter)[0] + 10
-        self.screen.blit(passEntS, (self.width - iterOffsetX - fontPassEnt.size(passEnt)[0] - 10, 10))
-        self.screen.blit(iterS, (self.width - iterOffsetX, 10))
+        iterOffsetX = self.renderer.text_size(iter, 40)[0] + 10
+        self.renderer.draw_text('passEnt', passEnt, 40, (self.width - iterOffsetX - self.renderer.text_size(passEnt, 40)[0] - 10, 10))
+        self.renderer.draw_text('iter', iter, 40, (self.width - iterOffsetX, 10))
 
         if self.state == DataCollectionState.RUNNING:
             instruct = 'Type the password below, press ENTER when done:'
@@ -162,13 +110,11 @@ class DataCollection:
         else:
             instruct = 'Finished session. This window will close in a moment.'
         
-        fontInstruct = pygame.font.Font(None, 24)
-        instructS = fontInstruct.render(instruct, 1, (0,0,0))
-        instructSize = fontInstruct.size(instruct)
-        self.screen.blit(instructS, (self.width/2 - instructSize[0]/2, self.height/4 - instructSize[1]/2))
+        instructSize = self.renderer.text_size(instruct, 24)
+        self.renderer.draw_text('instruct', instruct, 24, (self.width/2 - instructSize[0]/2, self.height/4 - instructSize[1]/2))
 
     def process_input(self):
-        for event in pygame.event.get():
+        for event, timestamp, queueDelay in self.keystrokeTimer.pump():
             if self.state == DataCollectionState.RUNNING:
                 currentPass = self.passwords[self.currentPassIndex]
                 currentChar = currentPass[self.currentCharIndex]
@@ -176,7 +122,7 @@ class DataCollection:
                     if (event.key == ord(currentChar) or event.key == ord(currentChar.lower())) and not self.donePass:
                         newEvent = pygame.event.Event(pygame.KEYDOWN, {'unicode': currentChar.upper(),'key': ord(currentChar.upper()), 'mod': None})
                         self.input.get_event(newEvent)
-                        self.push_marker(float(time()), currentChar)
+                        self.push_marker(timestamp, currentChar, queueDelay)
                         if self.currentCharIndex < len(currentPass) - 1:
                             self.currentCharIndex += 1
                         else: self.donePass = True
@@ -187,8 +133,19 @@ class DataCollection:
                             self.state = DataCollectionState.FINISHED
                         self.input.get_event(event)
                         self.donePass = False
-            if event.type == pygame.QUIT: 
-                pygame.quit()
+            if event.type == pygame.QUIT:
+                self.quit()
+                return # The session files are closed, later events of this batch must not write markers.
+
+    # Closing the window ends the session early, what was recorded so far is saved as a (shorter) session.
+    def quit(self):
+        self.state = DataCollectionState.FINISHED
+        if self.finishTime == 0:
+            print('Session closed after {0} / {1} password(s), saving the recorded data.'.format(self.currentPassIndex, self.totalIterations))
+            self.finishTime = time()
+            self.stop_acquisition()
+            self.save_data()
+        self.gameRunning = False
           
     def process_logic(self):
         if self.state == DataCollectionState.MUSE_DISCONNECTED:
@@ -196,35 +153,51 @@ class DataCollection:
                 self.doneCheckEEG = False
                 threading.Thread(target = self.get_eeg_stream,  kwargs={'timeout' : 5}).start()
         elif self.state == DataCollectionState.RUNNING:
-            self.pull_eeg_data()
+            if not self.acquisition.running():
+                self.state = DataCollectionState.MUSE_DISCONNECTED
         elif self.state == DataCollectionState.FINISHED:
             if self.finishTime == 0:
                 self.finishTime = time()
+                self.stop_acquisition()
                 self.save_data()
             if time() - self.finishTime >= 3:
                 self.gameRunning = False
         self.input.update()
 
     def draw_password(self):
-        font = pygame.font.Font(None, 50)
         password = self.passwords[self.currentPassIndex]
-        passwordS = font.render(password, 1, (0,0,0))
-        passwordSize = font.size(password)
-        self.screen.blit(passwordS, (self.inputPosition[0], self.height/2 - passwordSize[1]/2 - self.inputSize[1]))
+        passwordSize = self.renderer.text_size(password, 50)
+        self.renderer.draw_text('password', password, 50, (self.inputPosition[0], self.height/2 - passwordSize[1]/2 - self.inputSize[1]))
 
     def draw(self):
-        self.screen.fill((255,255,255))
+        if self.state != self.drawnState:
+            self.renderer.full_redraw()
+            self.input.changed = True
+            self.drawnState = self.state
         self.draw_static_ui()
         if self.state == DataCollectionState.RUNNING:
             self.draw_password()
-            self.input.draw(self.screen)
-        pygame.display.flip()
+            if self.input.changed:
+                self.renderer.mark_dirty(self.input.draw(self.screen))
+        self.renderer.present()
     
     def start(self):
         self.gameRunning = True
         while self.gameRunning:
+            frameStart = perf_counter()
+            if self.typist is not None:
+                if self.state == DataCollectionState.RUNNING:
+                    self.typist.pump(frameStart)
+                else:
+                    self.typist.pause()
+            if self.resources is not None and self.resources.sample():
+                print(self.resources.report())
             self.process_input()
             self.process_logic()
-            self.draw()
+            if self.renderer.frame_due():
+                self.draw()
+            self.acquisition.record_frame(perf_counter() - frameStart)
+            sleep(Constants.INPUT_POLL_INTERVAL)
+        self.stop_acquisition()
         pygame.quit()
 
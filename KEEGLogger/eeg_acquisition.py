@@ -0,0 +1,70 @@
+import threading
+import numpy as np
+from pylsl import LostError
+from constants import Constants
+
+# Drains an LSL inlet on its own thread so acquisition never waits on the pygame frame loop.
+# Each chunk is appended to the EEGBuffer under a short lock and handed to the optional onChunk callback
+# (called from the acquisition thread). Readers take copies through latest() / window().
+# With a ClockSync the timestamps of each chunk are drift corrected before they are buffered or written.
+class EEGAcquisition:
+    def __init__(self, inlet, buffer, onChunk = None, clockSync = None, timeout = Constants.EEG_PULL_TIMEOUT, maxSamples = Constants.EEG_PULL_MAX_SAMPLES):
+        self.inlet = inlet
+        self.buffer = buffer
+        self.onChunk = onChunk
+        self.clockSync = clockSync
+        self.timeout = timeout
+        self.maxSamples = maxSamples
+        self.lock = threading.Lock()
+        self.running = False
+        self.lost = False # Set when the LSL stream is lost, the owner should resolve a new stream.
+        self.sampleCount = 0
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='EEGAcquisition', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and not self.thread.ident == threading.get_ident():
+            self.thread.join()
+
+    def run(self):
+        while self.running:
+            try:
+                # pull_chunk with a timeout keeps collecting samples until the timeout, which delays every chunk. Block for
+                # the first sample only and then take whatever else is already available.
+                sample, timestamp = self.inlet.pull_sample(self.timeout)
+                if timestamp is None:
+                    continue
+                samples, timestamps = self.inlet.pull_chunk(0.0, self.maxSamples - 1)
+                samples, timestamps = [sample] + samples, [timestamp] + timestamps
+            except LostError:
+                self.lost = True
+                self.running = False
+                break
+            samples = np.asarray(samples, dtype=np.float32)
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            if self.clockSync is not None:
+                timestamps = self.clockSync.apply(timestamps)
+            with self.lock:
+                self.buffer.append_chunk(samples, timestamps)
+                self.sampleCount += len(timestamps)
+            if self.onChunk is not None:
+                self.onChunk(samples, timestamps)
+
+    def latest_timestamp(self):
+        with self.lock:
+            return self.buffer.last_timestamp()
+
+    def latest(self, count):
+        with self.lock:
+            samples, timestamps = self.buffer.latest(count)
+            return samples.copy(), timestamps.copy()
+
+    def window(self, startTime, endTime):
+        with self.lock:
+            samples, timestamps = self.buffer.window(startTime, endTime)
+            return samples.copy(), timestamps.copy()
@@ -0,0 +1,78 @@
+import numpy as np
+
+# Growable sample store backed by preallocated NumPy arrays (float64 timestamps + float32 channel matrix).
+# Views returned by the accessors are zero-copy, but are only valid until the buffer next grows or discards old samples.
+# If maxLength is given only the latest maxLength samples are kept, so memory stays flat for long sessions.
+class EEGBuffer:
+    def __init__(self, channelCount, initialCapacity = 256 * 60, maxLength = None):
+        self.channelCount = channelCount
+        self.maxLength = maxLength
+        if maxLength is not None:
+            initialCapacity = 2 * maxLength
+        self.timestamps = np.empty(initialCapacity, dtype=np.float64)
+        self.samples = np.empty((initialCapacity, channelCount), dtype=np.float32)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def capacity(self):
+        return len(self.timestamps)
+
+    def ensure_capacity(self, capacity):
+        if capacity <= self.capacity():
+            return
+        if self.maxLength is not None:
+            self.discard_oldest(capacity - self.capacity())
+            return
+        newCapacity = max(capacity, self.capacity() * 2)
+        timestamps = np.empty(newCapacity, dtype=np.float64)
+        samples = np.empty((newCapacity, self.channelCount), dtype=np.float32)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        samples[:self.size] = self.samples[:self.size]
+        self.timestamps = timestamps
+        self.samples = samples
+
+    # Shifts the newest samples to the front, the shift is amortized since capacity is twice maxLength.
+    def discard_oldest(self, count):
+        keep = max(0, min(self.size - count, self.maxLength))
+        self.timestamps[:keep] = self.timestamps[self.size - keep:self.size]
+        self.samples[:keep] = self.samples[self.size - keep:self.size]
+        self.size = keep
+
+    # Takes a whole pull_chunk result (list of lists or ndarray) in one vectorized copy.
+    def append_chunk(self, samples, timestamps):
+        count = len(timestamps)
+        if count == 0:
+            return 0
+        if self.maxLength is not None and count > self.maxLength:
+            samples, timestamps = samples[-self.maxLength:], timestamps[-self.maxLength:]
+            count = self.maxLength
+        self.ensure_capacity(self.size + count)
+        end = self.size + count
+        self.timestamps[self.size:end] = timestamps
+        self.samples[self.size:end] = samples
+        self.size = end
+        return count
+
+    def get_timestamps(self):
+        return self.timestamps[:self.size]
+
+    def get_samples(self):
+        return self.samples[:self.size]
+
+    def last_timestamp(self):
+        return self.timestamps[self.size - 1] if self.size > 0 else float('-inf')
+
+    def latest(self, count):
+        start = max(0, self.size - count)
+        return self.samples[start:self.size], self.timestamps[start:self.size]
+
+    def window(self, startTime, endTime):
+        timestamps = self.get_timestamps()
+        start = np.searchsorted(timestamps, startTime, side='left')
+        end = np.searchsorted(timestamps, endTime, side='right')
+        return self.samples[start:end], timestamps[start:end]
+
+    def clear(self):
+        self.size = 0
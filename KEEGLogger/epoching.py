@@ -0,0 +1,75 @@
+import numpy as np
+from constants import Constants
+
+# Keystroke epochs: data is (n_events, n_channels, n_samples), with the key, marker timestamp and session of each event.
+class Epochs:
+    def __init__(self, data, keys, timestamps, sessions, channels, samplingRate, preSamples):
+        self.data = data
+        self.keys = keys
+        self.timestamps = timestamps
+        self.sessions = sessions
+        self.channels = channels
+        self.samplingRate = samplingRate
+        self.preSamples = preSamples
+
+    def __len__(self):
+        return len(self.data)
+
+    def times(self):
+        return (np.arange(self.data.shape[2]) - self.preSamples) / self.samplingRate
+
+def window_samples(preSeconds, postSeconds, samplingRate):
+    return int(round(preSeconds * samplingRate)), int(round(postSeconds * samplingRate))
+
+# Cuts a [-preSamples, postSamples) window around every marker at once. Each marker is aligned to the first EEG sample
+# at or after it with np.searchsorted. Returns (epochs, valid) where epochs is (n_valid, n_channels, n_samples) and valid
+# masks the markers that were kept: markers without a timestamp (e.g. the empty leading rows), windows running off either
+# end of the recording and markers further than maxGap seconds from the nearest sample are dropped.
+def extract_epochs(eegTimestamps, eegSamples, markerTimestamps, preSamples, postSamples, maxGap = None):
+    eegTimestamps = np.asarray(eegTimestamps, dtype=np.float64)
+    eegSamples = np.asarray(eegSamples)
+    markerTimestamps = np.asarray(markerTimestamps, dtype=np.float64)
+    if len(eegTimestamps) > 1 and np.any(np.diff(eegTimestamps) < 0):
+        order = np.argsort(eegTimestamps, kind='stable')
+        eegTimestamps, eegSamples = eegTimestamps[order], eegSamples[order]
+    sampleCount = len(eegTimestamps)
+    valid = np.isfinite(markerTimestamps)
+    onsets = np.searchsorted(eegTimestamps, np.where(valid, markerTimestamps, 0))
+    valid &= (onsets - preSamples >= 0) & (onsets + postSamples <= sampleCount)
+    if maxGap is not None and sampleCount > 0:
+        nearest = eegTimestamps[np.clip(onsets, 0, sampleCount - 1)]
+        valid &= np.abs(nearest - markerTimestamps) <= maxGap
+    indices = onsets[valid, None] + np.arange(-preSamples, postSamples)[None, :]
+    epochs = eegSamples[indices].transpose(0, 2, 1)
+    return epochs, valid
+
+# Epochs every keystroke of the frames returned by helpers.load_sessions, never letting a window cross a session boundary.
+def epoch_sessions(dfMrk, dfEEG, preSeconds = Constants.EPOCH_PRE_SECONDS, postSeconds = Constants.EPOCH_POST_SECONDS,
+                   samplingRate = Constants.DEFAULT_SAMPLING_RATE, channels = None, maxGap = None):
+    if channels is None:
+        channels = [column for column in dfEEG.columns if column not in ('session', 'timestamp')]
+    preSamples, postSamples = window_samples(preSeconds, postSeconds, samplingRate)
+    if maxGap is None:
+        maxGap = 2.0 / samplingRate
+    dfMrk = dfMrk[dfMrk['key marker'].notna()]
+    eegGroups = dfEEG.groupby('session', observed=True).indices
+    mrkGroups = dfMrk.groupby('session', observed=True).indices
+    eegTimestamps = dfEEG['timestamp'].to_numpy()
+    eegSamples = dfEEG[channels].to_numpy(dtype=np.float32)
+    mrkTimestamps = dfMrk['timestamp'].to_numpy()
+    mrkKeys = dfMrk['key marker'].astype(str).to_numpy()
+    data, keys, timestamps, sessions = [], [], [], []
+    for session, mrkRows in mrkGroups.items():
+        if session not in eegGroups:
+            continue
+        eegRows = eegGroups[session]
+        epochs, valid = extract_epochs(eegTimestamps[eegRows], eegSamples[eegRows], mrkTimestamps[mrkRows], preSamples, postSamples, maxGap)
+        data.append(epochs)
+        keys.append(mrkKeys[mrkRows][valid])
+        timestamps.append(mrkTimestamps[mrkRows][valid])
+        sessions.append(np.full(int(valid.sum()), session, dtype=object))
+    if len(data) == 0:
+        return Epochs(np.empty((0, len(channels), preSamples + postSamples), dtype=np.float32), np.empty(0, dtype=str),
+                      np.empty(0), np.empty(0, dtype=object), channels, samplingRate, preSamples)
+    return Epochs(np.concatenate(data), np.concatenate(keys), np.concatenate(timestamps), np.concatenate(sessions),
+                  channels, samplingRate, preSamples)
@@ -0,0 +1,122 @@
+import os
+import json
+import glob
+import hashlib
+import numpy as np
+import session_query
+from epoching import epoch_sessions
+from constants import Constants
+
+# Per-channel band power of every epoch in one batched FFT. data is (n_events, n_channels, n_samples),
+# returns (n_events, n_channels, n_bands) using a Hann windowed periodogram.
+def band_powers(data, samplingRate, bands = Constants.EEG_BANDS):
+    sampleCount = data.shape[-1]
+    window = np.hanning(sampleCount).astype(np.float32)
+    detrended = data - data.mean(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(detrended * window, axis=-1)
+    psd = (np.abs(spectrum) ** 2) / (samplingRate * np.sum(window ** 2))
+    psd[..., 1:] *= 2
+    freqs = np.fft.rfftfreq(sampleCount, 1.0 / samplingRate)
+    powers = np.empty(data.shape[:-1] + (len(bands),), dtype=np.float32)
+    for i, (name, low, high) in enumerate(bands):
+        mask = (freqs >= low) & (freqs < high)
+        powers[..., i] = psd[..., mask].sum(axis=-1) * (freqs[1] - freqs[0])
+    return powers
+
+# Flattens band powers into (n_events, n_channels * n_bands) log power features.
+def feature_matrix(powers):
+    return np.log10(powers.reshape(len(powers), -1) + 1e-12)
+
+def hash_file(hasher, path):
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            hasher.update(block)
+
+# Content hash of the session files (binary session columns if present, then the archive, CSV files otherwise).
+def session_hash(session):
+    hasher = hashlib.sha1()
+    if session['binaryFile'] is not None:
+        files = sorted(glob.glob(os.path.join(session['binaryFile'], '*.bin')))
+    elif session['archiveFile'] is not None:
+        files = [session['archiveFile']]
+    else:
+        files = [session['eegFile'], session['mrkFile']]
+    for path in files:
+        hash_file(hasher, path)
+    return hasher.hexdigest()
+
+# On-disk cache of featurized sessions, one .npz per (session content hash, feature parameters), stored in
+# "<rootFolder>/<FEATURE_CACHE_FOLDER>" next to the session catalog so it moves with the session data.
+# Entries are evicted least recently used first once the folder grows beyond maxBytes.
+class FeatureCache:
+    def __init__(self, rootFolder = 'session_data', folderName = Constants.FEATURE_CACHE_FOLDER, maxBytes = Constants.FEATURE_CACHE_MAX_BYTES):
+        self.folder = os.path.join(rootFolder, folderName)
+        self.maxBytes = maxBytes
+        os.makedirs(self.folder, exist_ok=True)
+
+    def make_key(self, session, params):
+        return hashlib.sha1((session_hash(session) + json.dumps(params, sort_keys=True)).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.npz')
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        os.utime(path) # Mark as recently used.
+        with np.load(path, allow_pickle=False) as cached:
+            return {name: cached[name] for name in cached.files}
+
+    def put(self, key, arrays):
+        path = self.path(key)
+        np.savez(path + '.part.npz', **arrays)
+        os.replace(path + '.part.npz', path)
+        self.evict()
+
+    def evict(self):
+        entries = [(os.path.getmtime(path), os.path.getsize(path), path) for path in glob.glob(os.path.join(self.folder, '*.npz'))]
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+# Featurizes catalog sessions, only sessions missing from the cache are epoched and featurized, reading just the EEG
+# around their keystrokes.
+# Returns a dict with features (n_events, n_features), keys, timestamps and sessions.
+def featurize_sessions(sessions, preSeconds = Constants.EPOCH_PRE_SECONDS, postSeconds = Constants.EPOCH_POST_SECONDS,
+                       samplingRate = Constants.DEFAULT_SAMPLING_RATE, channels = None, bands = Constants.EEG_BANDS, cache = None, rootFolder = 'session_data'):
+    if cache is None:
+        cache = FeatureCache(rootFolder)
+    params = {'preSeconds': preSeconds, 'postSeconds': postSeconds, 'samplingRate': samplingRate,
+              'channels': channels, 'bands': [list(band) for band in bands], 'version': 1}
+    results = {}
+    missing = []
+    for session in sessions:
+        key = cache.make_key(session, params)
+        cached = cache.get(key)
+        if cached is None:
+            missing.append((session, key))
+        else:
+            results[session['id']] = cached
+    if missing:
+        print('Featurizing {0} new session(s), {1} loaded from cache.'.format(len(missing), len(results)))
+        dfMrk, dfEEG = session_query.load_epoch_windows([session for session, key in missing], preSeconds, postSeconds, channels)
+        epochs = epoch_sessions(dfMrk, dfEEG, preSeconds, postSeconds, samplingRate, channels)
+        features = feature_matrix(band_powers(epochs.data, samplingRate, bands))
+        for session, key in missing:
+            mask = epochs.sessions == session['id']
+            arrays = {'features': features[mask], 'keys': epochs.keys[mask].astype(str), 'timestamps': epochs.timestamps[mask]}
+            cache.put(key, arrays)
+            results[session['id']] = arrays
+    ordered = [results[session['id']] for session in sessions]
+    if len(ordered) == 0:
+        return {'features': np.empty((0, 0), dtype=np.float32), 'keys': np.empty(0, dtype=str), 'timestamps': np.empty(0), 'sessions': np.empty(0, dtype=object)}
+    return {
+        'features': np.concatenate([arrays['features'] for arrays in ordered]),
+        'keys': np.concatenate([arrays['keys'] for arrays in ordered]),
+        'timestamps': np.concatenate([arrays['timestamps'] for arrays in ordered]),
+        'sessions': np.concatenate([np.full(len(arrays['keys']), session['id'], dtype=object) for session, arrays in zip(sessions, ordered)])
+    }
@@ -1,11 +1,18 @@
 import os
 import configparser
+import contextlib
+import tempfile
+import threading
 import pandas as pd
 import glob
 import ntpath
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from constants import Constants
 from password_types import PasswordTypes
+from binary_session import open_binary_session
+import session_catalog
+import session_archive
 
 def safe_cast(val, to_type, default=None):
     try:
@@ -24,57 +31,223 @@ def ensure_dir(file_path):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def get_channel_names(info):
+    chanNum = info.channel_count()
+    channels = info.desc().child('channels').first_child()
+    channelNames = [channels.child_value('label')]
+    for i in range(1, chanNum):
+        channels = channels.next_sibling()
+        channelNames.append(channels.child_value('label'))
+    return channelNames
+
 def load_default_config(cfgFileName = Constants.CONFIG_FILE_NAME, defaultCfgFileName = Constants.DEFAULT_CONFIG_FILE_NAME):
     if not os.path.isfile(cfgFileName):
         config = configparser.ConfigParser()
         config.read(defaultCfgFileName)
-        cfgfile = open(cfgFileName,'w')
-        config.write(cfgfile)
-        cfgfile.close()
+        write_config_atomic(config, cfgFileName)
+
+# Writes the whole config to a temp file next to it and renames it over the config file, readers never see a partial file.
+def write_config_atomic(config, cfgFileName):
+    folder = os.path.dirname(os.path.abspath(cfgFileName))
+    fd, tempFileName = tempfile.mkstemp(prefix=os.path.basename(cfgFileName) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'w') as cfgfile:
+            config.write(cfgfile)
+            cfgfile.flush()
+            os.fsync(cfgfile.fileno())
+        os.replace(tempFileName, cfgFileName)
+    except BaseException:
+        os.remove(tempFileName)
+        raise
+
+# In-memory config, parsed once and only reloaded when the file changes on disk (mtime / size).
+# Changes made inside "with store.batch():" are written once when the outermost batch ends, otherwise every set() writes.
+# Pending changes are re-applied on top of the latest file before writing, so a concurrent change by another tool is kept.
+class ConfigStore:
+    def __init__(self, cfgFileName = Constants.CONFIG_FILE_NAME):
+        self.cfgFileName = cfgFileName
+        self.lock = threading.RLock()
+        self.config = None
+        self.fileState = None
+        self.pending = [] # (section, option, value) changes not written yet.
+        self.batchDepth = 0
+
+    def file_state(self):
+        try:
+            stat = os.stat(self.cfgFileName)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def current(self):
+        with self.lock:
+            fileState = self.file_state()
+            if self.config is None or not fileState == self.fileState:
+                self.config = configparser.ConfigParser()
+                self.config.read(self.cfgFileName)
+                self.fileState = fileState
+                for change in self.pending:
+                    self.apply(*change)
+            return self.config
+
+    def get(self, section, option):
+        return self.current().get(section, option)
+
+    def has_section(self, section):
+        return self.current().has_section(section)
+
+    def sections(self):
+        return self.current().sections()
+
+    def apply(self, section, option, value):
+        if not self.config.has_section(section):
+            self.config.add_section(section)
+        if not option == None and not value == None:
+            self.config.set(section, option, str(value))
+
+    def set(self, section, option = None, value = None):
+        with self.lock:
+            self.current()
+            self.pending.append((section, option, value))
+            self.apply(section, option, value)
+            if self.batchDepth == 0:
+                self.save()
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            self.batchDepth += 1
+            try:
+                yield self
+            finally:
+                self.batchDepth -= 1
+                if self.batchDepth == 0 and self.pending:
+                    self.save()
+
+    def save(self):
+        with self.lock:
+            config = self.current() # Picks up changes made on disk since the last read, pending changes are re-applied.
+            write_config_atomic(config, self.cfgFileName)
+            self.fileState = self.file_state()
+            self.pending = []
+
+configStores = {}
+
+# Shared ConfigStore of a config file.
+def get_config_store(cfgFileName = Constants.CONFIG_FILE_NAME):
+    store = configStores.get(cfgFileName)
+    if store is None:
+        store = configStores.setdefault(cfgFileName, ConfigStore(cfgFileName))
+    return store
 
 def read_config(cfgFileName = Constants.CONFIG_FILE_NAME):
-    config = configparser.ConfigParser()
-    config.read(cfgFileName)
-    return config
+    return get_config_store(cfgFileName).current()
 
 def write_config(section, option = None, value = None, cfgFileName = Constants.CONFIG_FILE_NAME):
-    config = configparser.ConfigParser()
-    config.read(cfgFileName)
-    if not config.has_section(section):
-        config.add_section(section)
-    if not option == None and not value == None:
-        config.set(section, option, str(value))
-    cfgfile = open(cfgFileName, 'w')
-    config.write(cfgfile)
-    cfgfile.close()
-
-def load_all_users_data(passwordType, rootFolder = 'session_data', startDateTime = datetime.min, endDateTime = datetime.max):
-    load_user_data('**', passwordType, rootFolder, startDateTime, endDateTime)
-
-def load_user_data(username, passwordType, rootFolder = 'session_data', startDateTime = datetime.min, endDateTime = datetime.max):
-    if(type(passwordType) is int):
-        passwordTypeStr = PasswordTypes(passwordType).name
-    else: 
-        passwordTypeStr = passwordType.name
-    folder = '{0}/{1}/{2}'.format(rootFolder, username, passwordTypeStr)
-    print('Searching folder {0} for sessions date/time range Start: {1} - End: {2}'.format(folder, startDateTime, endDateTime))
+    get_config_store(cfgFileName).set(section, option, value)
+
+# datetime.min / datetime.max are used as open range bounds and cannot be converted with timestamp().
+def datetime_to_timestamp(value):
+    if value == datetime.min:
+        return float('-inf')
+    if value == datetime.max:
+        return float('inf')
+    return value.timestamp()
+
+# Returns the header columns and number of (non-empty) data rows of a CSV file without parsing it.
+def read_csv_header_and_count(filePath):
+    with open(filePath, 'r') as file:
+        columns = file.readline().strip().split(',')
+        count = sum(1 for line in file if line.strip())
+    return columns, count
+
+# Splits "<user>_<mode>_<start>_<finish>" (file suffix already removed) into user, mode and start/finish datetimes.
+def parse_session_name(sessionName):
+    rest, startStr, finishStr = sessionName.rsplit('_', 2)
+    for mode in PasswordTypes:
+        if rest.endswith('_' + mode.name):
+            user = rest[:-len(mode.name) - 1]
+            return user, mode, datetime.strptime(startStr, Constants.SESSION_FILE_DATETIME_FORMAT), datetime.strptime(finishStr, Constants.SESSION_FILE_DATETIME_FORMAT)
+    raise ValueError('Invalid session name: {0}'.format(sessionName))
+
+# Returns {session file base: path} for every session in a folder, binary sessions are preferred over archives and
+# archives over CSV.
+def find_sessions(folder):
+    sessions = {}
     for filePath in glob.iglob(folder + '/*_MRK.csv', recursive=False):
-        fileName = ntpath.basename(filePath)
-        timestampsStr = fileName.replace(username + '_' + passwordTypeStr + '_', '').replace('_MRK.csv', '').split('_')
-        timestamps = [datetime.strptime(timestampsStr[0], Constants.SESSION_FILE_DATETIME_FORMAT), datetime.strptime(timestampsStr[1], Constants.SESSION_FILE_DATETIME_FORMAT)]
-        dfMrk = None
-        dfEEG = None
-        if(timestamps[0] >= startDateTime and timestamps[1] <= endDateTime):
-            print('[Found session] Start: {0} - End: {1}'.format(str(timestamps[0]), str(timestamps[1])))
-            mrkFile = filePath
-            eegFile = filePath.replace('_MRK.csv', '_EEG.csv')
-            dfMrkn = pd.read_csv(mrkFile, float_precision='round_trip')
-            dfEEGn = pd.read_csv(eegFile, float_precision='round_trip')
-            if dfMrk: dfMrk.append(dfMrkn)
-            else: dfMrk = dfMrkn
-            
-            if dfEEG: dfEEG.append(dfEEGn)
-            else: dfEEG = dfEEGn
+        sessions[filePath[:-len('_MRK.csv')]] = filePath
+    for filePath in glob.iglob(folder + '/*' + Constants.ARCHIVE_EXTENSION, recursive=False):
+        sessions[filePath[:-len(Constants.ARCHIVE_EXTENSION)]] = filePath
+    for filePath in glob.iglob(folder + '/*' + Constants.BINARY_SESSION_EXTENSION, recursive=False):
+        sessions[filePath[:-len(Constants.BINARY_SESSION_EXTENSION)]] = filePath
+    return sessions
+
+# Loads one session as (dfMrk, dfEEG). If channels is given only those EEG columns (plus timestamp) are read.
+def load_binary_session(path, channels = None):
+    session = open_binary_session(path)
+    allChannels = session['header']['channels']
+    samples = session['eegSamples']
+    if channels is not None:
+        samples = samples[:, [allChannels.index(channel) for channel in channels]]
+    dfEEG = pd.DataFrame(samples, columns=allChannels if channels is None else list(channels), copy=False)
+    dfEEG.insert(0, 'timestamp', session['eegTimestamps'])
+    dfMrk = pd.DataFrame({'timestamp': session['mrkTimestamps'], 'key marker': session['mrkMarkers'], 'queue delay': session['mrkDelays']})
+    return dfMrk, dfEEG
 
+def load_csv_session(mrkFile, channels = None):
+    dfMrk = pd.read_csv(mrkFile, float_precision='round_trip', dtype={'key marker': str})
+    usecols = None if channels is None else ['timestamp'] + list(channels)
+    dfEEG = pd.read_csv(mrkFile.replace('_MRK.csv', '_EEG.csv'), float_precision='round_trip', usecols=usecols)
+    if usecols is not None:
+        dfEEG = dfEEG[usecols]
+    return dfMrk, dfEEG
+
+def load_session(filePath, channels = None):
+    if filePath.endswith(Constants.BINARY_SESSION_EXTENSION):
+        return load_binary_session(filePath, channels)
+    if filePath.endswith(Constants.ARCHIVE_EXTENSION):
+        return session_archive.load_archive_session(filePath, channels)
+    return load_csv_session(filePath, channels)
+
+# The file to load a catalog session from, in order of read speed.
+def session_file(session):
+    return session['binaryFile'] or session['archiveFile'] or session['mrkFile']
+
+def load_catalog_session(session, channels = None):
+    dfMrk, dfEEG = load_session(session_file(session), channels)
+    dfMrk.insert(0, 'session', session['id'])
+    dfEEG.insert(0, 'session', session['id'])
+    return dfMrk, dfEEG
+
+# Loads catalog sessions in parallel and returns (dfMrk, dfEEG), each concatenated once and tagged with a categorical session id.
+# Threads are used by default since the CSV parser and memory mapped reads release the GIL, set useProcesses for a process pool.
+def load_sessions(sessions, channels = None, maxWorkers = None, useProcesses = False):
+    if len(sessions) == 0:
+        return pd.DataFrame(columns=['session', 'timestamp', 'key marker']), pd.DataFrame(columns=['session', 'timestamp'] + list(channels or []))
+    executorType = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+    with executorType(max_workers=maxWorkers) as executor:
+        frames = list(executor.map(load_catalog_session, sessions, [channels] * len(sessions)))
+    sessionIds = [session['id'] for session in sessions]
+    dfMrk = pd.concat([frame[0] for frame in frames], ignore_index=True)
+    dfEEG = pd.concat([frame[1] for frame in frames], ignore_index=True)
+    dfMrk['session'] = pd.Categorical(dfMrk['session'], categories=sessionIds)
+    dfEEG['session'] = pd.Categorical(dfEEG['session'], categories=sessionIds)
+    return dfMrk, dfEEG
+
+def find_user_sessions(username, passwordType, rootFolder = 'session_data', startDateTime = datetime.min, endDateTime = datetime.max):
+    if(type(passwordType) is int):
+        passwordType = PasswordTypes(passwordType)
+    print('Searching catalog for {0} sessions of user {1}, date/time range Start: {2} - End: {3}'.format(passwordType.name, username, startDateTime, endDateTime))
+    catalog = session_catalog.SessionCatalog(rootFolder)
+    sessions = catalog.find_sessions(username, passwordType, startDateTime, endDateTime)
+    catalog.close()
+    for session in sessions:
+        print('[Found session] User: {0} | Start: {1} - End: {2}'.format(session['user'], datetime.fromtimestamp(session['startTime']), datetime.fromtimestamp(session['finishTime'])))
+    return sessions
 
+def load_all_users_data(passwordType, rootFolder = 'session_data', startDateTime = datetime.min, endDateTime = datetime.max, channels = None, maxWorkers = None):
+    return load_user_data(None, passwordType, rootFolder, startDateTime, endDateTime, channels, maxWorkers)
 
+def load_user_data(username, passwordType, rootFolder = 'session_data', startDateTime = datetime.min, endDateTime = datetime.max, channels = None, maxWorkers = None):
+    sessions = find_user_sessions(username, passwordType, rootFolder, startDateTime, endDateTime)
+    return load_sessions(sessions, channels, maxWorkers)
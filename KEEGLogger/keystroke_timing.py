@@ -0,0 +1,95 @@
+import threading
+import random
+import numpy as np
+import pygame
+from time import time, sleep, perf_counter
+from pylsl import local_clock
+from constants import Constants
+
+# Clock used for key markers. Markers must share the clock domain of the EEG timestamps: muselsl stamps samples with
+# the wall clock while other LSL sources use pylsl.local_clock(), so the domain is picked from the first EEG timestamp.
+class KeystrokeClock:
+    def __init__(self, clock = local_clock):
+        self.clock = clock
+        self.matched = False
+
+    def match_eeg(self, eegTimestamp):
+        if self.matched:
+            return
+        self.clock = time if abs(eegTimestamp - time()) < abs(eegTimestamp - local_clock()) else local_clock
+        self.matched = True
+
+    def now(self):
+        return self.clock()
+
+# Pumps pygame events and timestamps them on the keystroke clock at dequeue. pygame events carry no arrival time, so
+# an event is assumed to have arrived uniformly within the interval since the previous pump: its timestamp is the
+# middle of that interval and half the interval is recorded as the estimated queueing delay of the marker.
+# The session loops pump every INPUT_POLL_INTERVAL seconds (independent of the drawing frame rate) to keep it small.
+class KeystrokeTimer:
+    def __init__(self, clock = None):
+        self.clock = clock if clock is not None else KeystrokeClock()
+        self.lastPump = None
+
+    # Returns a list of (event, timestamp, queueDelay).
+    def pump(self):
+        events = pygame.event.get()
+        now = self.clock.now()
+        queueDelay = 0.0 if self.lastPump is None else (now - self.lastPump) / 2
+        self.lastPump = now
+        return [(event, now - queueDelay, queueDelay) for event in events]
+
+def summarize(name, errors):
+    errors = np.abs(np.asarray(errors)) * 1000
+    if len(errors) == 0:
+        return '{0}: no samples'.format(name)
+    return '{0}: n={1} | mean {2:.2f} ms | median {3:.2f} ms | p95 {4:.2f} ms | max {5:.2f} ms'.format(
+        name, len(errors), errors.mean(), np.median(errors), np.percentile(errors, 95), errors.max())
+
+# Posts synthetic key events at known times from a helper thread while the main thread pumps events like a session
+# loop would, and reports the marker timestamp error distribution for the given poll interval.
+def benchmark(duration = 10.0, pollInterval = Constants.INPUT_POLL_INTERVAL, meanKeyInterval = 0.2):
+    clock = KeystrokeClock(perf_counter)
+    timer = KeystrokeTimer(clock)
+    posted = {}
+    done = threading.Event()
+
+    def post_keys():
+        keyId = 0
+        while not done.is_set():
+            sleep(random.expovariate(1.0 / meanKeyInterval))
+            posted[keyId] = clock.now()
+            pygame.event.post(pygame.event.Event(pygame.USEREVENT, {'keyId': keyId}))
+            keyId += 1
+
+    poster = threading.Thread(target=post_keys, daemon=True)
+    poster.start()
+    errors, rawErrors, delays = [], [], []
+    end = perf_counter() + duration
+    while perf_counter() < end:
+        for event, timestamp, queueDelay in timer.pump():
+            if event.type == pygame.USEREVENT and event.keyId in posted:
+                errors.append(timestamp - posted[event.keyId])
+                rawErrors.append(timestamp + queueDelay - posted[event.keyId])
+                delays.append(queueDelay)
+        sleep(pollInterval)
+    done.set()
+    poster.join()
+    return errors, rawErrors, delays
+
+# Marker to EEG alignment of recorded sessions: distance from each marker to its nearest EEG sample and the recorded
+# queueing delay estimates. dfMrk / dfEEG are frames returned by helpers.load_sessions.
+def session_alignment(dfMrk, dfEEG):
+    distances = []
+    for session, mrkRows in dfMrk.groupby('session', observed=True).indices.items():
+        eegTimestamps = dfEEG['timestamp'].to_numpy()[dfEEG['session'].to_numpy() == session]
+        markerTimestamps = dfMrk['timestamp'].to_numpy()[mrkRows]
+        markerTimestamps = markerTimestamps[np.isfinite(markerTimestamps)]
+        if len(eegTimestamps) == 0 or len(markerTimestamps) == 0:
+            continue
+        indices = np.clip(np.searchsorted(eegTimestamps, markerTimestamps), 1, len(eegTimestamps) - 1)
+        nearest = np.minimum(np.abs(eegTimestamps[indices] - markerTimestamps), np.abs(eegTimestamps[indices - 1] - markerTimestamps))
+        distances.append(nearest)
+    distances = np.concatenate(distances) if distances else np.empty(0)
+    delays = dfMrk['queue delay'].dropna().to_numpy() if 'queue delay' in dfMrk.columns else np.empty(0)
+    return distances, delays
@@ -0,0 +1,32 @@
+from pylsl import StreamInfo, StreamOutlet
+from constants import Constants
+
+MUSE_CHANNELS = ['TP9', 'AF7', 'AF8', 'TP10', 'Right AUX']
+
+# Stream info of the Muse EEG stream as created by muse_helper.stream (shared with the synthetic Muse source).
+def muse_stream_info(address, samplingRate = Constants.DEFAULT_SAMPLING_RATE):
+    info = StreamInfo('Muse', 'EEG', len(MUSE_CHANNELS), samplingRate, 'float32', 'Muse%s' % address)
+    info.desc().append_child_value("manufacturer", "Muse")
+    channels = info.desc().append_child("channels")
+    for c in MUSE_CHANNELS:
+        channels.append_child("channel") \
+            .append_child_value("label", c) \
+            .append_child_value("unit", "microvolts") \
+            .append_child_value("type", "EEG")
+    return info
+
+# Pushes whole (samples x channels) chunks with per-sample timestamps. Older pylsl versions only accept a single
+# timestamp per chunk, in which case the last sample's timestamp is used and the rest are deduced from the nominal rate.
+class ChunkPusher:
+    def __init__(self, outlet):
+        self.outlet = outlet
+        self.perSampleTimestamps = True
+
+    def push(self, chunk, timestamps):
+        if self.perSampleTimestamps:
+            try:
+                self.outlet.push_chunk(chunk, timestamps)
+                return
+            except TypeError:
+                self.perSampleTimestamps = False
+        self.outlet.push_chunk(chunk, float(timestamps[-1]))
@@ -1,5 +1,6 @@
-from time import time, sleep
-from pylsl import StreamInfo, StreamOutlet
+from time import time, sleep, perf_counter
+import numpy as np
+from pylsl import StreamOutlet
 import pygatt
 import subprocess
 from sys import platform
@@ -7,6 +8,29 @@ from muselsl import helper
 from muselsl.muse import Muse
 from muselsl.constants import MUSE_NB_CHANNELS, MUSE_SAMPLING_RATE, MUSE_SCAN_TIMEOUT, LSL_CHUNK, AUTO_DISCONNECT_DELAY
 from muselsl.stream import list_muses, find_muse
+from lsl_outlets import muse_stream_info, ChunkPusher
+from constants import Constants
+
+# Tracks how long the EEG push callback takes and prints a summary every reportInterval seconds.
+class CallbackTimer:
+    def __init__(self, name, reportInterval = Constants.MUSE_PUSH_REPORT_INTERVAL):
+        self.name = name
+        self.reportInterval = reportInterval
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lastReport = time()
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if time() - self.lastReport >= self.reportInterval:
+            print('{0}: {1} calls | mean {2:.3f} ms | max {3:.3f} ms'.format(self.name, self.count, 1000 * self.total / self.count, 1000 * self.max))
+            self.reset()
 
 # Begins an LSL stream containing EEG data from a Muse with a given address
 def stream(address, backend='auto', interface=None, name=None, unmanaged=False):
@@ -20,23 +44,17 @@ def stream(address, backend='auto', interface=None, name=None, unmanaged=False):
                 address = found_muse['address']
                 name = found_muse['name']
 
-        info = StreamInfo('Muse', 'EEG', MUSE_NB_CHANNELS, MUSE_SAMPLING_RATE, 'float32',
-                          'Muse%s' % address)
-
-        info.desc().append_child_value("manufacturer", "Muse")
-        channels = info.desc().append_child("channels")
-
-        for c in ['TP9', 'AF7', 'AF8', 'TP10', 'Right AUX']:
-            channels.append_child("channel") \
-                .append_child_value("label", c) \
-                .append_child_value("unit", "microvolts") \
-                .append_child_value("type", "EEG")
-
+        info = muse_stream_info(address, MUSE_SAMPLING_RATE)
         outlet = StreamOutlet(info, LSL_CHUNK)
 
+        pusher = ChunkPusher(outlet)
+        pushTimer = CallbackTimer('EEG push')
+
+        # Each BLE packet arrives as a (channels x LSL_CHUNK) array, push it as one contiguous (LSL_CHUNK x channels) chunk.
         def push_eeg(data, timestamps):
-            for ii in range(LSL_CHUNK):
-                outlet.push_sample(data[:, ii], timestamps[ii])
+            start = perf_counter()
+            pusher.push(np.ascontiguousarray(data.T, dtype=np.float32), timestamps)
+            pushTimer.record(perf_counter() - start)
 
         muse = Muse(address=address, callback_eeg=push_eeg,
                     backend=backend, interface=interface, name=name)
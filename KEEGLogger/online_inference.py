@@ -0,0 +1,80 @@
+import queue
+import threading
+import numpy as np
+from time import time, sleep
+from epoching import extract_epochs, window_samples
+from features import band_powers, feature_matrix
+from constants import Constants
+
+# Runs the trained KeystrokeModel on the live EEG around each keystroke marker, on a worker thread.
+# A prediction is made as soon as the acquisition buffer covers the marker's post window. Latency is tracked as:
+#   inference latency - from the window becoming available to the prediction (target INFERENCE_LATENCY_TARGET).
+#   keystroke latency - from the key marker to the prediction (includes waiting for the post window).
+# clock must be the clock the key markers are timestamped on (KeystrokeClock.now), which is not always the wall clock.
+class OnlineInference:
+    def __init__(self, model, acquisition, clock = time, pollInterval = Constants.INFERENCE_POLL_INTERVAL):
+        self.model = model
+        self.acquisition = acquisition
+        self.clock = clock
+        self.pollInterval = pollInterval
+        params = model.metadata['featureParams']
+        self.samplingRate = params['samplingRate']
+        self.bands = [tuple(band) for band in params['bands']]
+        self.preSeconds, self.postSeconds = params['preSeconds'], params['postSeconds']
+        self.preSamples, self.postSamples = window_samples(self.preSeconds, self.postSeconds, self.samplingRate)
+        self.pending = queue.Queue()
+        self.predictions = [] # Each item is [marker timestamp, key pressed, predicted key, probability].
+        self.inferenceLatencies = []
+        self.keystrokeLatencies = []
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='OnlineInference', daemon=True)
+        self.thread.start()
+
+    def submit(self, timestamp, key):
+        self.pending.put((timestamp, key))
+
+    def stop(self):
+        self.running = False
+        self.pending.put(None)
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            item = self.pending.get()
+            if item is None:
+                break
+            timestamp, key = item
+            deadline = self.clock() + self.postSeconds + Constants.INFERENCE_WAIT_TIMEOUT
+            while self.running and self.acquisition.latest_timestamp() < timestamp + self.postSeconds:
+                if self.clock() > deadline:
+                    break
+                sleep(self.pollInterval)
+            windowReady = self.clock()
+            margin = 2.0 / self.samplingRate
+            samples, timestamps = self.acquisition.window(timestamp - self.preSeconds - margin, timestamp + self.postSeconds + margin)
+            epochs, valid = extract_epochs(timestamps, samples, [timestamp], self.preSamples, self.postSamples)
+            if not valid[0]:
+                continue
+            predicted, probability = self.model.predict(feature_matrix(band_powers(epochs, self.samplingRate, self.bands)))
+            done = self.clock()
+            with self.lock:
+                self.predictions.append([timestamp, key, predicted[0], probability[0]])
+                self.inferenceLatencies.append(done - windowReady)
+                self.keystrokeLatencies.append(done - timestamp)
+
+    def predicted_text(self):
+        with self.lock:
+            return ''.join(prediction[2] for prediction in self.predictions)
+
+    def clear(self):
+        with self.lock:
+            self.predictions = []
+
+    def latency_summary(self):
+        with self.lock:
+            inference, keystroke = np.array(self.inferenceLatencies), np.array(self.keystrokeLatencies)
+        if len(inference) == 0:
+            return 'No predictions yet.'
+        return 'Predictions: {0} | Inference latency mean {1:.1f} ms, p95 {2:.1f} ms (target {3:.0f} ms) | Keystroke to prediction mean {4:.1f} ms'.format(
+            len(inference), 1000 * inference.mean(), 1000 * np.percentile(inference, 95), 1000 * Constants.INFERENCE_LATENCY_TARGET, 1000 * keystroke.mean())
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Generates the passwords typed in data collection sessions. The training data should cover every key evenly and, since
+# the EEG around a key press overlaps the previous key's, every key transition (bigram) as evenly as possible.
+# Everything works on symbol indices into mode.characters() with numpy, so schedules of 100k+ keystrokes take
+# milliseconds, and a given seed always gives the same passwords.
+
+# Returns count symbol indices in random order with every symbol used floor(count / poolSize) times, the remainder is
+# filled with distinct random symbols so no symbol is used more than once more than any other.
+def balanced_symbols(count, poolSize, random):
+    freq, remainder = divmod(count, poolSize)
+    symbols = np.concatenate((np.tile(np.arange(poolSize), freq), random.permutation(poolSize)[:remainder]))
+    random.shuffle(symbols)
+    return symbols
+
+# Random Eulerian circuit of the complete directed graph on poolSize symbols (self loops included), i.e. a cyclic
+# sequence of poolSize^2 symbols that contains every bigram exactly once (Hierholzer's algorithm with shuffled edges).
+def euler_circuit(poolSize, random):
+    edges = [list(random.permutation(poolSize)) for symbol in range(poolSize)]
+    stack = [int(random.integers(poolSize))]
+    circuit = []
+    while stack:
+        symbol = stack[-1]
+        if edges[symbol]:
+            stack.append(int(edges[symbol].pop()))
+        else:
+            circuit.append(stack.pop())
+    return np.array(circuit[:0:-1]) # Reversed, without the closing repeat of the start symbol.
+
+# Returns an (iterations, length) array of symbol indices in which every key is used equally often (counts differ by at
+# most one) and every bigram about equally often. The passwords are consecutive, non-overlapping pieces of a walk made
+# of rounds of the circuit, each relabelled at random and rotated to start where the previous round ended, so every
+# full round covers each bigram once and each key poolSize times. The key counts of the last, partial round are then
+# evened out by balance_counts. Only the transitions between passwords are lost, the passwords are shuffled.
+def balanced_transitions(iterations, length, poolSize, random):
+    count = iterations * length
+    circuit = euler_circuit(poolSize, random)
+    rounds = max(-(-count // len(circuit)), 1)
+    labels = np.argsort(random.random((rounds, poolSize)), axis=1)
+    # Circuit positions of every symbol (each occurs poolSize times), pick one of the start symbol's at random.
+    positions = np.argsort(circuit, kind='stable').reshape(poolSize, poolSize)
+    start = random.integers(poolSize)
+    offsets = positions[np.argsort(labels, axis=1)[:, start], random.integers(poolSize, size=rounds)]
+    rotations = (np.arange(len(circuit)) + offsets[:, None]) % len(circuit)
+    walk = np.take_along_axis(labels, circuit[rotations], axis=1).ravel()[:count]
+    balance_counts(walk, count // len(circuit) * len(circuit), length, poolSize, random)
+    return walk.reshape(iterations, length)[random.permutation(iterations)]
+
+# Evens out the key counts of symbols[start:] in place, the symbols before it already use every key equally often.
+# Each missing key replaces one occurrence of a key used too often, at the position where it adds the fewest repeats
+# of bigrams already in the schedule (symbols is read as rows of length, bigrams do not cross rows).
+def balance_counts(symbols, start, length, poolSize, random):
+    counts = np.bincount(symbols[start:], minlength=poolSize)
+    freq, remainder = divmod(len(symbols) - start, poolSize)
+    # The keys used the most keep the remainder, ties broken at random.
+    target = np.full(poolSize, freq)
+    target[np.lexsort((random.random(poolSize), -counts))[:remainder]] += 1
+    missing = np.repeat(np.arange(poolSize), np.maximum(target - counts, 0))
+    if len(missing) == 0:
+        return
+    random.shuffle(missing)
+    inRow = np.arange(1, len(symbols)) % length != 0
+    bigrams = np.bincount(symbols[:-1][inRow] * poolSize + symbols[1:][inRow], minlength=poolSize**2).reshape(poolSize, poolSize)
+    indices = np.arange(start, len(symbols))
+    hasPrev, hasNext = indices % length != 0, (indices + 1) % length != 0
+    prevIndices, nextIndices = np.maximum(indices - 1, 0), np.minimum(indices + 1, len(symbols) - 1)
+    for symbol in missing:
+        surplus = counts[symbols[indices]] > target[symbols[indices]]
+        cost = (np.where(hasPrev, bigrams[symbols[prevIndices], symbol], 0) + np.where(hasNext, bigrams[symbol, symbols[nextIndices]], 0) +
+                random.random(len(indices))) # Random tie break.
+        index = indices[np.flatnonzero(surplus)[np.argmin(cost[surplus])]]
+        previous = symbols[index]
+        if index % length != 0:
+            bigrams[symbols[index - 1], previous] -= 1
+            bigrams[symbols[index - 1], symbol] += 1
+        if (index + 1) % length != 0:
+            bigrams[previous, symbols[index + 1]] -= 1
+            bigrams[symbol, symbols[index + 1]] += 1
+        counts[previous] -= 1
+        counts[symbol] += 1
+        symbols[index] = symbol
+
+# Returns iterations passwords of the mode's length. With balanceBigrams False only the key counts are balanced.
+def generate_passwords(mode, iterations, seed = None, balanceBigrams = True):
+    random = np.random.default_rng(seed)
+    characters = np.array(list(mode.characters()))
+    if balanceBigrams:
+        symbols = balanced_transitions(iterations, mode.length(), len(characters), random)
+    else:
+        symbols = balanced_symbols(iterations * mode.length(), len(characters), random).reshape(iterations, mode.length())
+    # Each row of single characters viewed as one fixed width string.
+    return np.ascontiguousarray(characters[symbols]).view('<U{0}'.format(mode.length())).ravel().tolist()
+
+# Counts of every key and every within-password key transition, e.g. to check a schedule's balance.
+def key_counts(passwords, mode):
+    characters = mode.characters()
+    lookup = {character: index for index, character in enumerate(characters)}
+    symbols = np.array([[lookup[character] for character in password] for password in passwords]).reshape(len(passwords), -1)
+    unigrams = np.bincount(symbols.ravel(), minlength=len(characters))
+    pairs = symbols[:, :-1] * len(characters) + symbols[:, 1:]
+    bigrams = np.bincount(pairs.ravel(), minlength=len(characters)**2).reshape(len(characters), len(characters))
+    return unigrams, bigrams
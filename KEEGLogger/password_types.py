@@ -3,7 +3,27 @@ from enum import Enum
 class PasswordTypes(Enum):
     PIN_FIXED_4 = 1
     MIXED_FIXED_8 = 2
+    MIXED_FIXED_12 = 3
+    ALPHANUMERIC_FIXED_8 = 4
     
     @classmethod
     def has_value(self, value):
         return (any(value == item.value for item in self))
+
+    # Characters that can appear in key markers for this mode (passwords are always entered upper case).
+    def characters(self):
+        if self == PasswordTypes.PIN_FIXED_4:
+            return '0123456789'
+        if self == PasswordTypes.ALPHANUMERIC_FIXED_8:
+            return 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+        return 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+    def length(self):
+        return {PasswordTypes.PIN_FIXED_4: 4, PasswordTypes.MIXED_FIXED_8: 8, PasswordTypes.MIXED_FIXED_12: 12, PasswordTypes.ALPHANUMERIC_FIXED_8: 8}[self]
+
+    def description(self):
+        if self == PasswordTypes.PIN_FIXED_4:
+            return '4-digit pin number'
+        if self == PasswordTypes.ALPHANUMERIC_FIXED_8:
+            return '8 character password of letters and digits (case insensitive)'
+        return '{0} character password (case insensitive)'.format(self.length())
@@ -3,7 +3,7 @@ import random
 import math
 from password_types import PasswordTypes
 from textbox import TextBox
-from time import time, strftime, gmtime, sleep, mktime
+from time import time, strftime, gmtime, sleep, mktime, perf_counter
 import datetime
 import uuid
 import asyncio
@@ -14,6 +14,12 @@ import os
 from pylsl import StreamInfo, StreamOutlet, LostError
 from enum import Enum
 from pylsl import StreamInlet, resolve_byprop
+from acquisition_manager import AcquisitionManager
+from online_inference import OnlineInference
+from training import KeystrokeModel
+from ui_renderer import UIRenderer
+from keystroke_timing import KeystrokeTimer
+from constants import Constants
 
 class PredictionState(Enum):
     MUSE_DISCONNECTED = 0
@@ -30,6 +36,9 @@ class Prediction:
         self.height = 600
         pygame.display.set_caption(user + ' Prediction Session')
         self.screen = pygame.display.set_mode((self.width, self.height))
+        self.renderer = UIRenderer(self.screen)
+        self.drawnState = None # Session state of the last drawn frame, the window is fully redrawn when it changes.
+        self.keystrokeTimer = KeystrokeTimer() # Timestamps key events on the same clock as the EEG samples.
         self.mode = mode
         self.inputSize = (300, 60)
         self.inputPosition = (self.width/2 - self.inputSize[0]/2, self.height/2 - self.inputSize[1]/2)
@@ -40,11 +49,15 @@ class Prediction:
         self.state = PredictionState.MUSE_DISCONNECTED # 0 = Muse Disconnected, 1 = Session Running, 2 = Finished 
         self.setup_marker_streaming()
         self.markers = [[]] # Each item is array of 2 items - timestamp + the key which was pressed.
-        self.eegData = [[]] # Each item is array of timestamp + data for each channel.
-        self.get_eeg_stream(0.5)
+        self.model = KeystrokeModel.load(user, mode)
+        if self.model is None:
+            print('No trained model found for user: {0}, mode: {1}. Run "train" first, keys will not be predicted.'.format(user, mode))
+        self.inference = None # Predicts keys from the EEG around each keystroke on a worker thread.
         self.startTime = time() # Timestamp of experiment start.
         self.finishTime = 0 # Timestamp of experiment finish.
-        self.lastEEGSampleTime = self.startTime
+        # Acquires every matching EEG stream (nothing is recorded), keys are predicted from the primary device.
+        self.acquisition = AcquisitionManager(user, mode, self.startTime, museID, record=False, onChunk=self.on_eeg_chunk)
+        self.get_eeg_stream(0.5)
 
     def setup_marker_streaming(self):
         streamName = self.user + ' Prediction Session Markers'
@@ -52,26 +65,32 @@ class Prediction:
         self.markerOutlet = StreamOutlet(self.markerInfo)
 
     def get_eeg_stream(self, timeout):
-        eeg_inlet_streams : StreamInlet = resolve_byprop('type', 'EEG', timeout=timeout)
-        for stream in eeg_inlet_streams:
-            if self.museID == None or not stream.name().find(self.museID) == -1:
-                self.eegInlet = StreamInlet(stream)
-                self.eegTimeCorrection = self.eegInlet.time_correction()
-                self.state = PredictionState.RUNNING
+        if self.acquisition.resolve(timeout):
+            self.start_inference() # Before publishing RUNNING, keystrokes are submitted to the inference from then on.
+            self.state = PredictionState.RUNNING
         self.doneCheckEEG = True  
 
     def push_marker(self, timestamp, currentChar):
         self.markerOutlet.push_sample(currentChar, timestamp) # Push key marker with timestamp via LSL for other programs.
         self.markers.append([timestamp, currentChar]) 
 
-    def pull_eeg_data(self, timeout = 0.0, max_samples = 360):
-        samples, timestamps = self.eegInlet.pull_chunk(timeout, max_samples) # Pull samples.
-        timestampCount = len(timestamps)
-        if(timestampCount > 0):
-            print('Number of samples: {0} | Time since last: {1}'.format(timestampCount, time() - self.lastEEGSampleTime))
-            self.lastEEGSampleTime = time()
-            for i in range(0, len(timestamps)):
-                self.eegData.append([timestamps[i]] + samples[i])
+    def start_inference(self):
+        if self.inference is not None:
+            self.inference.acquisition = self.acquisition.primary.acquisition
+        elif self.model is not None:
+            self.inference = OnlineInference(self.model, self.acquisition.primary.acquisition, self.keystrokeTimer.clock.now)
+
+    def stop_acquisition(self):
+        if self.inference is not None:
+            self.inference.stop()
+            print(self.inference.latency_summary())
+            self.inference = None
+        self.acquisition.stop()
+
+    # Called from the acquisition threads for every pulled chunk.
+    def on_eeg_chunk(self, device, samples, timestamps):
+        if device is self.acquisition.primary:
+            self.keystrokeTimer.clock.match_eeg(timestamps[0])
 
     def check_password(self):
         passwordInput = ''.join(str(x) for x in self.input.buffer)
@@ -79,10 +98,12 @@ class Prediction:
             print('correct!')
         else: print('incorrect!')
         print(passwordInput)
+        if self.inference is not None:
+            print('Predicted: {0}'.format(self.inference.predicted_text()))
+            print(self.inference.latency_summary())
+            self.inference.clear()
 
     def draw_static_ui(self):
-        fontPassEnt = pygame.font.Font(None, 40)
-        
         if self.state == PredictionState.RUNNING:
             instruct = self.user + ' type your password below, press ENTER when done:'
         elif self.state == PredictionState.MUSE_DISCONNECTED:
@@ -90,20 +111,22 @@ class Prediction:
         else:
             instruct = 'Finished session. This window will close in a moment.'
         
-        fontInstruct = pygame.font.Font(None, 24)
-        instructS = fontInstruct.render(instruct, 1, (0,0,0))
-        instructSize = fontInstruct.size(instruct)
-        self.screen.blit(instructS, (self.width/2 - instructSize[0]/2, self.height/4 - instructSize[1]/2))
+        instructSize = self.renderer.text_size(instruct, 24)
+        self.renderer.draw_text('instruct', instruct, 24, (self.width/2 - instructSize[0]/2, self.height/4 - instructSize[1]/2))
 
     def process_input(self):
-        for event in pygame.event.get():
+        for event, timestamp, queueDelay in self.keystrokeTimer.pump():
             if self.state == PredictionState.RUNNING:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RETURN:
                         self.check_password()
+                    elif event.unicode and event.unicode in self.mode.characters() + self.mode.characters().lower():
+                        self.push_marker(timestamp, event.unicode.upper())
+                        if self.inference is not None:
+                            self.inference.submit(timestamp, event.unicode.upper())
                     self.input.get_event(event)
-            if event.type == pygame.QUIT: 
-                pygame.quit()
+            if event.type == pygame.QUIT:
+                self.gameRunning = False
 
     def process_logic(self):
         if self.state == PredictionState.MUSE_DISCONNECTED:
@@ -111,28 +134,47 @@ class Prediction:
                 self.doneCheckEEG = False
                 threading.Thread(target = self.get_eeg_stream,  kwargs={'timeout' : 5}).start()
         elif self.state == PredictionState.RUNNING:
-            self.pull_eeg_data()
+            if not self.acquisition.running():
+                self.state = PredictionState.MUSE_DISCONNECTED
         elif self.state == PredictionState.FINISHED:
             if self.finishTime == 0:
                 self.finishTime = time()
+                self.stop_acquisition()
                 self.save_data()
             if time() - self.finishTime >= 3:
                 self.gameRunning = False
         self.input.update()
 
+    def draw_prediction(self):
+        prediction = 'Predicted: ' + self.inference.predicted_text()
+        self.renderer.draw_text('prediction', prediction, 50, (self.inputPosition[0], self.inputPosition[1] + self.inputSize[1] + 20), (0,0,160))
+
     def draw(self):
-        self.screen.fill((255,255,255))
+        if self.state != self.drawnState:
+            self.renderer.full_redraw()
+            self.input.changed = True
+            self.drawnState = self.state
         self.draw_static_ui()
         if self.state == PredictionState.RUNNING:
-            self.input.draw(self.screen)
-        pygame.display.flip()
+            if self.input.changed:
+                self.renderer.mark_dirty(self.input.draw(self.screen))
+            if self.inference is not None:
+                self.draw_prediction()
+        self.renderer.present()
     
     def start(self):
         self.gameRunning = True
         while self.gameRunning:
+            frameStart = perf_counter()
             self.process_input()
             self.process_logic()
-            self.draw()
+            if self.renderer.frame_due():
+                self.draw()
+            self.acquisition.record_frame(perf_counter() - frameStart)
+            sleep(Constants.INPUT_POLL_INTERVAL)
+        self.stop_acquisition()
+        for line in self.acquisition.report():
+            print(line)
         pygame.quit()
 
 
@@ -0,0 +1,37 @@
+import numpy as np
+import pygame
+from constants import Constants
+
+# Types the session passwords by posting pygame key events, so headless runs go through the same input, marker and
+# acquisition paths as a person typing. Each password is followed by ENTER. Keys are keyInterval seconds apart,
+# randomized by up to +/- keyJitter seconds (uniformly, seeded) unless keyJitter is 0.
+class ScriptedTypist:
+    def __init__(self, passwords, keyInterval = Constants.SCRIPTED_KEY_INTERVAL, keyJitter = 0.0, seed = None):
+        self.keys = [key for password in passwords for key in list(password) + ['\r']]
+        random = np.random.default_rng(seed)
+        self.intervals = np.maximum(keyInterval + random.uniform(-keyJitter, keyJitter, len(self.keys)), 0.0)
+        self.index = 0
+        self.nextKeyTime = None
+
+    def done(self):
+        return self.index >= len(self.keys)
+
+    # Posts every key that is due at time now (perf_counter), the schedule starts with the first call.
+    def pump(self, now):
+        if self.nextKeyTime is None:
+            self.nextKeyTime = now + self.intervals[0] if not self.done() else None
+        while not self.done() and now >= self.nextKeyTime:
+            pygame.event.post(self.key_event(self.keys[self.index]))
+            self.index += 1
+            if not self.done():
+                self.nextKeyTime += self.intervals[self.index]
+
+    # Stops the schedule (e.g. while the EEG stream is disconnected), it resumes one interval after the next pump.
+    def pause(self):
+        self.nextKeyTime = None
+
+    @staticmethod
+    def key_event(key):
+        if key == '\r':
+            return pygame.event.Event(pygame.KEYDOWN, {'unicode': key, 'key': pygame.K_RETURN, 'mod': 0})
+        return pygame.event.Event(pygame.KEYDOWN, {'unicode': key, 'key': ord(key.lower()), 'mod': 0})
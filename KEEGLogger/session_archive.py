@@ -0,0 +1,262 @@
+import os
+import json
+import zlib
+import shutil
+import struct
+import threading
+import numpy as np
+import pandas as pd
+import ntpath
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import helpers
+from binary_session import make_header, write_binary_session, open_binary_session, TIMESTAMP_DTYPE, SAMPLES_DTYPE, MARKER_DTYPE, DELAY_DTYPE
+from constants import Constants
+
+# Compressed single file session archive, "<user>_<mode>_<start>_<finish>.keega":
+#   magic | EEG block 0 | EEG block 1 | ... | marker block | index (JSON) | index size (uint64) | magic
+# Every EEG block holds ARCHIVE_BLOCK_SIZE consecutive samples, zlib compressed on its own so any block can be decoded
+# without the others. The index has the session header and the first / last timestamp, file offset and size of every
+# block, so a time range (or the neighborhood of some markers) is read by decoding only the blocks that overlap it.
+# Block contents are byte shuffled (byte 0 of every value, then byte 1, ...) with the samples channel by channel, which
+# makes the slowly changing floats compress far better than their raw bytes.
+ARCHIVE_MAGIC = b'KEEGARC1'
+ARCHIVE_VERSION = 1
+TRAILER = struct.Struct('<Q8s')
+
+def shuffle_bytes(values):
+    values = np.ascontiguousarray(values)
+    return values.view(np.uint8).reshape(-1, values.dtype.itemsize).T.tobytes()
+
+def unshuffle_bytes(data, dtype, count):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(data, dtype=np.uint8, count=count * dtype.itemsize).reshape(dtype.itemsize, count).T.copy().view(dtype).ravel()
+
+def encode_block(timestamps, samples, level):
+    return zlib.compress(shuffle_bytes(np.asarray(timestamps, dtype=TIMESTAMP_DTYPE)) + shuffle_bytes(np.asarray(samples, dtype=SAMPLES_DTYPE).T), level)
+
+def decode_block(data, count, channelCount):
+    data = zlib.decompress(data)
+    timestampBytes = count * np.dtype(TIMESTAMP_DTYPE).itemsize
+    timestamps = unshuffle_bytes(data[:timestampBytes], TIMESTAMP_DTYPE, count)
+    samples = unshuffle_bytes(data[timestampBytes:], SAMPLES_DTYPE, count * channelCount).reshape(channelCount, count).T
+    return timestamps, samples
+
+def write_archive(path, header, eegSamples, eegTimestamps, mrkTimestamps, mrkMarkers, mrkDelays = None,
+                  blockSize = Constants.ARCHIVE_BLOCK_SIZE, level = Constants.ARCHIVE_COMPRESSION_LEVEL):
+    if mrkDelays is None:
+        mrkDelays = np.full(len(mrkTimestamps), np.nan)
+    blocks = {'start': [], 'end': [], 'offset': [], 'size': [], 'count': []}
+    partPath = path + '.part'
+    with open(partPath, 'wb') as file:
+        file.write(ARCHIVE_MAGIC)
+        for start in range(0, len(eegTimestamps), blockSize):
+            timestamps = np.asarray(eegTimestamps[start:start + blockSize])
+            data = encode_block(timestamps, eegSamples[start:start + blockSize], level)
+            blocks['start'].append(float(timestamps.min()))
+            blocks['end'].append(float(timestamps.max()))
+            blocks['offset'].append(file.tell())
+            blocks['size'].append(len(data))
+            blocks['count'].append(len(timestamps))
+            file.write(data)
+        markerData = zlib.compress(np.ascontiguousarray(mrkTimestamps, dtype=TIMESTAMP_DTYPE).tobytes() +
+                                   np.asarray(mrkMarkers, dtype=MARKER_DTYPE).tobytes() +
+                                   np.ascontiguousarray(mrkDelays, dtype=DELAY_DTYPE).tobytes(), level)
+        index = {
+            'version': ARCHIVE_VERSION,
+            'header': header,
+            'blockSize': blockSize,
+            'blocks': blocks,
+            'markers': {'offset': file.tell(), 'size': len(markerData), 'count': len(mrkTimestamps)}
+        }
+        file.write(markerData)
+        indexData = json.dumps(index).encode('utf-8')
+        file.write(indexData)
+        file.write(TRAILER.pack(len(indexData), ARCHIVE_MAGIC))
+    os.replace(partPath, path)
+
+# Random access reader of an archive, only the index is read when opened. Safe to share between threads.
+class ArchiveReader:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'rb')
+        self.file.seek(-TRAILER.size, os.SEEK_END)
+        indexSize, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError('Not a session archive: {0}'.format(path))
+        self.file.seek(-TRAILER.size - indexSize, os.SEEK_END)
+        self.index = json.loads(self.file.read(indexSize).decode('utf-8'))
+        self.header = self.index['header']
+        self.channels = self.header['channels']
+        blocks = self.index['blocks']
+        self.blockStarts = np.array(blocks['start'], dtype=np.float64)
+        self.blockEnds = np.array(blocks['end'], dtype=np.float64)
+        self.blockOffsets = blocks['offset']
+        self.blockSizes = blocks['size']
+        self.blockCounts = blocks['count']
+
+    def read_bytes(self, offset, size):
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+
+    def read_block(self, block):
+        return decode_block(self.read_bytes(self.blockOffsets[block], self.blockSizes[block]), self.blockCounts[block], len(self.channels))
+
+    # Indices of the blocks overlapping [startTime, endTime] (block start / end are the min / max timestamp of the block).
+    def blocks_in_range(self, startTime, endTime):
+        return np.flatnonzero((self.blockEnds >= startTime) & (self.blockStarts <= endTime))
+
+    def read_blocks(self, blocks, channels = None):
+        columns = None if channels is None else [self.channels.index(channel) for channel in channels]
+        timestamps, samples = [], []
+        for block in blocks:
+            blockTimestamps, blockSamples = self.read_block(block)
+            timestamps.append(blockTimestamps)
+            samples.append(blockSamples if columns is None else blockSamples[:, columns])
+        channelCount = len(self.channels) if columns is None else len(columns)
+        if not timestamps:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty((0, channelCount), dtype=SAMPLES_DTYPE)
+        return np.concatenate(timestamps), np.concatenate(samples)
+
+    # Returns (timestamps, samples) of the EEG samples in [startTime, endTime], decoding only the overlapping blocks.
+    def read_range(self, startTime, endTime, channels = None):
+        timestamps, samples = self.read_blocks(self.blocks_in_range(startTime, endTime), channels)
+        keep = (timestamps >= startTime) & (timestamps <= endTime)
+        return timestamps[keep], samples[keep]
+
+    def read_eeg(self, channels = None):
+        return self.read_blocks(range(len(self.blockCounts)), channels)
+
+    # Returns (timestamps, markers, delays) of all key markers.
+    def read_markers(self):
+        markers = self.index['markers']
+        count = markers['count']
+        data = zlib.decompress(self.read_bytes(markers['offset'], markers['size']))
+        sizes = [count * np.dtype(dtype).itemsize for dtype in (TIMESTAMP_DTYPE, MARKER_DTYPE)]
+        return (np.frombuffer(data, dtype=TIMESTAMP_DTYPE, count=count),
+                np.frombuffer(data, dtype=MARKER_DTYPE, count=count, offset=sizes[0]),
+                np.frombuffer(data, dtype=DELAY_DTYPE, count=count, offset=sizes[0] + sizes[1]))
+
+    def close(self):
+        self.file.close()
+
+# Loads a whole archived session as (dfMrk, dfEEG), like helpers.load_binary_session.
+def load_archive_session(path, channels = None):
+    reader = ArchiveReader(path)
+    timestamps, samples = reader.read_eeg(channels)
+    mrkTimestamps, mrkMarkers, mrkDelays = reader.read_markers()
+    reader.close()
+    dfEEG = pd.DataFrame(samples, columns=reader.channels if channels is None else list(channels), copy=False)
+    dfEEG.insert(0, 'timestamp', timestamps)
+    dfMrk = pd.DataFrame({'timestamp': mrkTimestamps, 'key marker': mrkMarkers, 'queue delay': mrkDelays})
+    return dfMrk, dfEEG
+
+def read_archive_header(path):
+    reader = ArchiveReader(path)
+    reader.close()
+    return reader.header
+
+# Files a session consists of, given its file base.
+def session_source_files(fileBase):
+    files = [fileBase + suffix for suffix in ('_EEG.csv', '_MRK.csv', Constants.BINARY_SESSION_EXTENSION)]
+    return [file for file in files if os.path.exists(file)]
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+def remove_files(files):
+    for file in files:
+        if os.path.isdir(file):
+            shutil.rmtree(file)
+        else:
+            os.remove(file)
+
+# Decodes every block of the archive and compares it with the data it was written from, block by block so a memory
+# mapped source is never loaded whole. Returns False on any difference (NaN equal to NaN).
+def verify_archive(path, eegSamples, eegTimestamps, mrkTimestamps, mrkMarkers, mrkDelays = None):
+    reader = ArchiveReader(path)
+    try:
+        start = 0
+        for block in range(len(reader.blockCounts)):
+            timestamps, samples = reader.read_block(block)
+            end = start + len(timestamps)
+            if not (np.array_equal(timestamps, np.asarray(eegTimestamps[start:end], dtype=TIMESTAMP_DTYPE), equal_nan=True) and
+                    np.array_equal(samples, np.asarray(eegSamples[start:end], dtype=SAMPLES_DTYPE), equal_nan=True)):
+                return False
+            start = end
+        if start != len(eegTimestamps):
+            return False
+        timestamps, markers, delays = reader.read_markers()
+        if mrkDelays is None:
+            mrkDelays = np.full(len(mrkTimestamps), np.nan)
+        return (np.array_equal(timestamps, np.asarray(mrkTimestamps, dtype=TIMESTAMP_DTYPE), equal_nan=True) and
+                np.array_equal(markers, np.asarray(mrkMarkers).astype(str)) and
+                np.array_equal(delays, np.asarray(mrkDelays, dtype=DELAY_DTYPE), equal_nan=True))
+    finally:
+        reader.close()
+
+# Archives one session (from its binary session if there is one, its CSV files otherwise) into "<fileBase>.keega".
+# Before the source files are removed, the whole archive is decoded and compared with them. Returns (path, source
+# bytes, archive bytes).
+def archive_session(fileBase, removeSources = False, overwrite = False):
+    path = fileBase + Constants.ARCHIVE_EXTENSION
+    sources = session_source_files(fileBase)
+    sourceSize = sum(path_size(file) for file in sources)
+    if os.path.exists(path) and not overwrite:
+        return path, sourceSize, None
+    binaryFile = fileBase + Constants.BINARY_SESSION_EXTENSION
+    if os.path.isdir(binaryFile):
+        session = open_binary_session(binaryFile)
+        header = session['header']
+        eegSamples, eegTimestamps = session['eegSamples'], session['eegTimestamps']
+        mrkTimestamps, mrkMarkers, mrkDelays = session['mrkTimestamps'], session['mrkMarkers'], session['mrkDelays']
+    else:
+        user, mode, startDateTime, finishDateTime = helpers.parse_session_name(ntpath.basename(fileBase))
+        dfMrk, dfEEG = helpers.load_csv_session(fileBase + '_MRK.csv')
+        dfMrk = dfMrk.dropna(subset=['timestamp', 'key marker'])
+        header = make_header(user, mode, dfEEG.columns[1:], startDateTime.timestamp(), finishDateTime.timestamp())
+        header['eeg']['count'], header['markers']['count'] = len(dfEEG), len(dfMrk)
+        eegSamples, eegTimestamps = dfEEG.iloc[:, 1:].to_numpy(dtype=np.float32), dfEEG['timestamp'].to_numpy()
+        mrkTimestamps, mrkMarkers = dfMrk['timestamp'].to_numpy(), dfMrk['key marker'].to_numpy(dtype=str)
+        mrkDelays = dfMrk['queue delay'].to_numpy() if 'queue delay' in dfMrk.columns else None
+    write_archive(path, header, eegSamples, eegTimestamps, mrkTimestamps, mrkMarkers, mrkDelays)
+    if removeSources:
+        if not verify_archive(path, eegSamples, eegTimestamps, mrkTimestamps, mrkMarkers, mrkDelays):
+            raise IOError('Archive check failed, kept the session files: {0}'.format(path))
+        remove_files(sources)
+    return path, sourceSize, os.path.getsize(path)
+
+# Restores "<fileBase>.keeg" (and / or the CSV files) from an archive. Returns the list of restored files.
+def unarchive_session(path, formats = ('binary',), removeArchive = False, overwrite = False):
+    fileBase = path[:-len(Constants.ARCHIVE_EXTENSION)]
+    reader = ArchiveReader(path)
+    timestamps, samples = reader.read_eeg()
+    mrkTimestamps, mrkMarkers, mrkDelays = reader.read_markers()
+    reader.close()
+    header = dict(reader.header, eeg=dict(reader.header['eeg'], count=0), markers=dict(reader.header['markers'], count=0))
+    files = []
+    if 'binary' in formats and (overwrite or not os.path.exists(fileBase + Constants.BINARY_SESSION_EXTENSION)):
+        write_binary_session(fileBase + Constants.BINARY_SESSION_EXTENSION, header, samples, timestamps, mrkTimestamps, mrkMarkers, mrkDelays)
+        files.append(fileBase + Constants.BINARY_SESSION_EXTENSION)
+    if 'csv' in formats and (overwrite or not os.path.exists(fileBase + '_MRK.csv')):
+        dfEEG = pd.DataFrame(samples, columns=reader.channels)
+        dfEEG.insert(0, 'timestamp', timestamps)
+        dfEEG.to_csv(fileBase + '_EEG.csv', index=False)
+        pd.DataFrame({'timestamp': mrkTimestamps, 'key marker': mrkMarkers, 'queue delay': mrkDelays}).to_csv(fileBase + '_MRK.csv', index=False)
+        files.extend([fileBase + '_EEG.csv', fileBase + '_MRK.csv'])
+    if removeArchive:
+        os.remove(path)
+    return files
+
+# Runs task(item, *args) for every item on a process pool and yields (item, result or exception) as they complete.
+def run_parallel(task, items, args = (), maxWorkers = None):
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {executor.submit(task, item, *args): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
@@ -0,0 +1,160 @@
+import os
+import glob
+import json
+import ntpath
+import sqlite3
+import threading
+import helpers
+from binary_session import read_header
+import session_archive
+from constants import Constants
+
+# Persistent SQLite index of every saved session, stored at "<rootFolder>/<SESSION_CATALOG_FILE_NAME>".
+# Sessions are added by the SessionWriter when they are saved, so user/mode/time range lookups never walk the folder tree.
+# File paths are stored relative to rootFolder.
+class SessionCatalog:
+    def __init__(self, rootFolder = 'session_data', fileName = Constants.SESSION_CATALOG_FILE_NAME):
+        self.rootFolder = rootFolder
+        self.path = os.path.join(rootFolder, fileName)
+        helpers.ensure_dir(self.path)
+        isNew = not os.path.isfile(self.path)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+        if isNew:
+            self.rebuild()
+
+    def create_tables(self):
+        with self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                user TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                startTime REAL NOT NULL,
+                finishTime REAL NOT NULL,
+                eegSampleCount INTEGER,
+                markerCount INTEGER,
+                channels TEXT,
+                eegFile TEXT,
+                mrkFile TEXT,
+                binaryFile TEXT,
+                archiveFile TEXT,
+                PRIMARY KEY (user, mode, startTime))''')
+            # Catalogs created before session archives lack the archiveFile column.
+            columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(sessions)')]
+            if 'archiveFile' not in columns:
+                self.connection.execute('ALTER TABLE sessions ADD COLUMN archiveFile TEXT')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sessions_mode_time ON sessions (mode, startTime, finishTime)')
+
+    def relative_path(self, path):
+        return None if path is None else os.path.relpath(path, self.rootFolder)
+
+    def absolute_path(self, path):
+        return None if path is None else os.path.join(self.rootFolder, path)
+
+    # Adds or replaces a session. Paths not given keep their previous value, so CSV and binary files can be added separately.
+    # An entry of the same files under another start time is the same session (the file name only has whole seconds,
+    # e.g. when indexed from its files and then added by the SessionWriter) and is replaced.
+    def add_session(self, user, mode, startTime, finishTime, eegSampleCount, markerCount, channels, eegFile = None, mrkFile = None, binaryFile = None,
+                    archiveFile = None):
+        files = [self.relative_path(file) for file in (eegFile, mrkFile, binaryFile, archiveFile) if file is not None]
+        with self.lock, self.connection:
+            if files:
+                places = ', '.join('?' * len(files))
+                self.connection.execute('''DELETE FROM sessions WHERE user = ? AND mode = ? AND startTime != ? AND
+                    (eegFile IN ({0}) OR mrkFile IN ({0}) OR binaryFile IN ({0}) OR archiveFile IN ({0}))'''.format(places),
+                    [user, mode.name, startTime] + files * 4)
+            self.connection.execute('''INSERT INTO sessions (user, mode, startTime, finishTime, eegSampleCount, markerCount, channels,
+                    eegFile, mrkFile, binaryFile, archiveFile) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user, mode, startTime) DO UPDATE SET
+                    finishTime = excluded.finishTime,
+                    eegSampleCount = excluded.eegSampleCount,
+                    markerCount = excluded.markerCount,
+                    channels = excluded.channels,
+                    eegFile = COALESCE(excluded.eegFile, eegFile),
+                    mrkFile = COALESCE(excluded.mrkFile, mrkFile),
+                    binaryFile = COALESCE(excluded.binaryFile, binaryFile),
+                    archiveFile = COALESCE(excluded.archiveFile, archiveFile)''',
+                (user, mode.name, startTime, finishTime, eegSampleCount, markerCount, json.dumps(list(channels)),
+                 self.relative_path(eegFile), self.relative_path(mrkFile), self.relative_path(binaryFile), self.relative_path(archiveFile)))
+
+    def remove_session(self, user, mode, startTime):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sessions WHERE user = ? AND mode = ? AND startTime = ?', (user, mode.name, startTime))
+
+    # Removes the session stored under fileBase (whichever of its files is indexed).
+    def remove_file_base(self, fileBase):
+        files = [self.relative_path(fileBase + suffix) for suffix in ('_EEG.csv', '_MRK.csv', Constants.BINARY_SESSION_EXTENSION, Constants.ARCHIVE_EXTENSION)]
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sessions WHERE eegFile = ? OR mrkFile = ? OR binaryFile = ? OR archiveFile = ?', files)
+
+    # Returns a list of session dicts, user and mode may be None to match all. Start/end are datetimes.
+    def find_sessions(self, user = None, mode = None, startDateTime = None, endDateTime = None):
+        query = 'SELECT * FROM sessions WHERE 1 = 1'
+        params = []
+        if user is not None:
+            query += ' AND user = ?'
+            params.append(user)
+        if mode is not None:
+            query += ' AND mode = ?'
+            params.append(mode.name)
+        if startDateTime is not None:
+            query += ' AND startTime >= ?'
+            params.append(helpers.datetime_to_timestamp(startDateTime))
+        if endDateTime is not None:
+            query += ' AND finishTime <= ?'
+            params.append(helpers.datetime_to_timestamp(endDateTime))
+        query += ' ORDER BY user, mode, startTime'
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [self.row_to_session(row) for row in rows]
+
+    def row_to_session(self, row):
+        session = dict(row)
+        session['channels'] = json.loads(session['channels']) if session['channels'] else []
+        for key in ('eegFile', 'mrkFile', 'binaryFile', 'archiveFile'):
+            session[key] = self.absolute_path(session[key])
+        if session['binaryFile'] is not None:
+            session['id'] = ntpath.basename(session['binaryFile'])[:-len(Constants.BINARY_SESSION_EXTENSION)]
+        elif session['archiveFile'] is not None:
+            session['id'] = ntpath.basename(session['archiveFile'])[:-len(Constants.ARCHIVE_EXTENSION)]
+        else:
+            session['id'] = ntpath.basename(session['mrkFile'])[:-len('_MRK.csv')]
+        return session
+
+    # Re-indexes every session found under rootFolder, used to seed the catalog from existing data.
+    def rebuild(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sessions')
+        for modeFolder in glob.iglob(os.path.join(self.rootFolder, '*', '*')):
+            for fileBase, filePath in helpers.find_sessions(modeFolder).items():
+                self.index_session(fileBase)
+
+    # Adds the session stored under fileBase, replacing its previous entry. Entries are matched by file base rather than
+    # start time: the SessionWriter catalogs the exact start time, the file name only has whole seconds. Files that were
+    # removed (e.g. after archiving) are no longer listed.
+    def index_session(self, fileBase):
+        self.remove_file_base(fileBase)
+        user, mode, startDateTime, finishDateTime = helpers.parse_session_name(ntpath.basename(fileBase))
+        startTime, finishTime = startDateTime.timestamp(), finishDateTime.timestamp()
+        eegFile, mrkFile, binaryFile = fileBase + '_EEG.csv', fileBase + '_MRK.csv', fileBase + Constants.BINARY_SESSION_EXTENSION
+        archiveFile = fileBase + Constants.ARCHIVE_EXTENSION
+        if not os.path.isfile(archiveFile):
+            archiveFile = None
+        if os.path.isdir(binaryFile) or archiveFile is not None:
+            header = read_header(binaryFile) if os.path.isdir(binaryFile) else session_archive.read_archive_header(archiveFile)
+            channels, eegSampleCount, markerCount = header['channels'], header['eeg']['count'], header['markers']['count']
+            startTime, finishTime = header['startTime'], header['finishTime']
+            if not os.path.isdir(binaryFile):
+                binaryFile = None
+        else:
+            binaryFile = None
+            channels, eegSampleCount = helpers.read_csv_header_and_count(eegFile)
+            channels = channels[1:]
+            markerCount = helpers.read_csv_header_and_count(mrkFile)[1]
+        if not os.path.isfile(mrkFile):
+            eegFile, mrkFile = None, None
+        self.add_session(user, mode, startTime, finishTime, eegSampleCount, markerCount, channels, eegFile, mrkFile, binaryFile, archiveFile)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,87 @@
+import os
+import json
+import zlib
+import struct
+import numpy as np
+from time import perf_counter
+from binary_session import TIMESTAMP_DTYPE, SAMPLES_DTYPE
+from constants import Constants
+
+# Append-only write-ahead log of a session being recorded, "<user>_<mode>_<start>.wal" next to its part files.
+# The SessionWriter appends every EEG chunk and key marker as it arrives and fsyncs the log at most every
+# SESSION_LOG_FSYNC_INTERVAL seconds, so a crash loses at most that much data. The log is removed once the session files
+# are saved, a log left behind belongs to a session that never finished and session_writer.recover_session rebuilds it.
+# Each record is a type tag, payload size and CRC32 followed by the payload, a torn write at the end of the log (the
+# crash) fails its size / CRC check and everything before it is recovered.
+#   HDR - JSON: user, mode, channels, startTime, formats, rootFolder, folder, index.
+#   EEG - uint32 sample count, float64 timestamps, float32 samples (row per sample).
+#   MRK - float64 timestamp, float32 queue delay, UTF-8 key marker.
+RECORD = struct.Struct('<4sII')
+EEG_COUNT = struct.Struct('<I')
+MARKER = struct.Struct('<df')
+
+class SessionLog:
+    def __init__(self, path, header, fsyncInterval = Constants.SESSION_LOG_FSYNC_INTERVAL):
+        self.path = path
+        self.fsyncInterval = fsyncInterval
+        self.file = open(path, 'wb')
+        self.append(b'HDR\0', json.dumps(header).encode('utf-8'))
+        self.sync()
+
+    def append(self, tag, payload):
+        self.file.write(RECORD.pack(tag, len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.pending = True
+
+    def append_eeg(self, samples, timestamps):
+        self.append(b'EEG\0', EEG_COUNT.pack(len(timestamps)) + np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE).tobytes() +
+                    np.ascontiguousarray(samples, dtype=SAMPLES_DTYPE).tobytes())
+
+    def append_marker(self, timestamp, marker, queueDelay):
+        self.append(b'MRK\0', MARKER.pack(timestamp, queueDelay) + str(marker).encode('utf-8'))
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = False
+        self.lastSync = perf_counter()
+
+    # Syncs when there are unsynced records and the last sync is fsyncInterval old, called for every record batch.
+    def sync_due(self):
+        if self.pending and perf_counter() - self.lastSync >= self.fsyncInterval:
+            self.sync()
+
+    def close(self, remove = False):
+        if not self.file.closed:
+            self.file.close()
+        if remove:
+            os.remove(self.path)
+
+# Reads every intact record of a log. Returns (header, eegChunks [(samples, timestamps)], markers [(timestamp, marker,
+# queue delay)], validBytes), validBytes is where the first torn / corrupt record starts (the log size if none).
+def read_log(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    header, eegChunks, markers = None, [], []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        tag, size, crc = RECORD.unpack_from(data, offset)
+        payload = data[offset + RECORD.size:offset + RECORD.size + size]
+        if len(payload) != size or zlib.crc32(payload) != crc:
+            break
+        if tag == b'HDR\0':
+            header = json.loads(payload.decode('utf-8'))
+        elif tag == b'EEG\0':
+            count = EEG_COUNT.unpack_from(payload)[0]
+            timestamps = np.frombuffer(payload, dtype=TIMESTAMP_DTYPE, count=count, offset=EEG_COUNT.size)
+            samples = np.frombuffer(payload, dtype=SAMPLES_DTYPE, offset=EEG_COUNT.size + timestamps.nbytes).reshape(count, len(header['channels']))
+            eegChunks.append((samples, timestamps))
+        elif tag == b'MRK\0':
+            timestamp, queueDelay = MARKER.unpack_from(payload)
+            markers.append((timestamp, payload[MARKER.size:].decode('utf-8'), queueDelay))
+        else:
+            break
+        offset += RECORD.size + size
+    if header is None:
+        raise ValueError('Not a session log or header lost: {0}'.format(path))
+    return header, eegChunks, markers, offset
@@ -0,0 +1,256 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import session_catalog
+from binary_session import open_binary_session, EEG_TIMESTAMP_FILE, SAMPLES_DTYPE, TIMESTAMP_DTYPE
+from session_archive import ArchiveReader
+from constants import Constants
+
+# Reads only the parts of sessions that are needed: the EEG samples of some time ranges, e.g. the windows around key
+# markers for epoching, instead of whole sessions.
+# Every session format is split into blocks of consecutive rows with a sorted index of each block's first / last
+# timestamp (min / max), so the blocks overlapping the requested windows are found with a binary search:
+#   binary sessions - QUERY_BLOCK_SIZE rows, index cached as "eeg_index.npz" in the session folder. Only the timestamps
+#                     of the selected blocks and the sample rows inside the windows are read from the memory mapped columns.
+#   CSV sessions    - QUERY_BLOCK_SIZE rows, with the byte offset of each block in the "_EEG.csv.idx.npz" sidecar, the
+#                     selected byte ranges are read and parsed on their own.
+#   archives        - the archive's own compressed blocks and block index (see session_archive).
+# Indexes are built on first use and rebuilt when their session file changed. Results have the same layout as
+# helpers.load_sessions, so they can go straight to epoching.
+BINARY_INDEX_FILE = 'eeg_index.npz'
+CSV_INDEX_SUFFIX = '.idx.npz'
+
+def file_version(path):
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def load_index(path, version, blockSize):
+    try:
+        with np.load(path, allow_pickle=False) as index:
+            if int(index['blockSize']) == blockSize and np.array_equal(index['version'], version):
+                return {name: index[name] for name in index.files}
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+# Writes the index next to the session, sessions on read-only media are simply indexed again next time.
+def save_index(path, index):
+    try:
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, **index)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+
+# First / last (min / max) value of every block of blockSize values.
+def block_bounds(values, blockSize):
+    starts = np.arange(0, len(values), blockSize)
+    if len(starts) == 0:
+        return np.empty(0), np.empty(0)
+    return np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+class BinarySource:
+    def __init__(self, path, blockSize = Constants.QUERY_BLOCK_SIZE):
+        session = open_binary_session(path)
+        self.session = session
+        self.channels = session['header']['channels']
+        self.timestamps = session['eegTimestamps']
+        self.samples = session['eegSamples']
+        self.blockSize = blockSize
+        indexPath = os.path.join(path, BINARY_INDEX_FILE)
+        version = np.append(file_version(os.path.join(path, EEG_TIMESTAMP_FILE)), len(self.timestamps))
+        index = load_index(indexPath, version, blockSize)
+        if index is None:
+            starts, ends = block_bounds(np.asarray(self.timestamps), blockSize)
+            index = {'blockSize': blockSize, 'version': version, 'starts': starts, 'ends': ends}
+            save_index(indexPath, index)
+        self.blockStarts, self.blockEnds = index['starts'], index['ends']
+
+    # The window filter is applied to the timestamps first, so only the sample rows that are kept are read.
+    def read_blocks(self, blocks, columns, keep):
+        rows = (np.asarray(blocks)[:, None] * self.blockSize + np.arange(self.blockSize)).ravel()
+        rows = rows[rows < len(self.timestamps)]
+        timestamps = np.asarray(self.timestamps[rows])
+        kept = keep(timestamps)
+        if not kept.any():
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty((0, len(columns)), dtype=SAMPLES_DTYPE)
+        return timestamps[kept], np.asarray(self.samples[rows[kept]])[:, columns]
+
+    def read_markers(self):
+        session = self.session
+        return pd.DataFrame({'timestamp': session['mrkTimestamps'], 'key marker': session['mrkMarkers'], 'queue delay': session['mrkDelays']})
+
+    def close(self):
+        pass
+
+class CsvSource:
+    def __init__(self, eegFile, mrkFile, blockSize = Constants.QUERY_BLOCK_SIZE):
+        self.eegFile = eegFile
+        self.mrkFile = mrkFile
+        with open(eegFile, 'r') as file:
+            self.columns = file.readline().strip().split(',')
+        self.channels = self.columns[1:]
+        indexPath = eegFile + CSV_INDEX_SUFFIX
+        version = file_version(eegFile)
+        index = load_index(indexPath, version, blockSize)
+        if index is None:
+            index = self.build_index(blockSize)
+            index['version'] = version
+            save_index(indexPath, index)
+        self.offsets = index['offsets']
+        self.blockStarts, self.blockEnds = index['starts'], index['ends']
+        self.file = open(eegFile, 'rb')
+
+    # One pass over the file: byte offsets of the data rows (non-blank lines after the header) and their timestamps.
+    def build_index(self, blockSize):
+        data = np.memmap(self.eegFile, dtype=np.uint8, mode='r')
+        newlines = np.flatnonzero(data == ord('\n'))
+        lineStarts = np.concatenate(([0], newlines + 1))
+        lineEnds = np.concatenate((newlines, [len(data)]))
+        lengths = lineEnds - lineStarts
+        blank = lengths == 0
+        blank[lengths == 1] = data[lineStarts[lengths == 1]] == ord('\r')
+        rowStarts = lineStarts[~blank][1:]
+        del data
+        timestamps = pd.read_csv(self.eegFile, usecols=['timestamp'], float_precision='round_trip')['timestamp'].to_numpy()
+        if len(timestamps) != len(rowStarts):
+            raise ValueError('Cannot index {0}: {1} rows but {2} timestamps.'.format(self.eegFile, len(rowStarts), len(timestamps)))
+        starts, ends = block_bounds(timestamps, blockSize)
+        offsets = np.append(rowStarts[::blockSize], os.path.getsize(self.eegFile))
+        return {'blockSize': blockSize, 'offsets': offsets, 'starts': starts, 'ends': ends}
+
+    # Consecutive blocks are read and parsed as one byte range.
+    def read_blocks(self, blocks, columns, keep):
+        blocks = np.asarray(blocks)
+        runs = np.split(blocks, np.flatnonzero(np.diff(blocks) != 1) + 1) if len(blocks) > 0 else []
+        frames = []
+        for run in runs:
+            start, end = self.offsets[run[0]], self.offsets[run[-1] + 1]
+            self.file.seek(start)
+            frames.append(pd.read_csv(io.BytesIO(self.file.read(end - start)), header=None, names=self.columns, float_precision='round_trip'))
+        if not frames:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty((0, len(columns)), dtype=SAMPLES_DTYPE)
+        frame = pd.concat(frames, ignore_index=True)
+        timestamps = frame['timestamp'].to_numpy()
+        rows = keep(timestamps)
+        return timestamps[rows], frame.iloc[:, 1:].to_numpy(dtype=np.float32)[rows][:, columns]
+
+    def read_markers(self):
+        return pd.read_csv(self.mrkFile, float_precision='round_trip', dtype={'key marker': str})
+
+    def close(self):
+        self.file.close()
+
+class ArchiveSource:
+    def __init__(self, path):
+        self.reader = ArchiveReader(path)
+        self.channels = self.reader.channels
+        self.blockStarts, self.blockEnds = self.reader.blockStarts, self.reader.blockEnds
+
+    def read_blocks(self, blocks, columns, keep):
+        timestamps, samples = self.reader.read_blocks(blocks, [self.channels[column] for column in columns])
+        rows = keep(timestamps)
+        return timestamps[rows], samples[rows]
+
+    def read_markers(self):
+        timestamps, markers, delays = self.reader.read_markers()
+        return pd.DataFrame({'timestamp': timestamps, 'key marker': markers, 'queue delay': delays})
+
+    def close(self):
+        self.reader.close()
+
+# Opens a catalog session in its fastest format (see helpers.session_file).
+def open_source(session):
+    if session['binaryFile'] is not None:
+        return BinarySource(session['binaryFile'])
+    if session['archiveFile'] is not None:
+        return ArchiveSource(session['archiveFile'])
+    return CsvSource(session['eegFile'], session['mrkFile'])
+
+# Sorts the windows and merges overlapping ones, returns disjoint sorted (starts, ends).
+def merge_windows(starts, ends):
+    starts, ends = np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    first = np.concatenate(([0], np.flatnonzero(starts[1:] > ends[:-1]) + 1))
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return starts[first], ends[last]
+
+# Masks the [lows, highs] intervals (single values when highs is None) that overlap any of the merged windows.
+def overlaps_windows(starts, ends, lows, highs = None):
+    highs = lows if highs is None else highs
+    index = np.searchsorted(ends, lows, 'left')
+    inside = index < len(ends)
+    inside[inside] = starts[index[inside]] <= highs[inside]
+    return inside
+
+# Returns (dfMrk, dfEEG) of one session with only the EEG samples and markers inside the given windows.
+# With starts None the windows are [marker - preSeconds, marker + postSeconds] around each of the session's key markers.
+def query_session(session, starts = None, ends = None, channels = None, preSeconds = 0.0, postSeconds = 0.0):
+    source = open_source(session)
+    try:
+        dfMrk = source.read_markers()
+        if starts is None:
+            markerTimestamps = dfMrk['timestamp'].to_numpy(dtype=np.float64)
+            markerTimestamps = markerTimestamps[np.isfinite(markerTimestamps)]
+            starts, ends = markerTimestamps - preSeconds, markerTimestamps + postSeconds
+        else:
+            starts, ends = np.asarray(starts, dtype=np.float64) - preSeconds, np.asarray(ends, dtype=np.float64) + postSeconds
+        starts, ends = merge_windows(starts, ends)
+        channels = source.channels if channels is None else list(channels)
+        columns = [source.channels.index(channel) for channel in channels]
+        blocks = np.flatnonzero(overlaps_windows(starts, ends, source.blockStarts, source.blockEnds))
+        timestamps, samples = source.read_blocks(blocks, columns, lambda values: overlaps_windows(starts, ends, values))
+    finally:
+        source.close()
+    dfEEG = pd.DataFrame(samples, columns=channels, copy=False)
+    dfEEG.insert(0, 'timestamp', timestamps)
+    dfMrk = dfMrk[overlaps_windows(starts, ends, dfMrk['timestamp'].to_numpy(dtype=np.float64))].reset_index(drop=True)
+    dfMrk.insert(0, 'session', session['id'])
+    dfEEG.insert(0, 'session', session['id'])
+    return dfMrk, dfEEG
+
+# Queries sessions in parallel (threads, the readers release the GIL) and concatenates them like helpers.load_sessions.
+def query_sessions(sessions, starts = None, ends = None, channels = None, preSeconds = 0.0, postSeconds = 0.0, maxWorkers = None):
+    if len(sessions) == 0:
+        return pd.DataFrame(columns=['session', 'timestamp', 'key marker']), pd.DataFrame(columns=['session', 'timestamp'] + list(channels or []))
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        frames = list(executor.map(lambda session: query_session(session, starts, ends, channels, preSeconds, postSeconds), sessions))
+    sessionIds = [session['id'] for session in sessions]
+    dfMrk = pd.concat([frame[0] for frame in frames], ignore_index=True)
+    dfEEG = pd.concat([frame[1] for frame in frames], ignore_index=True)
+    dfMrk['session'] = pd.Categorical(dfMrk['session'], categories=sessionIds)
+    dfEEG['session'] = pd.Categorical(dfEEG['session'], categories=sessionIds)
+    return dfMrk, dfEEG
+
+# Catalog sessions of user / mode (None matches all) recorded at any time during [startTime, endTime] (Unix seconds).
+def find_sessions(user, mode, startTime = float('-inf'), endTime = float('inf'), rootFolder = 'session_data'):
+    catalog = session_catalog.SessionCatalog(rootFolder)
+    sessions = catalog.find_sessions(user, mode)
+    catalog.close()
+    return [session for session in sessions if session['startTime'] <= endTime and session['finishTime'] >= startTime]
+
+# EEG samples and markers of the user's sessions between startTime and endTime (Unix seconds).
+def query_time_range(user, mode, startTime, endTime, channels = None, rootFolder = 'session_data', maxWorkers = None):
+    sessions = find_sessions(user, mode, startTime, endTime, rootFolder)
+    return query_sessions(sessions, [startTime], [endTime], channels, maxWorkers=maxWorkers)
+
+# EEG samples in [marker - preSeconds, marker + postSeconds] around the given marker timestamps, or around every key
+# marker of the user's sessions when markerTimestamps is None.
+def query_marker_windows(user, mode, markerTimestamps = None, preSeconds = Constants.EPOCH_PRE_SECONDS, postSeconds = Constants.EPOCH_POST_SECONDS,
+                         channels = None, rootFolder = 'session_data', maxWorkers = None):
+    if markerTimestamps is None:
+        return query_sessions(find_sessions(user, mode, rootFolder=rootFolder), None, None, channels, preSeconds, postSeconds, maxWorkers)
+    markerTimestamps = np.asarray(markerTimestamps, dtype=np.float64)
+    if len(markerTimestamps) == 0:
+        return query_sessions([], channels=channels)
+    sessions = find_sessions(user, mode, markerTimestamps.min() - preSeconds, markerTimestamps.max() + postSeconds, rootFolder)
+    return query_sessions(sessions, markerTimestamps, markerTimestamps, channels, preSeconds, postSeconds, maxWorkers)
+
+# Loads what epoching the sessions' keystrokes needs, the windows get QUERY_WINDOW_MARGIN on both sides.
+def load_epoch_windows(sessions, preSeconds = Constants.EPOCH_PRE_SECONDS, postSeconds = Constants.EPOCH_POST_SECONDS, channels = None, maxWorkers = None):
+    return query_sessions(sessions, None, None, channels, preSeconds + Constants.QUERY_WINDOW_MARGIN, postSeconds + Constants.QUERY_WINDOW_MARGIN, maxWorkers)
@@ -0,0 +1,209 @@
+import os
+import glob
+import json
+import shutil
+import queue
+import threading
+import datetime
+import numpy as np
+import pandas as pd
+import helpers
+from binary_session import BinarySessionWriter, make_header
+from session_catalog import SessionCatalog
+from session_log import SessionLog, read_log
+from password_types import PasswordTypes
+from constants import Constants
+
+# Streams EEG chunks and key markers to disk in batches from a background thread.
+# Data goes to "<user>_<mode>_<start>_EEG.csv.part" / "_MRK.csv.part" (and/or "<user>_<mode>_<start>.keeg.part" for the
+# binary format) while recording, on close the files are renamed to the usual "<user>_<mode>_<start>_<finish>" session names.
+# folder overrides the default "<rootFolder>/<user>/<mode>" folder, sessions are only added to the catalog when index is set.
+# With log set every chunk and marker also goes to the session's write-ahead log (see session_log) as soon as the writer
+# thread dequeues it, so a crashed session can be recovered.
+class SessionWriter:
+    def __init__(self, user, mode, channelNames, startTime, rootFolder = 'session_data', formats = Constants.SESSION_FILE_FORMATS, catalog = None,
+                 folder = None, index = True, batchSize = Constants.SESSION_WRITER_BATCH_SIZE, flushInterval = Constants.SESSION_WRITER_FLUSH_INTERVAL,
+                 maxQueueSize = Constants.SESSION_WRITER_QUEUE_SIZE, log = True):
+        self.user = user
+        self.mode = mode
+        self.formats = formats
+        self.rootFolder = rootFolder
+        self.catalog = catalog
+        self.index = index
+        self.channelNames = channelNames
+        self.startTime = startTime
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.queue = queue.Queue(maxsize=maxQueueSize)
+        self.folder = folder if folder is not None else os.path.join(rootFolder, user, mode.name)
+        self.startTimeStr = datetime.datetime.fromtimestamp(startTime).strftime(Constants.SESSION_FILE_DATETIME_FORMAT)
+        self.eegPartFile = self.file_base() + '_EEG.csv.part'
+        self.mrkPartFile = self.file_base() + '_MRK.csv.part'
+        self.binaryPartFile = self.file_base() + Constants.BINARY_SESSION_EXTENSION + '.part'
+        self.eegSampleCount = 0
+        self.markerCount = 0
+        self.error = None
+        self.metadata = {} # Extra session information (e.g. the clock sync model), stored in the binary header and "<base>_INFO.json".
+        helpers.ensure_dir(self.eegPartFile)
+        if 'csv' in formats:
+            self.eegFile = open(self.eegPartFile, 'w', newline='')
+            self.mrkFile = open(self.mrkPartFile, 'w', newline='')
+            self.eegFile.write(','.join(['timestamp'] + channelNames) + '\n')
+            self.mrkFile.write('timestamp,key marker,queue delay\n')
+        if 'binary' in formats:
+            self.binaryWriter = BinarySessionWriter(self.binaryPartFile, make_header(user, mode, channelNames, startTime))
+        self.log = None
+        if log:
+            self.log = SessionLog(self.file_base() + Constants.SESSION_LOG_EXTENSION, {
+                'user': user, 'mode': mode.name, 'channels': list(channelNames), 'startTime': startTime, 'formats': list(formats),
+                'rootFolder': rootFolder, 'folder': self.folder, 'index': index})
+        self.thread = threading.Thread(target=self.run, name='SessionWriter', daemon=True)
+        self.thread.start()
+
+    def file_base(self, finishTimeStr = None):
+        parts = [self.user, self.mode.name, self.startTimeStr]
+        if finishTimeStr is not None:
+            parts.append(finishTimeStr)
+        return os.path.join(self.folder, '_'.join(parts))
+
+    def write_eeg(self, samples, timestamps):
+        if len(timestamps) > 0:
+            self.queue.put(('eeg', np.asarray(samples, dtype=np.float32), np.asarray(timestamps, dtype=np.float64)))
+
+    def write_marker(self, timestamp, marker, queueDelay = 0.0):
+        self.queue.put(('marker', timestamp, marker, queueDelay))
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def run(self):
+        pendingEEG = []
+        pendingMarkers = []
+        pendingCount = 0
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=self.flushInterval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                running = False
+            elif len(item) > 0 and item[0] == 'eeg':
+                pendingEEG.append(item[1:])
+                pendingCount += len(item[2])
+            elif len(item) > 0 and item[0] == 'marker':
+                pendingMarkers.append(item[1:])
+                pendingCount += 1
+            if self.log is not None and self.error is None:
+                try:
+                    self.write_log(item)
+                except Exception as e:
+                    self.error = e
+            if pendingCount > 0 and (not running or len(item) == 0 or pendingCount >= self.batchSize):
+                try:
+                    self.flush(pendingEEG, pendingMarkers)
+                except Exception as e:
+                    self.error = e
+                pendingEEG = []
+                pendingMarkers = []
+                pendingCount = 0
+
+    def write_log(self, item):
+        if item is not None and len(item) > 0 and item[0] == 'eeg':
+            self.log.append_eeg(item[1], item[2])
+        elif item is not None and len(item) > 0 and item[0] == 'marker':
+            self.log.append_marker(*item[1:])
+        self.log.sync_due()
+
+    def flush(self, pendingEEG, pendingMarkers):
+        if pendingEEG:
+            samples = np.concatenate([chunk[0] for chunk in pendingEEG])
+            timestamps = np.concatenate([chunk[1] for chunk in pendingEEG])
+            if 'csv' in self.formats:
+                eegFrame = pd.DataFrame(samples, columns=self.channelNames)
+                eegFrame.insert(0, 'timestamp', timestamps)
+                eegFrame.to_csv(self.eegFile, index=False, header=False)
+                self.eegFile.flush()
+            if 'binary' in self.formats:
+                self.binaryWriter.write_eeg(samples, timestamps)
+            self.eegSampleCount += len(timestamps)
+        if pendingMarkers:
+            if 'csv' in self.formats:
+                pd.DataFrame(pendingMarkers).to_csv(self.mrkFile, index=False, header=False)
+                self.mrkFile.flush()
+            if 'binary' in self.formats:
+                self.binaryWriter.write_markers([marker[0] for marker in pendingMarkers], [marker[1] for marker in pendingMarkers],
+                                                [marker[2] for marker in pendingMarkers])
+            self.markerCount += len(pendingMarkers)
+        if 'binary' in self.formats:
+            self.binaryWriter.flush()
+
+    # Flushes everything still queued, renames the part files using the session finish time and adds the session to the catalog.
+    # The write-ahead log is removed last, it stays behind if saving fails. Returns the list of finished session files.
+    def close(self, finishTime):
+        self.queue.put(None)
+        self.thread.join()
+        if 'csv' in self.formats:
+            self.eegFile.close()
+            self.mrkFile.close()
+        if 'binary' in self.formats:
+            self.binaryWriter.header.update(self.metadata)
+            self.binaryWriter.close(finishTime)
+        if self.error is not None:
+            raise self.error
+        finishTimeStr = datetime.datetime.fromtimestamp(finishTime).strftime(Constants.SESSION_FILE_DATETIME_FORMAT)
+        fileBase = self.file_base(finishTimeStr)
+        eegFile, mrkFile, binaryFile = None, None, None
+        if 'csv' in self.formats:
+            eegFile, mrkFile = fileBase + '_EEG.csv', fileBase + '_MRK.csv'
+            os.replace(self.eegPartFile, eegFile)
+            os.replace(self.mrkPartFile, mrkFile)
+        if 'binary' in self.formats:
+            binaryFile = fileBase + Constants.BINARY_SESSION_EXTENSION
+            os.replace(self.binaryPartFile, binaryFile)
+        infoFile = None
+        if self.metadata:
+            infoFile = fileBase + '_INFO.json'
+            with open(infoFile, 'w') as file:
+                json.dump(self.metadata, file, indent=2)
+        if self.index:
+            catalog = self.catalog if self.catalog is not None else SessionCatalog(self.rootFolder)
+            catalog.add_session(self.user, self.mode, self.startTime, finishTime, self.eegSampleCount, self.markerCount,
+                                self.channelNames, eegFile, mrkFile, binaryFile)
+            if self.catalog is None:
+                catalog.close()
+        if self.log is not None:
+            self.log.close(remove=True)
+        return [file for file in (eegFile, mrkFile, binaryFile, infoFile) if file is not None]
+
+# Write-ahead logs of sessions that never finished (crashed). Logs modified in the last minAge seconds may belong to a
+# session that is still recording and are skipped.
+def find_orphaned_logs(rootFolder = 'session_data', minAge = Constants.SESSION_LOG_ORPHAN_AGE):
+    paths = glob.glob(os.path.join(rootFolder, '**', '*' + Constants.SESSION_LOG_EXTENSION), recursive=True)
+    return sorted(path for path in paths if datetime.datetime.now().timestamp() - os.path.getmtime(path) >= minAge)
+
+# Rebuilds a normal session from a write-ahead log, in the formats that were being recorded unless formats is given.
+# The finish time is when the log was last written (its mtime): the logged timestamps may be in the stream's own clock
+# domain (e.g. pylsl.local_clock) rather than Unix time. The log and the crashed session's part files are removed once
+# the session is saved. Returns the list of saved files.
+def recover_session(logFile, formats = None):
+    header, eegChunks, markers, validBytes = read_log(logFile)
+    formats = tuple(formats or header['formats'])
+    writer = SessionWriter(header['user'], PasswordTypes[header['mode']], header['channels'], header['startTime'], header['rootFolder'], formats,
+                           folder=header['folder'], index=header['index'], log=False)
+    finishTime = max(header['startTime'], os.path.getmtime(logFile))
+    if eegChunks:
+        writer.write_eeg(np.concatenate([chunk[0] for chunk in eegChunks]), np.concatenate([chunk[1] for chunk in eegChunks]))
+    for timestamp, marker, queueDelay in markers:
+        writer.write_marker(timestamp, marker, queueDelay)
+    writer.metadata['recovered'] = {'log': os.path.basename(logFile), 'eegSamples': sum(len(chunk[1]) for chunk in eegChunks),
+                                    'markers': len(markers), 'discardedBytes': os.path.getsize(logFile) - validBytes}
+    files = writer.close(finishTime)
+    # Part files of formats that were recorded but not recovered.
+    for partFile in (writer.eegPartFile, writer.mrkPartFile, writer.binaryPartFile):
+        if os.path.isdir(partFile):
+            shutil.rmtree(partFile)
+        elif os.path.isfile(partFile):
+            os.remove(partFile)
+    os.remove(logFile)
+    return files
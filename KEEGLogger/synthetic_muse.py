@@ -0,0 +1,69 @@
+import threading
+import numpy as np
+from time import time, sleep
+from pylsl import StreamOutlet
+from lsl_outlets import muse_stream_info, ChunkPusher, MUSE_CHANNELS
+from constants import Constants
+
+# Synthetic EEG source publishing the same LSL stream as muse_helper.stream (name 'Muse', type 'EEG', Muse channel labels,
+# wall clock timestamps), so sessions and benchmarks can run without a Muse.
+# Samples are a 10 Hz alpha rhythm plus noise, pushed in chunks of chunkSize samples like the Muse BLE packets.
+#   jitter  - each chunk is pushed up to this many seconds late (timestamps stay on the nominal sample grid).
+#   dropout - probability that a chunk is lost, its samples are never pushed.
+#   speed   - time scale, e.g. 60 pushes a minute of data every second (for long session benchmarks).
+class SyntheticMuse:
+    def __init__(self, samplingRate = Constants.DEFAULT_SAMPLING_RATE, chunkSize = Constants.SYNTHETIC_CHUNK_SIZE, jitter = 0.0, dropout = 0.0,
+                 speed = 1.0, address = '00:00:00:00:00:00', seed = None):
+        self.samplingRate = samplingRate
+        self.chunkSize = chunkSize
+        self.jitter = jitter
+        self.dropout = dropout
+        self.speed = speed
+        self.random = np.random.default_rng(seed)
+        self.outlet = StreamOutlet(muse_stream_info(address, samplingRate), chunkSize)
+        self.pusher = ChunkPusher(self.outlet)
+        self.channelCount = len(MUSE_CHANNELS)
+        self.chunksPushed = 0
+        self.chunksDropped = 0
+        self.samplesPushed = 0
+        self.startTime = None
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.startTime = time()
+        self.thread = threading.Thread(target=self.run, name='SyntheticMuse', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    # Current time on the (sped up) stream clock, comparable to the sample timestamps.
+    def stream_time(self):
+        return self.startTime + (time() - self.startTime) * self.speed
+
+    def generate(self, timestamps):
+        alpha = 20 * np.sin(2 * np.pi * 10 * timestamps)[:, np.newaxis]
+        return (alpha + self.random.normal(0, 5, (len(timestamps), self.channelCount))).astype(np.float32)
+
+    def run(self):
+        chunkDuration = self.chunkSize / self.samplingRate
+        chunkIndex = 0
+        delay = self.random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        while not self.stopEvent.is_set():
+            # Push every chunk that is due, several per wake up at high speeds.
+            now = self.stream_time()
+            while self.startTime + (chunkIndex + 1) * chunkDuration + delay * self.speed <= now:
+                first = chunkIndex * self.chunkSize
+                timestamps = self.startTime + np.arange(first, first + self.chunkSize) / self.samplingRate
+                if self.dropout > 0 and self.random.random() < self.dropout:
+                    self.chunksDropped += 1
+                else:
+                    self.pusher.push(self.generate(timestamps), timestamps)
+                    self.chunksPushed += 1
+                    self.samplesPushed += self.chunkSize
+                chunkIndex += 1
+                delay = self.random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+            sleep(min(chunkDuration / self.speed, 0.01))
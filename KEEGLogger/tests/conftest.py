@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The KEEGLogger modules are imported by their bare names, as when running from the KEEGLogger folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+import os
+import json
+import numpy as np
+import helpers
+import session_query
+import session_archive
+from binary_session import make_header, write_binary_session, open_binary_session, HEADER_FILE, MRK_DELAY_FILE
+from password_types import PasswordTypes
+
+# Sessions written before marker delays were recorded (format version 1) have no delay column.
+def write_version_1_session(path):
+    header = make_header('user', PasswordTypes.PIN_FIXED_4, ['TP9', 'AF7'], 1510209290.0, 1510209300.0)
+    timestamps = 1510209290.0 + np.arange(1000) / 256.
+    write_binary_session(path, header, np.ones((1000, 2)), timestamps, timestamps[[100, 500]], ['1', '2'])
+    os.remove(os.path.join(path, MRK_DELAY_FILE))
+    with open(os.path.join(path, HEADER_FILE)) as file:
+        header = json.load(file)
+    header['version'] = 1
+    del header['markers']['delayDtype']
+    with open(os.path.join(path, HEADER_FILE), 'w') as file:
+        json.dump(header, file)
+    return timestamps
+
+def test_version_1_session_has_unknown_delays(tmp_path):
+    path = str(tmp_path / 'user_PIN_FIXED_4_2017-11-09-01-34-50_2017-11-09-01-35-00.keeg')
+    timestamps = write_version_1_session(path)
+    session = open_binary_session(path)
+    assert len(session['mrkDelays']) == 2 and np.isnan(session['mrkDelays']).all()
+    dfMrk, dfEEG = helpers.load_session(path)
+    assert dfMrk['key marker'].tolist() == ['1', '2']
+    assert dfMrk['queue delay'].isna().all()
+    session = {'id': 1, 'binaryFile': path, 'archiveFile': None, 'eegFile': None, 'mrkFile': None}
+    dfMrk, dfEEG = session_query.query_session(session, [timestamps[0]], [timestamps[100]])
+    assert len(dfEEG) == 101 and dfMrk['key marker'].tolist() == ['1']
+
+def test_version_1_session_archives(tmp_path):
+    fileBase = str(tmp_path / 'user_PIN_FIXED_4_2017-11-09-01-34-50_2017-11-09-01-35-00')
+    write_version_1_session(fileBase + '.keeg')
+    path = session_archive.archive_session(fileBase)[0]
+    dfMrk, dfEEG = session_archive.load_archive_session(path)
+    assert len(dfEEG) == 1000 and dfMrk['queue delay'].isna().all()
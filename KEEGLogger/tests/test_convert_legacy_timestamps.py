@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import convert_legacy_timestamps as migration
+from binary_session import make_header, write_binary_session, open_binary_session, EEG_TIMESTAMP_FILE
+from password_types import PasswordTypes
+
+LEGACY_START = 1510195475937.5 # Epoch milliseconds, EST.
+ROWS = 1000
+
+def expected_seconds(legacy):
+    return (legacy + migration.est_to_gmt_shift) / 1000.
+
+@pytest.fixture
+def legacy_sessions(tmp_path):
+    folder = tmp_path / 'user' / PasswordTypes.PIN_FIXED_4.name
+    folder.mkdir(parents=True)
+    legacy = LEGACY_START + np.arange(ROWS) * 4.0
+    eeg = pd.DataFrame({'timestamp': legacy, 'TP9': np.arange(ROWS, dtype=np.float32)})
+    eeg.to_csv(folder / 'user_PIN_FIXED_4_EEG.csv', index=False)
+    with open(folder / 'user_PIN_FIXED_4_MRK.csv', 'w') as file:
+        file.write('timestamp,key marker\n\n1510209290.0,1\n\n1510209291.0,2\n')
+    header = make_header('user', PasswordTypes.PIN_FIXED_4, ['TP9'], 0.0)
+    write_binary_session(str(folder / 'user_PIN_FIXED_4.keeg'), header, np.zeros((ROWS, 1)), legacy, [1510209290.0], ['1'])
+    return str(tmp_path), folder, legacy
+
+def binary_timestamps(folder):
+    return np.asarray(open_binary_session(str(folder / 'user_PIN_FIXED_4.keeg'))['eegTimestamps'])
+
+def test_converts_ms_est_to_sec_gmt(legacy_sessions):
+    rootFolder, folder, legacy = legacy_sessions
+    plan = migration.plan_migration(rootFolder, maxWorkers=1)
+    assert len(plan) == 3
+    migration.run_migration(plan, rootFolder, maxWorkers=1)
+    np.testing.assert_array_equal(binary_timestamps(folder), expected_seconds(legacy))
+    csv = pd.read_csv(folder / 'user_PIN_FIXED_4_EEG.csv', float_precision='round_trip')
+    np.testing.assert_array_equal(csv['timestamp'].to_numpy(), expected_seconds(legacy))
+    np.testing.assert_array_equal(csv['TP9'].to_numpy(), np.arange(ROWS))
+    markers = pd.read_csv(folder / 'user_PIN_FIXED_4_MRK.csv')
+    assert markers['timestamp'].tolist() == [1510209290.0, 1510209291.0]
+    assert not migration.has_blank_lines(str(folder / 'user_PIN_FIXED_4_MRK.csv'))
+
+def test_rerun_changes_nothing(legacy_sessions):
+    rootFolder, folder, legacy = legacy_sessions
+    migration.run_migration(migration.plan_migration(rootFolder, maxWorkers=1), rootFolder, maxWorkers=1)
+    assert migration.plan_migration(rootFolder, maxWorkers=1) == []
+    # Without the manifest the millisecond detection alone still skips every file.
+    os.remove(migration.manifest_path(rootFolder))
+    assert migration.plan_migration(rootFolder, maxWorkers=1) == []
+    np.testing.assert_array_equal(binary_timestamps(folder), expected_seconds(legacy))
+
+def test_interrupted_run_can_be_restarted(legacy_sessions, monkeypatch):
+    rootFolder, folder, legacy = legacy_sessions
+    path = str(folder / 'user_PIN_FIXED_4.keeg')
+    convert = migration.ms_to_sec
+    calls = []
+    def interrupt_second_chunk(timestamps):
+        calls.append(len(timestamps))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return convert(timestamps)
+    monkeypatch.setattr(migration, 'ms_to_sec', interrupt_second_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        migration.migrate_binary(path, chunkSize=ROWS // 4)
+    monkeypatch.setattr(migration, 'ms_to_sec', convert)
+    np.testing.assert_array_equal(binary_timestamps(folder), legacy)
+    assert path in [planned for planned, action, size in migration.plan_migration(rootFolder, maxWorkers=1)]
+    migration.run_migration(migration.plan_migration(rootFolder, maxWorkers=1), rootFolder, maxWorkers=1)
+    np.testing.assert_array_equal(binary_timestamps(folder), expected_seconds(legacy))
+
+def test_restored_legacy_file_is_migrated_again(legacy_sessions):
+    rootFolder, folder, legacy = legacy_sessions
+    eegFile = folder / 'user_PIN_FIXED_4_EEG.csv'
+    backup = eegFile.read_bytes()
+    migration.run_migration(migration.plan_migration(rootFolder, maxWorkers=1), rootFolder, maxWorkers=1)
+    eegFile.write_bytes(backup)
+    os.utime(eegFile, ns=(0, 0))
+    assert [planned for planned, action, size in migration.plan_migration(rootFolder, maxWorkers=1)] == [str(eegFile)]
+    migration.run_migration(migration.plan_migration(rootFolder, maxWorkers=1), rootFolder, maxWorkers=1)
+    csv = pd.read_csv(eegFile, float_precision='round_trip')
+    np.testing.assert_array_equal(csv['timestamp'].to_numpy(), expected_seconds(legacy))
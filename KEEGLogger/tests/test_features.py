@@ -0,0 +1,34 @@
+import os
+import numpy as np
+import helpers
+import features
+from time import time
+from session_writer import SessionWriter
+from password_types import PasswordTypes
+
+def record_session(rootFolder):
+    startTime = time() - 60.0
+    timestamps = startTime + np.arange(256 * 20) / 256.
+    writer = SessionWriter('user', PasswordTypes.PIN_FIXED_4, ['TP9', 'AF7', 'AF8', 'TP10'], startTime, rootFolder, ('binary',), log=False)
+    writer.write_eeg(np.random.default_rng(0).normal(size=(len(timestamps), 4)).astype(np.float32), timestamps)
+    for index, timestamp in enumerate(timestamps[256:-256:256]):
+        writer.write_marker(timestamp, str(index % 10))
+    writer.close(timestamps[-1])
+
+def test_feature_cache_lives_in_the_session_root(tmp_path, monkeypatch):
+    rootFolder = str(tmp_path / 'data')
+    record_session(rootFolder)
+    sessions = helpers.find_user_sessions('user', PasswordTypes.PIN_FIXED_4, rootFolder)
+    monkeypatch.chdir(tmp_path)
+    first = features.featurize_sessions(sessions, rootFolder=rootFolder)
+    cacheFolder = os.path.join(rootFolder, features.Constants.FEATURE_CACHE_FOLDER)
+    assert len(os.listdir(cacheFolder)) == 1
+    assert not os.path.exists(tmp_path / features.Constants.FEATURE_CACHE_FOLDER)
+    # From another working directory the cache is still found.
+    otherFolder = tmp_path / 'elsewhere'
+    otherFolder.mkdir()
+    monkeypatch.chdir(otherFolder)
+    monkeypatch.setattr(features.session_query, 'load_epoch_windows', None) # Fails if the session is featurized again.
+    second = features.featurize_sessions(sessions, rootFolder=rootFolder)
+    np.testing.assert_array_equal(first['features'], second['features'])
+    assert len(second['keys']) == 18
@@ -0,0 +1,23 @@
+import pytest
+from password_generator import generate_passwords, key_counts
+from password_types import PasswordTypes
+
+@pytest.mark.parametrize('mode', list(PasswordTypes))
+@pytest.mark.parametrize('iterations', [1, 7, 50, 1000])
+@pytest.mark.parametrize('balanceBigrams', [True, False])
+def test_key_counts_differ_by_at_most_one(mode, iterations, balanceBigrams):
+    passwords = generate_passwords(mode, iterations, seed=1, balanceBigrams=balanceBigrams)
+    assert len(passwords) == iterations
+    assert all(len(password) == mode.length() and set(password) <= set(mode.characters()) for password in passwords)
+    unigrams, bigrams = key_counts(passwords, mode)
+    assert unigrams.max() - unigrams.min() <= 1
+
+def test_same_seed_same_passwords():
+    assert generate_passwords(PasswordTypes.MIXED_FIXED_8, 50, seed=3) == generate_passwords(PasswordTypes.MIXED_FIXED_8, 50, seed=3)
+    assert generate_passwords(PasswordTypes.MIXED_FIXED_8, 50, seed=3) != generate_passwords(PasswordTypes.MIXED_FIXED_8, 50, seed=4)
+
+def test_balanced_bigrams_are_more_even():
+    mode = PasswordTypes.MIXED_FIXED_8
+    balanced = key_counts(generate_passwords(mode, 1000, seed=1), mode)[1]
+    plain = key_counts(generate_passwords(mode, 1000, seed=1, balanceBigrams=False), mode)[1]
+    assert balanced.std() < plain.std()
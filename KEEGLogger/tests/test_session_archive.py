@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import helpers
+import session_archive
+from binary_session import make_header, write_binary_session
+from password_types import PasswordTypes
+
+SESSION_NAME = 'user_PIN_FIXED_4_2017-11-09-01-34-50_2017-11-09-01-35-00'
+
+def make_session(rows = 5000):
+    random = np.random.default_rng(0)
+    timestamps = 1510209290.0 + np.arange(rows) / 256.
+    samples = random.normal(size=(rows, 4)).astype(np.float32)
+    return timestamps, samples, timestamps[::500], [str(index % 10) for index in range(len(timestamps[::500]))]
+
+@pytest.fixture
+def binary_session(tmp_path):
+    fileBase = str(tmp_path / SESSION_NAME)
+    timestamps, samples, mrkTimestamps, mrkMarkers = make_session()
+    header = make_header('user', PasswordTypes.PIN_FIXED_4, ['TP9', 'AF7', 'AF8', 'TP10'], timestamps[0], timestamps[-1])
+    write_binary_session(fileBase + '.keeg', header, samples, timestamps, mrkTimestamps, mrkMarkers)
+    return fileBase
+
+def test_archive_round_trip_removes_sources(binary_session):
+    expectedMrk, expectedEEG = helpers.load_session(binary_session + '.keeg')
+    path = session_archive.archive_session(binary_session, removeSources=True)[0]
+    assert not os.path.exists(binary_session + '.keeg')
+    dfMrk, dfEEG = session_archive.load_archive_session(path)
+    pd.testing.assert_frame_equal(dfEEG, expectedEEG)
+    pd.testing.assert_frame_equal(dfMrk, expectedMrk)
+
+def test_csv_archive_round_trip_removes_sources(binary_session):
+    session_archive.unarchive_session(session_archive.archive_session(binary_session, removeSources=True)[0], formats=('csv',), removeArchive=True)
+    expectedMrk, expectedEEG = helpers.load_session(binary_session + '_MRK.csv')
+    path = session_archive.archive_session(binary_session, removeSources=True)[0]
+    assert not os.path.exists(binary_session + '_EEG.csv') and not os.path.exists(binary_session + '_MRK.csv')
+    dfMrk, dfEEG = session_archive.load_archive_session(path)
+    np.testing.assert_array_equal(dfEEG['timestamp'].to_numpy(), expectedEEG['timestamp'].to_numpy())
+    np.testing.assert_array_equal(dfEEG.iloc[:, 1:].to_numpy(), expectedEEG.iloc[:, 1:].to_numpy(dtype=np.float32))
+    assert dfMrk['key marker'].tolist() == expectedMrk['key marker'].astype(str).tolist()
+
+def test_verify_detects_different_data(binary_session):
+    timestamps, samples, mrkTimestamps, mrkMarkers = make_session()
+    path = session_archive.archive_session(binary_session)[0]
+    assert session_archive.verify_archive(path, samples, timestamps, mrkTimestamps, mrkMarkers)
+    samples[4321, 2] += 1e-3
+    assert not session_archive.verify_archive(path, samples, timestamps, mrkTimestamps, mrkMarkers)
+    assert not session_archive.verify_archive(path, samples[:-1], timestamps[:-1], mrkTimestamps, mrkMarkers)
+    assert not session_archive.verify_archive(path, make_session()[1], timestamps, mrkTimestamps, mrkMarkers[::-1])
+
+def test_corrupt_archive_keeps_sources(binary_session, monkeypatch):
+    write_archive = session_archive.write_archive
+    def write_corrupt_archive(path, *args, **kwargs):
+        write_archive(path, *args, **kwargs)
+        reader = session_archive.ArchiveReader(path)
+        offset = reader.blockOffsets[2] + reader.blockSizes[2] // 2
+        reader.close()
+        with open(path, 'r+b') as file:
+            file.seek(offset)
+            data = file.read(1)
+            file.seek(offset)
+            file.write(bytes([data[0] ^ 0xFF]))
+    monkeypatch.setattr(session_archive, 'write_archive', write_corrupt_archive)
+    with pytest.raises(Exception):
+        session_archive.archive_session(binary_session, removeSources=True)
+    assert os.path.isdir(binary_session + '.keeg')
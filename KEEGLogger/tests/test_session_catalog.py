@@ -0,0 +1,42 @@
+import numpy as np
+import helpers
+import session_archive
+from time import time
+from session_catalog import SessionCatalog
+from session_writer import SessionWriter
+from password_types import PasswordTypes
+
+# A CSV session as saved by collect -f csv, catalogued under its exact (fractional) start time.
+def record_csv_session(rootFolder):
+    startTime = time() - 60.25
+    writer = SessionWriter('user', PasswordTypes.PIN_FIXED_4, ['TP9', 'AF7'], startTime, rootFolder, ('csv',))
+    writer.write_eeg(np.ones((512, 2), dtype=np.float32), startTime + np.arange(512) / 256.)
+    writer.write_marker(startTime + 1.0, '5')
+    files = writer.close(startTime + 2.0)
+    return files[0][:-len('_EEG.csv')]
+
+def test_reindexing_a_session_updates_its_entry(tmp_path):
+    rootFolder = str(tmp_path)
+    fileBase = record_csv_session(rootFolder)
+    catalog = SessionCatalog(rootFolder)
+    assert len(catalog.find_sessions()) == 1
+    catalog.index_session(fileBase)
+    assert len(catalog.find_sessions()) == 1
+    session_archive.archive_session(fileBase)
+    catalog.index_session(fileBase)
+    sessions = catalog.find_sessions()
+    catalog.close()
+    assert len(sessions) == 1
+    assert sessions[0]['archiveFile'] is not None and sessions[0]['mrkFile'] is not None
+    dfMrk, dfEEG = helpers.load_sessions(sessions)
+    assert len(dfEEG) == 512 and dfMrk['key marker'].tolist() == ['5']
+
+def test_reindexing_after_removing_files_drops_them(tmp_path):
+    rootFolder = str(tmp_path)
+    fileBase = record_csv_session(rootFolder)
+    session_archive.archive_session(fileBase, removeSources=True)
+    catalog = SessionCatalog(rootFolder)
+    catalog.index_session(fileBase)
+    sessions = catalog.find_sessions()
+    catalog.close()
+    assert len(sessions) == 1 and sessions[0]['mrkFile'] is None and sessions[0]['archiveFile'] is not None
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+import helpers
+import session_query
+from time import time
+from session_writer import SessionWriter, find_orphaned_logs, recover_session
+from password_types import PasswordTypes
+from constants import Constants
+
+# Writes a session the way a crash leaves it: part files plus a write-ahead log, never closed.
+def crash_session(rootFolder, startTime, timestamps):
+    writer = SessionWriter('user', PasswordTypes.PIN_FIXED_4, ['TP9', 'AF7'], startTime, rootFolder)
+    writer.write_eeg(np.ones((len(timestamps), 2), dtype=np.float32), timestamps)
+    writer.write_marker(timestamps[len(timestamps) // 2], '5', 0.001)
+    writer.queue.put(None)
+    writer.thread.join()
+    writer.log.sync()
+    return writer
+
+def test_recover_session_in_local_clock_domain(tmp_path):
+    rootFolder = str(tmp_path)
+    startTime = float(int(time()) - 600)
+    timestamps = 5000.0 + np.arange(2560) / 256. # Seconds since boot (pylsl.local_clock), not Unix time.
+    writer = crash_session(rootFolder, startTime, timestamps)
+    logFile = writer.log.path
+    os.utime(logFile, (startTime + 10, startTime + 10))
+    assert find_orphaned_logs(rootFolder) == [logFile]
+    files = recover_session(logFile)
+    assert not os.path.exists(logFile)
+    assert all(os.path.exists(file) for file in files)
+    sessions = session_query.find_sessions('user', PasswordTypes.PIN_FIXED_4, startTime + 5, startTime + 20, rootFolder)
+    assert len(sessions) == 1 and sessions[0]['finishTime'] == startTime + 10
+    dfMrk, dfEEG = helpers.load_sessions(sessions)
+    np.testing.assert_array_equal(dfEEG['timestamp'].to_numpy(), timestamps)
+    assert dfMrk['key marker'].tolist() == ['5']
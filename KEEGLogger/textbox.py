@@ -11,6 +11,7 @@ class TextBox(object):
         self.render_area = None
         self.blink = True
         self.blink_timer = 0.0
+        self.changed = True
         self.process_kwargs(kwargs)
 
     def process_kwargs(self,kwargs):
@@ -55,6 +56,7 @@ class TextBox(object):
     def update(self):
         new = ''.join(self.buffer)
         if new != self.final:
+            self.changed = True
             self.final = new
             self.rendered = self.font.render(self.final, True, self.font_color)
             self.render_rect = self.rendered.get_rect(x=self.rect.x+2,
@@ -68,6 +70,7 @@ class TextBox(object):
         if pg.time.get_ticks()-self.blink_timer > 200:
             self.blink = not self.blink
             self.blink_timer = pg.time.get_ticks()
+            self.changed = True
 
     def draw(self, surface):
         outline_color = self.active_color if self.active else self.outline_color
@@ -80,3 +83,5 @@ class TextBox(object):
             curse = self.render_area.copy()
             curse.topleft = self.render_rect.topleft
             surface.fill(self.font_color, (curse.right+1, curse.y,2, curse.h))
+        self.changed = False
+        return outline
@@ -0,0 +1,108 @@
+import os
+import json
+import pickle
+import datetime
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+import helpers
+from features import featurize_sessions
+from constants import Constants
+
+# Per-user, per-mode key classifier that is updated incrementally with partial_fit.
+# Stored as "<rootFolder>/<user>/<mode>/model.pkl" with its metadata in "model.json".
+class KeystrokeModel:
+    def __init__(self, user, mode):
+        self.user = user
+        self.mode = mode
+        self.classes = np.array(list(mode.characters()))
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=0)
+        self.metadata = {
+            'user': user,
+            'mode': mode.name,
+            'classes': list(self.classes),
+            'featureParams': {
+                'preSeconds': Constants.EPOCH_PRE_SECONDS,
+                'postSeconds': Constants.EPOCH_POST_SECONDS,
+                'samplingRate': Constants.DEFAULT_SAMPLING_RATE,
+                'bands': [list(band) for band in Constants.EEG_BANDS]
+            },
+            'trainedSessions': [],
+            'eventCount': 0,
+            'created': datetime.datetime.now().isoformat(),
+            'updated': None
+        }
+
+    def is_trained(self):
+        return self.metadata['eventCount'] > 0
+
+    def partial_fit(self, features, keys, epochs = Constants.TRAINING_EPOCHS):
+        known = np.isin(keys, self.classes)
+        features, keys = features[known], keys[known]
+        if len(keys) == 0:
+            return 0
+        self.scaler.partial_fit(features)
+        scaled = self.scaler.transform(features)
+        random = np.random.default_rng(self.metadata['eventCount'])
+        for i in range(epochs):
+            order = random.permutation(len(keys))
+            self.classifier.partial_fit(scaled[order], keys[order], classes=self.classes)
+        self.metadata['eventCount'] += len(keys)
+        self.metadata['updated'] = datetime.datetime.now().isoformat()
+        return len(keys)
+
+    def predict_proba(self, features):
+        return self.classifier.predict_proba(self.scaler.transform(np.atleast_2d(features)))
+
+    def predict(self, features):
+        probabilities = self.predict_proba(features)
+        return self.classifier.classes_[np.argmax(probabilities, axis=1)], probabilities.max(axis=1)
+
+    @staticmethod
+    def folder(user, mode, rootFolder = 'session_data'):
+        return os.path.join(rootFolder, user, mode.name)
+
+    def save(self, rootFolder = 'session_data'):
+        folder = KeystrokeModel.folder(self.user, self.mode, rootFolder)
+        modelFile = os.path.join(folder, Constants.MODEL_FILE_NAME)
+        helpers.ensure_dir(modelFile)
+        with open(modelFile + '.part', 'wb') as file:
+            pickle.dump({'scaler': self.scaler, 'classifier': self.classifier}, file)
+        os.replace(modelFile + '.part', modelFile)
+        with open(os.path.join(folder, Constants.MODEL_METADATA_FILE_NAME), 'w') as file:
+            json.dump(self.metadata, file, indent=2)
+        return modelFile
+
+    @staticmethod
+    def load(user, mode, rootFolder = 'session_data'):
+        folder = KeystrokeModel.folder(user, mode, rootFolder)
+        modelFile = os.path.join(folder, Constants.MODEL_FILE_NAME)
+        if not os.path.isfile(modelFile):
+            return None
+        model = KeystrokeModel(user, mode)
+        with open(modelFile, 'rb') as file:
+            state = pickle.load(file)
+        model.scaler, model.classifier = state['scaler'], state['classifier']
+        with open(os.path.join(folder, Constants.MODEL_METADATA_FILE_NAME)) as file:
+            model.metadata = json.load(file)
+        return model
+
+# Trains the user's model on every session it has not seen yet (or on all sessions if retrain is set) and saves it.
+def train_user(user, mode, rootFolder = 'session_data', retrain = False):
+    model = None if retrain else KeystrokeModel.load(user, mode, rootFolder)
+    if model is None:
+        model = KeystrokeModel(user, mode)
+    sessions = helpers.find_user_sessions(user, mode, rootFolder)
+    newSessions = [session for session in sessions if session['id'] not in model.metadata['trainedSessions']]
+    if len(newSessions) == 0:
+        print('Model is up to date, no new sessions to train on.')
+        return model
+    params = model.metadata['featureParams']
+    data = featurize_sessions(newSessions, params['preSeconds'], params['postSeconds'], params['samplingRate'], bands=[tuple(band) for band in params['bands']],
+                              rootFolder=rootFolder)
+    eventCount = model.partial_fit(data['features'], data['keys'])
+    model.metadata['trainedSessions'] += [session['id'] for session in newSessions]
+    modelFile = model.save(rootFolder)
+    print('Trained on {0} keystrokes from {1} new session(s), {2} keystrokes in total. Saved model to: {3}'.format(eventCount, len(newSessions), model.metadata['eventCount'], modelFile))
+    return model
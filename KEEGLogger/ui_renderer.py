@@ -0,0 +1,80 @@
+import pygame
+from time import perf_counter
+from constants import Constants
+
+# Rendering layer for the session windows: caches fonts and rendered text surfaces, only redraws items whose
+# text changed, pushes just the dirty rects to the display and caps the frame rate (see frame_due).
+class UIRenderer:
+    def __init__(self, screen, background = (255,255,255), frameRate = Constants.UI_FRAME_RATE, maxCachedSurfaces = 256):
+        self.screen = screen
+        self.background = background
+        self.frameRate = frameRate
+        self.maxCachedSurfaces = maxCachedSurfaces
+        self.nextFrameTime = 0
+        self.fonts = {}
+        self.surfaces = {}
+        self.drawn = {} # Item key -> (text, size, color, position, rect) last drawn on screen.
+        self.dirtyRects = []
+        self.full_redraw()
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size, color = (0,0,0)):
+        key = (text, size, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if len(self.surfaces) >= self.maxCachedSurfaces:
+                self.surfaces.clear()
+            surface = self.font(size).render(text, 1, color)
+            self.surfaces[key] = surface
+        return surface
+
+    def text_size(self, text, size):
+        return self.render(text, size).get_size()
+
+    # Draws text at position, does nothing if the same item was already drawn with the same text, color and position.
+    def draw_text(self, key, text, size, position, color = (0,0,0)):
+        previous = self.drawn.get(key)
+        if previous is not None and previous[:4] == (text, size, color, position):
+            return
+        if previous is not None:
+            self.clear_rect(previous[4])
+        rect = self.screen.blit(self.render(text, size, color), position)
+        self.drawn[key] = (text, size, color, position, rect)
+        self.dirtyRects.append(rect)
+
+    def remove(self, key):
+        previous = self.drawn.pop(key, None)
+        if previous is not None:
+            self.clear_rect(previous[4])
+
+    def clear_rect(self, rect):
+        self.screen.fill(self.background, rect)
+        self.dirtyRects.append(rect)
+
+    def mark_dirty(self, rect):
+        self.dirtyRects.append(pygame.Rect(rect))
+
+    # Clears the whole window, used on first draw and whenever the layout changes (e.g. a session state change).
+    def full_redraw(self):
+        self.drawn = {}
+        self.screen.fill(self.background)
+        self.dirtyRects = [self.screen.get_rect()]
+
+    # The session loops poll input faster than they draw, a frame is only drawn when this returns True.
+    def frame_due(self):
+        now = perf_counter()
+        if now < self.nextFrameTime:
+            return False
+        self.nextFrameTime = max(self.nextFrameTime, now - 1.0 / self.frameRate) + 1.0 / self.frameRate
+        return True
+
+    def present(self):
+        if self.dirtyRects:
+            pygame.display.update(self.dirtyRects)
+            self.dirtyRects = []